@@ -1,3 +1,5 @@
+import logging
+
 from django.shortcuts import render
 from rest_framework import status, generics, permissions
 from rest_framework.decorators import api_view, permission_classes
@@ -15,6 +17,8 @@ from .serializers import (
 from datetime import timedelta
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 # Token-based Authentication Views
 class RegisterView(generics.CreateAPIView):
     """User registration endpoint"""
@@ -72,11 +76,9 @@ class LogoutView(APIView):
 class JWTLoginView(TokenObtainPairView):
     """JWT login endpoint with HttpOnly cookie response"""
     def post(self, request, *args, **kwargs):
-        print(request.data)
-
         response = super().post(request, *args, **kwargs)
-        print("Response:", response.data)
-        print("Status Code:", response.status_code)
+        # never the request body or the response: they hold the password and the tokens
+        logger.info("login", extra={"username": request.data.get("username"), "status_code": response.status_code})
         if response.status_code == 200:
             access = response.data.get('access')
             refresh = response.data.get('refresh')
@@ -0,0 +1,37 @@
+import os
+
+bind = "0.0.0.0:8081"
+workers = int(os.environ.get("GUNICORN_WORKERS", 3))
+
+# Warm the embedding models when the application is loaded
+os.environ.setdefault("EMBEDDING_WARMUP_ON_STARTUP", "true")
+
+# With preload_app the Django app (and with it the embedding models) is loaded once in the
+# master and shared copy-on-write by the forked workers. Without it every worker loads its
+# own copy at boot, which is slower to start but keeps torch state out of the master.
+preload_app = os.environ.get("GUNICORN_PRELOAD_APP", "false").lower() == "true"
+
+# Threads per worker. With more than one thread, concurrent semantic searches in a worker
+# can share a batched forward pass (see EMBEDDING_BATCHING in settings.py).
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+
+# Worker class. "sync" (or "gthread" with GUNICORN_THREADS) serves the WSGI app; to serve
+# the async endpoints without blocking a worker per request, run the ASGI app with
+# GUNICORN_APP=movie_recommender.asgi:application GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+
+# Build the autocomplete index in every worker once it has loaded the app, after the fork so
+# that the Elasticsearch connections belong to the worker (see SUGGEST in settings.py)
+os.environ.setdefault("SUGGEST_WARMUP_ON_STARTUP", "true")
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+
+    if settings.SUGGEST["WARMUP_ON_STARTUP"]:
+        from imdb_picker.views import ElasticsearchUtils
+
+        # an unreachable cluster only delays the build to the first request
+        result = ElasticsearchUtils.suggest("a")
+        if isinstance(result, dict):
+            worker.log.warning("Autocomplete index not built at boot: %s", result["error"])
@@ -0,0 +1,239 @@
+import json
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from elasticsearch import helpers
+
+from .index_template import EMBEDDING_FIELD
+from .ranking import FEATURE_SOURCE_FIELDS, candidate_features, get_reranker, stable_seed, top_k
+
+# In-process exact vector index for similar movie lookups. A snapshot of the
+# catalog embeddings (normalized, float16 or float32) is written to disk by the
+# build_vector_snapshot command, one directory per index generation, and
+# memory-mapped by the workers: the pages are shared through the OS page cache
+# instead of being copied in every gunicorn worker. The catalog is small enough
+# for a blocked brute-force matrix-vector product, which is exact and needs no
+# graph to build or tune.
+
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.json"
+META_FILE = "meta.json"
+NEIGHBOURS_FILE = "neighbours.npy"
+# per movie features used to rank the candidates (see ranking.candidate_features), NaN when missing
+FEATURE_FIELDS = ["imdb_rating", "vote_average", "popularity", "release_year"]
+
+
+def snapshot_dir(generation, root=None):
+    """Directory of the snapshot of an index generation (see ElasticsearchUtils.index_generation)."""
+    root = root or settings.VECTOR_SNAPSHOT["PATH"]
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_.@-]+", "_", generation))
+
+
+def build_vector_snapshot(es, index, generation, root=None, dtype="float16"):
+    """
+    Write the snapshot of ``index`` (an alias or an index) for ``generation``.
+    The files are written to a temporary directory renamed at the end, so
+    workers never load a partial snapshot.
+    Returns:
+        str: The snapshot directory.
+    """
+    ids = []
+    vectors = []
+    sources = []
+    documents = helpers.scan(es, index=index, size=1000, query={
+        "_source": [EMBEDDING_FIELD, *FEATURE_SOURCE_FIELDS],
+        "query": {"exists": {"field": EMBEDDING_FIELD}},
+    })
+    for document in documents:
+        ids.append(document["_id"])
+        vectors.append(document["_source"].pop(EMBEDDING_FIELD))
+        sources.append(document["_source"])
+    features = candidate_features(sources)
+    if not ids:
+        raise ValueError(f"No embeddings in '{index}'")
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+    path = snapshot_dir(generation, root)
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, VECTORS_FILE), matrix.astype(dtype))
+    for field, values in features.items():
+        np.save(os.path.join(tmp_path, f"{field}.npy"), np.asarray(values, dtype=np.float32))
+    with open(os.path.join(tmp_path, IDS_FILE), "w") as f:
+        json.dump(ids, f)
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump({"index": index, "generation": generation, "count": len(ids),
+                   "dims": matrix.shape[1], "dtype": dtype}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    return path
+
+
+class VectorIndex:
+    """
+    Memory-mapped snapshot of the catalog embeddings with exact top-k search.
+    """
+    # rows scored per matrix-vector product, bounds the float32 copy of float16 blocks
+    block_size = 16384
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, IDS_FILE)) as f:
+            self.ids = json.load(f)
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.features = {}
+        for field in FEATURE_FIELDS:
+            feature_path = os.path.join(path, f"{field}.npy")
+            # snapshots written before a feature was added rank without it
+            self.features[field] = (
+                np.load(feature_path, mmap_mode="r") if os.path.exists(feature_path)
+                else np.full(len(self.ids), np.nan, dtype=np.float32)
+            )
+        self.neighbours = None
+
+    def neighbour_table(self):
+        """
+        The precomputed similar movies (compute_neighbours command): one row of
+        snapshot rows per movie, best first, padded with -1. None until computed.
+        """
+        if self.neighbours is None:
+            path = os.path.join(self.path, NEIGHBOURS_FILE)
+            if os.path.exists(path):
+                self.neighbours = np.load(path, mmap_mode="r")
+        return self.neighbours
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vector(self, doc_id):
+        """Return the normalized float32 vector of a document, None if it is not in the snapshot."""
+        row = self.rows.get(doc_id)
+        return None if row is None else np.asarray(self.vectors[row], dtype=np.float32)
+
+    def similarities(self, queries):
+        """
+        Cosine similarity of every movie to every query.
+        Args:
+            queries (np.ndarray): (dims,) or (n, dims) normalized float32 vectors.
+        Returns:
+            np.ndarray: (movies,) or (movies, n) similarities.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        blocks = [
+            np.asarray(self.vectors[start:start + self.block_size], dtype=np.float32) @ queries.T
+            for start in range(0, len(self.ids), self.block_size)
+        ]
+        return np.concatenate(blocks)
+
+    def search(self, query, k, exclude=None):
+        """
+        Exact top-k search.
+        Args:
+            query (np.ndarray): A normalized vector.
+            k (int): Number of results.
+            exclude (str): Document id left out of the results (the movie itself).
+        Returns:
+            tuple: (rows, similarities) of the best matches, best first.
+        """
+        scores = self.similarities(query)
+        if exclude is not None and exclude in self.rows:
+            scores[self.rows[exclude]] = -np.inf
+        rows = top_k(scores, k)
+        return rows, scores[rows]
+
+    def candidates(self, doc_id, rows, similarities, reranker):
+        """The candidates of ``doc_id`` at snapshot ``rows``, for Reranker.rank."""
+        candidates = {field: np.asarray(self.features[field][rows]) for field in FEATURE_FIELDS}
+        candidates.update(similarity=similarities, seed=stable_seed(doc_id))
+        if reranker.needs_vectors:
+            candidates["vectors"] = np.asarray(self.vectors[rows], dtype=np.float32)
+        return candidates
+
+    def similar(self, doc_id, candidates=None, size=None, reranker=None):
+        """
+        Similar movies of a movie of the snapshot: the ``candidates`` nearest
+        movies ranked by the reranker (see ranking.get_reranker).
+        Returns:
+            list: The ids of the ``size`` best movies, None if ``doc_id`` is not in the snapshot.
+        """
+        candidates = candidates or settings.SIMILAR_MOVIES_RANKING["CANDIDATES"]
+        size = size or settings.SIMILAR_MOVIES_RANKING["SIZE"]
+        row = self.rows.get(doc_id)
+        if row is None:
+            return None
+        neighbours = self.neighbour_table()
+        if neighbours is not None and neighbours.shape[1] >= size:
+            return [self.ids[neighbour] for neighbour in neighbours[row][:size] if neighbour >= 0]
+        reranker = reranker or get_reranker()
+        rows, similarities = self.search(self.vector(doc_id), candidates, exclude=doc_id)
+        best = reranker.rank(self.candidates(doc_id, rows, similarities, reranker), size)
+        return [self.ids[row] for row in rows[best]]
+
+    def compute_neighbours(self, k=10, candidates=100, block_size=256, workers=None, reranker=None):
+        """
+        Compute the similar movies of every movie of the snapshot and save them
+        next to it (NEIGHBOURS_FILE). Blocks of movies are scored against the
+        whole catalog with one matrix multiply each, on ``workers`` threads (the
+        multiplies release the GIL), then their nearest ``candidates`` are
+        ranked like VectorIndex.similar.
+        Returns:
+            np.ndarray: (movies, k) int32 snapshot rows, -1 padded.
+        """
+        reranker = reranker or get_reranker()
+        vectors = np.asarray(self.vectors, dtype=np.float32)
+        table = np.full((len(self.ids), k), -1, dtype=np.int32)
+
+        def compute_block(start):
+            similarities = vectors[start:start + block_size] @ vectors.T
+            for offset, row_similarities in enumerate(similarities):
+                row = start + offset
+                row_similarities[row] = -np.inf
+                rows = top_k(row_similarities, candidates)
+                ranked = reranker.rank(self.candidates(self.ids[row], rows, row_similarities[rows], reranker), k)
+                best = rows[ranked]
+                table[row, :len(best)] = best
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            list(pool.map(compute_block, range(0, len(self.ids), block_size)))
+
+        tmp_path = os.path.join(self.path, NEIGHBOURS_FILE + ".tmp.npy")
+        np.save(tmp_path, table)
+        os.replace(tmp_path, os.path.join(self.path, NEIGHBOURS_FILE))
+        self.neighbours = None
+        return table
+
+
+_vector_indexes = {}
+_vector_indexes_lock = threading.Lock()
+
+
+def get_vector_index(generation):
+    """
+    Return the VectorIndex of an index generation in this process, or None if
+    the snapshots are disabled or there is no snapshot of that generation (the
+    callers then use the Elasticsearch kNN query).
+    """
+    if not settings.VECTOR_SNAPSHOT["ENABLED"] or generation is None:
+        return None
+    vector_index = _vector_indexes.get(generation)
+    if vector_index is not None:
+        return vector_index
+    path = snapshot_dir(generation)
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        return None
+    with _vector_indexes_lock:
+        if generation not in _vector_indexes:
+            # one generation at a time: drop the snapshots of previous generations
+            _vector_indexes.clear()
+            _vector_indexes[generation] = VectorIndex(path)
+    return _vector_indexes[generation]
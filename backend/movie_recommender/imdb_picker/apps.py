@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ImdbPickerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'imdb_picker'
+
+    def ready(self):
+        # Load the embedding models once at startup. Under gunicorn with
+        # preload_app this happens in the master, before the workers fork.
+        if settings.EMBEDDING_WARMUP_ON_STARTUP:
+            from .embeddings import EmbeddingModelRegistry
+            EmbeddingModelRegistry.warm_up()
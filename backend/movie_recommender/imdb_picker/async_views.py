@@ -0,0 +1,107 @@
+from django.views.decorators.http import require_GET
+from rest_framework import status
+
+from .facets import search_filters
+from .fusion import hybrid_search_options
+from .renderers import render_response
+from .serializers import compact_movie_serializer
+from .utils import AsyncElasticsearchUtils, GeneralUtils, StageTimer
+from .views import INDEX_NAME, project_movie_info, projection, semantic_search_params
+
+# Async (ASGI) versions of the read-only MovieViewSet endpoints. DRF views are
+# sync only, so these are plain Django async views returning the same payloads.
+# Served under /imdb/async/movies/..., they only pay off behind an ASGI server
+# (gunicorn with uvicorn workers, see gunicorn.conf.py).
+
+AsyncElasticsearchUtils = AsyncElasticsearchUtils(index_name=INDEX_NAME)
+
+
+@require_GET
+async def movie_full_text_search(request):
+    query = request.GET.get('q', '')
+    try:
+        fields, output_fields = projection(request.GET)
+    except ValueError as e:
+        return render_response(request, {'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    results = []
+    if query:
+        results = await AsyncElasticsearchUtils.full_text_search(query, **output_fields)
+    return render_response(request, {'results': compact_movie_serializer.many(results, fields)}, status=status.HTTP_200_OK)
+
+
+@require_GET
+async def movie_semantic_search(request):
+    query = request.GET.get('q', '')
+    try:
+        filters, k, num_candidates = semantic_search_params(request.GET)
+        fields, output_fields = projection(request.GET)
+    except ValueError as e:
+        return render_response(request, {'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    results = []
+    if query:
+        results = await AsyncElasticsearchUtils.semantic_search(query, k=k, num_candidates=num_candidates, filters=filters, **output_fields)
+    if fields and isinstance(results, list):
+        results = compact_movie_serializer.many(results, fields)
+    return render_response(request, {'results': results}, status=status.HTTP_200_OK)
+
+
+@require_GET
+async def movie_hybrid_search(request):
+    query = request.GET.get('q', '')
+    if not query:
+        return render_response(request, {'results': [], 'mode': 'hybrid'}, status=status.HTTP_200_OK)
+    try:
+        options = hybrid_search_options(request.GET)
+        fields, output_fields = projection(request.GET)
+    except ValueError as e:
+        return render_response(request, {'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    timer = StageTimer("hybrid_search")
+    result = await AsyncElasticsearchUtils.hybrid_search(query, options, timer=timer, **output_fields)
+    if 'error' in result:
+        return render_response(request, result, status=status.HTTP_200_OK)
+    response = render_response(request, {'results': compact_movie_serializer.many(result['results'], fields), 'mode': result['mode']}, status=status.HTTP_200_OK)
+    response['Server-Timing'] = timer.server_timing()
+    return response
+
+
+@require_GET
+async def movie_info(request):
+    poster_path = request.GET.get('q', '')
+    if not poster_path:
+        return render_response(request, {'error': 'Query parameter "q" is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        fields, output_fields = projection(request.GET)
+        filters = search_filters(request.GET)
+    except ValueError as e:
+        return render_response(request, {'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    timer = StageTimer("movie_info")
+    detailed_movie_data = await AsyncElasticsearchUtils.movie_info(
+        poster_path=poster_path, timer=timer, fields=output_fields.get('output_fields'), filters=filters
+    )
+    response = render_response(request, project_movie_info(detailed_movie_data, fields), status=status.HTTP_200_OK)
+    response['Server-Timing'] = timer.server_timing()
+    return response
+
+
+@require_GET
+async def list_movies(request):
+    page = int(request.GET.get('page', 1))
+    alphabet = request.GET.get('alphabet', 'A')
+    movies_per_page = int(request.GET.get('movies_per_page', 10))
+    result = await AsyncElasticsearchUtils.list_movies_by_alphabet(
+        alphabet=alphabet,
+        page=page,
+        movies_per_page=movies_per_page
+    )
+    if isinstance(result, dict):
+        # api_error_handler turned an error into a payload
+        return render_response(request, result, status=status.HTTP_200_OK)
+    movies, total_movies = result
+    total_pages = GeneralUtils.calculate_total_pages(total_movies, movies_per_page)
+    response_data = {
+        'movies': movies,
+        'total_movies': total_movies,
+        'total_pages': total_pages,
+        'current_page': page
+    }
+    return render_response(request, response_data, status=status.HTTP_200_OK)
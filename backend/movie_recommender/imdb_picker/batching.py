@@ -0,0 +1,204 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+
+from .embeddings import EmbeddingModelRegistry
+from .metrics import EMBEDDING_BATCH_SIZE, EMBEDDING_QUEUE_DEPTH, EMBEDDING_QUEUE_WAIT
+
+
+class EmbeddingQueueFull(Exception):
+    """Raised when the embedding queue is full and the request is rejected (backpressure)."""
+
+
+class EmbeddingBatcher:
+    """
+    Collects texts submitted by concurrent requests and encodes them in one
+    batched forward pass. A batch is sent to the model as soon as it holds
+    ``max_batch_size`` texts or the oldest text has waited ``max_wait`` seconds.
+    """
+    def __init__(self, encode_batch, max_batch_size=32, max_wait=0.005, max_queue_size=256, timeout=2.0, name="default"):
+        """
+        Args:
+            encode_batch (callable): Encodes a list of texts, returning one vector per text.
+            max_batch_size (int): Maximum number of texts per forward pass.
+            max_wait (float): Seconds to wait for more texts before running a partial batch.
+            max_queue_size (int): Number of queued texts above which new requests are rejected.
+            timeout (float): Latency cap in seconds for a single request, queueing included.
+            name (str): Label used in the metrics.
+        """
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue_size = max_queue_size
+        self.timeout = timeout
+        self.name = name
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # threads do not survive a fork, so each gunicorn worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                thread = threading.Thread(target=self._run, name=f"embedding-batcher-{self.name}", daemon=True)
+                thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, text):
+        """
+        Queue ``text`` for encoding.
+        Returns:
+            Future: Resolves to the embedding of ``text`` as a list of floats.
+        """
+        self._ensure_worker()
+        future = Future()
+        deadline = time.monotonic() + self.timeout
+        try:
+            self._queue.put_nowait((text, future, deadline, time.monotonic()))
+        except queue.Full:
+            raise EmbeddingQueueFull(f"Embedding queue '{self.name}' is full")
+        EMBEDDING_QUEUE_DEPTH.labels(self.name).set(self._queue.qsize())
+        return future
+
+    def encode(self, text):
+        """Encode ``text`` through the batcher and wait for the result, at most ``timeout`` seconds."""
+        future = self.submit(text)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Embedding took longer than {self.timeout}s")
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        flush_at = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = flush_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            EMBEDDING_QUEUE_DEPTH.labels(self.name).set(self._queue.qsize())
+            now = time.monotonic()
+            # skip requests whose caller already gave up
+            pending = [
+                item for item in batch
+                if item[2] > now and item[1].set_running_or_notify_cancel()
+            ]
+            if not pending:
+                continue
+            for _, _, _, queued_at in pending:
+                EMBEDDING_QUEUE_WAIT.labels(self.name).observe(now - queued_at)
+            EMBEDDING_BATCH_SIZE.labels(self.name).observe(len(pending))
+            try:
+                vectors = self.encode_batch([item[0] for item in pending])
+            except Exception as e:
+                for _, future, _, _ in pending:
+                    future.set_exception(e)
+                continue
+            for (_, future, _, _), vector in zip(pending, vectors):
+                future.set_result(vector)
+
+
+class BackgroundEmbedder:
+    """
+    Runs embeddings on a thread pool for callers that only wait for them up to
+    a budget: an abandoned embedding still finishes and fills the cache. At most
+    ``max_pending`` embeddings are queued or running, above that new keys are
+    rejected (EmbeddingQueueFull) instead of piling up behind a slow model, and
+    callers asking for a key already in flight share its future.
+    """
+    def __init__(self, encode, max_workers=4, max_pending=32, name="default"):
+        """
+        Args:
+            encode (callable): Called with the ``submit`` arguments in a pool thread.
+            max_workers (int): Threads of the pool.
+            max_pending (int): Embeddings queued or running above which new keys are rejected.
+            name (str): Label used in the thread names.
+        """
+        self.encode = encode
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.name = name
+        self.executor = None
+        self.pending = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_executor(self):
+        # threads do not survive a fork, so each gunicorn worker starts its own
+        # pool (and forgets the embeddings in flight in the parent). Called with self._lock held.
+        if self._pid != os.getpid():
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"embedding-{self.name}")
+            self.pending = {}
+            self._pid = os.getpid()
+
+    def submit(self, key, *args):
+        """
+        Embed in the background, or join the embedding of ``key`` in flight.
+        Returns:
+            Future: Resolves to the result of ``encode(*args)``.
+        Raises:
+            EmbeddingQueueFull: ``max_pending`` embeddings are already in flight.
+        """
+        with self._lock:
+            self._ensure_executor()
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            if len(self.pending) >= self.max_pending:
+                raise EmbeddingQueueFull(f"{len(self.pending)} '{self.name}' embeddings in flight")
+            future = self.executor.submit(self.encode, *args)
+            self.pending[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_embedding_batcher(model_key=None):
+    """
+    Return the process-wide EmbeddingBatcher of a model, configured by settings.EMBEDDING_BATCHING.
+    """
+    model_key = model_key or "default"
+    batcher = _batchers.get(model_key)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.get(model_key)
+            if batcher is None:
+                config = settings.EMBEDDING_BATCHING
+
+                def encode_batch(texts):
+                    model = EmbeddingModelRegistry.get(model_key)
+                    return model.encode(texts, batch_size=len(texts)).tolist()
+
+                batcher = EmbeddingBatcher(
+                    encode_batch,
+                    max_batch_size=config["MAX_BATCH_SIZE"],
+                    max_wait=config["MAX_WAIT_MS"] / 1000,
+                    max_queue_size=config["MAX_QUEUE_SIZE"],
+                    timeout=config["TIMEOUT_MS"] / 1000,
+                    name=model_key,
+                )
+                _batchers[model_key] = batcher
+    return batcher
@@ -0,0 +1,724 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+
+# Benchmark scenarios run by `manage.py benchmark <scenario> --param key=value ...`.
+# A scenario is a function taking the parsed params and a write(line) callable.
+
+SCENARIOS = {}
+
+
+def scenario(name, help=""):
+    """Register a benchmark scenario under ``name``."""
+    def register(func):
+        func.help = help
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def percentile(sorted_values, q):
+    """Return the ``q`` percentile (0-100) of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed=None):
+    """
+    Summarize a list of latencies in seconds.
+    Args:
+        latencies (list): One latency per call.
+        elapsed (float): Wall clock time of the whole run, for the throughput.
+    Returns:
+        dict: count, rps, mean/p50/p95/p99 latencies in milliseconds.
+    """
+    values = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(values)
+    return {
+        "count": len(values),
+        "rps": len(values) / elapsed if elapsed else 0.0,
+        "mean_ms": 1000 * sum(values) / len(values) if values else 0.0,
+        "p50_ms": 1000 * percentile(values, 50),
+        "p95_ms": 1000 * percentile(values, 95),
+        "p99_ms": 1000 * percentile(values, 99),
+    }
+
+
+def format_summary(label, summary, **extra):
+    line = (
+        f"{label:<32} n={summary['count']:<7} rps={summary['rps']:>10.1f} "
+        f"mean={summary['mean_ms']:>9.3f}ms p50={summary['p50_ms']:>9.3f}ms "
+        f"p95={summary['p95_ms']:>9.3f}ms p99={summary['p99_ms']:>9.3f}ms"
+    )
+    return line + "".join(f" {key}={value}" for key, value in extra.items())
+
+
+def time_calls(func, repeat, warmup=1):
+    """
+    Call ``func`` ``warmup`` + ``repeat`` times and time the last ``repeat`` calls.
+    Returns:
+        tuple: (list of latencies in seconds, total elapsed seconds)
+    """
+    for _ in range(warmup):
+        func()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    return latencies, time.perf_counter() - started
+
+
+def parse_targets(value):
+    """Parse ``label=url,label=url`` into a list of (label, url)."""
+    targets = []
+    for item in value.split(","):
+        label, _, url = item.partition("=")
+        targets.append((label, url) if url else (label, label))
+    return targets
+
+
+@scenario("http", help=(
+    "Load test running HTTP endpoints, e.g. the WSGI deployment against the ASGI one. "
+    "Params: targets=wsgi=http://host:8081,asgi=http://host:8082 "
+    "path=/imdb/movies/full_text_search/?q=batman concurrency=64 requests=2000"
+))
+def http_load(params, write):
+    import aiohttp
+
+    targets = parse_targets(params.get("targets", "wsgi=http://localhost:8081"))
+    path = params.get("path", "/imdb/movies/full_text_search/?q=batman")
+    concurrency = int(params.get("concurrency", 64))
+    total = int(params.get("requests", 2000))
+
+    async def run(base_url):
+        latencies = []
+        errors = 0
+        remaining = iter(range(total))
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async def client():
+                nonlocal errors
+                for _ in remaining:
+                    started = time.perf_counter()
+                    try:
+                        async with session.get(base_url + path) as response:
+                            await response.read()
+                            if response.status >= 400:
+                                errors += 1
+                    except aiohttp.ClientError:
+                        errors += 1
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+            return latencies, time.perf_counter() - started, errors
+
+    for label, base_url in targets:
+        latencies, elapsed, errors = asyncio.run(run(base_url))
+        write(format_summary(label, summarize(latencies, elapsed), errors=errors, concurrency=concurrency))
+
+
+def sample_poster_paths(utils, count):
+    """Return ``count`` poster paths of the index (repeated if the index is smaller)."""
+    response = utils.es.search(index=utils.index_name, body={
+        "size": min(count, 10000),
+        "_source": ["poster_path"],
+        "query": {"exists": {"field": "poster_path"}},
+    })
+    paths = [hit["_source"]["poster_path"] for hit in response["hits"]["hits"]]
+    if not paths:
+        raise RuntimeError(f"No documents with a poster_path in '{utils.index_name}'")
+    return (paths * (count // len(paths) + 1))[:count]
+
+
+@scenario("watchlist", help=(
+    "Watchlist hydration with one search per entry against one _msearch, on a live index. "
+    "Params: index=movies sizes=10,100,1000 repeat=5"
+))
+def watchlist_hydration(params, write):
+    from .utils import ElasticsearchUtils, MovieQueries
+    from .views import INDEX_NAME
+
+    utils = ElasticsearchUtils(index_name=params.get("index", INDEX_NAME))
+    sizes = [int(size) for size in params.get("sizes", "10,100,1000").split(",")]
+    repeat = int(params.get("repeat", 5))
+    poster_paths = sample_poster_paths(utils, max(sizes))
+    output_fields = ["title", "description", "genres", "actors", "directors", "poster_path"]
+
+    for size in sizes:
+        entries = poster_paths[:size]
+
+        def search_per_entry():
+            for movie in entries:
+                utils.es.search(index=utils.index_name, body=MovieQueries.watchlist_entry(movie, output_fields))
+
+        def msearch():
+            result = utils.get_watchlist(entries)
+            if isinstance(result, dict):
+                raise RuntimeError(result["error"])
+
+        for label, func in (("search-per-entry", search_per_entry), ("msearch", msearch)):
+            latencies, elapsed = time_calls(func, repeat)
+            write(format_summary(f"{label} n={size}", summarize(latencies, elapsed)))
+
+
+class LocalBulkServer:
+    """
+    Local stand-in for Elasticsearch answering just enough of the API for
+    ingestion benchmarks: _bulk requests are parsed and acknowledged, index
+    existence checks and refreshes succeed. It measures the client side of the
+    pipeline (reading, embedding, serialization, HTTP) without a cluster.
+    """
+    def __init__(self):
+        import http.server
+        import threading
+
+        stats = self.stats = {"requests": 0, "documents": 0}
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, body, status=200):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                self.reply({"version": {"number": "8.13.0"}, "tagline": "You Know, for Search"})
+
+            def do_PUT(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.split("?")[0].endswith("/_bulk"):
+                    self.reply({"acknowledged": True})
+                    return
+                # action and source lines alternate (index operations only)
+                documents = body.count(b"\n") // 2
+                stats["requests"] += 1
+                stats["documents"] += documents
+                item = {"index": {"status": 201, "result": "created"}}
+                self.reply({"took": 0, "errors": False, "items": [item] * documents})
+
+            do_POST = do_PUT
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def write_synthetic_movies(path, rows):
+    """Write ``rows`` synthetic movies as JSON lines."""
+    import random
+
+    words = ("space dark love night war city last time world man girl game house blood lost "
+             "story secret king dream heart river road fire star ghost").split()
+    genres = ["Drama", "Comedy", "Action", "Thriller", "Horror", "Romance", "Animation", "Documentary"]
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(rows):
+            title = " ".join(rng.choice(words) for _ in range(rng.randint(1, 4))).title()
+            f.write(json.dumps({
+                "id": i,
+                "title": title,
+                "overview": " ".join(rng.choice(words) for _ in range(40)),
+                "genres": ", ".join(rng.sample(genres, 2)),
+                "cast": ", ".join(f"Actor {rng.randint(1, 50000)}" for _ in range(4)),
+                "poster_path": f"/synthetic{i}.jpg",
+                "release_date": f"{rng.randint(1920, 2024)}-01-01",
+                "vote_average": round(rng.uniform(1, 10), 1),
+            }) + "\n")
+
+
+@scenario("ingest", help=(
+    "Offline ingestion of a synthetic dump into a local Elasticsearch stand-in (or a real cluster with url=). "
+    "Params: rows=1000000 embed=synthetic|model workers=2 embed_batch_size=512 chunk_size=500 thread_count=4 url="
+))
+def ingest(params, write):
+    import os
+    import tempfile
+
+    from elasticsearch import Elasticsearch
+
+    from .ingestion import embed_texts, ingest_movies, synthetic_embeddings
+
+    rows = int(params.get("rows", 1000000))
+    embed = embed_texts if params.get("embed", "synthetic") == "model" else synthetic_embeddings
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "movies.jsonl")
+        started = time.perf_counter()
+        write_synthetic_movies(source, rows)
+        write(f"wrote {rows} synthetic movies in {time.perf_counter() - started:.1f}s")
+
+        def run(url):
+            es = Elasticsearch(url, request_timeout=60)
+            return ingest_movies(
+                es, source, params.get("index", "movies_ingest_benchmark"),
+                embed=embed,
+                workers=int(params.get("workers", 2)),
+                embed_batch_size=int(params.get("embed_batch_size", 512)),
+                chunk_size=int(params.get("chunk_size", 500)),
+                thread_count=int(params.get("thread_count", 4)),
+                report=lambda progress: write(
+                    f"  rows={progress['rows']} {progress['docs_per_second']:.1f} docs/s"
+                ),
+            )
+
+        if params.get("url"):
+            result = run(params["url"])
+        else:
+            with LocalBulkServer() as server:
+                result = run(server.url)
+            write(f"stand-in received {server.stats['documents']} documents in {server.stats['requests']} bulk requests")
+        write(
+            f"ingest embed={embed.__name__} indexed={result['indexed']} failed={result['failed']} "
+            f"elapsed={result['elapsed']:.1f}s docs/s={result['docs_per_second']:.1f}"
+        )
+
+
+def sample_embeddings(utils, count):
+    """Return up to ``count`` embeddings of the index as a float32 matrix."""
+    from elasticsearch import helpers
+
+    vectors = []
+    for hit in helpers.scan(utils.es, index=utils.index_name, query={"_source": ["embedding"]}, size=1000):
+        if hit["_source"].get("embedding"):
+            vectors.append(hit["_source"]["embedding"])
+        if len(vectors) >= count:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+
+@scenario("vector_index", help=(
+    "Recall@k against exact search and kNN latency for dense_vector index settings, on a live cluster. "
+    "Params: source=movies (index to sample vectors from) or source=synthetic, docs=20000 queries=200 k=10 "
+    "configs=hnsw:16:100,int8_hnsw:16:100,int8_hnsw:32:200 num_candidates=20,50,100,200 similarity=dot_product"
+))
+def vector_index(params, write):
+    from elasticsearch import helpers
+
+    from .index_template import EMBEDDING_DIMS, EMBEDDING_FIELD, vector_mapping
+    from .utils import ElasticsearchUtils
+    from .views import INDEX_NAME
+
+    docs = int(params.get("docs", 20000))
+    query_count = int(params.get("queries", 200))
+    k = int(params.get("k", 10))
+    candidates = [int(value) for value in params.get("num_candidates", "20,50,100,200").split(",")]
+    utils = ElasticsearchUtils(index_name=params.get("source", INDEX_NAME))
+    es = utils.es
+
+    if utils.index_name == "synthetic":
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((docs + query_count, EMBEDDING_DIMS), dtype=np.float32)
+    else:
+        vectors = sample_embeddings(utils, docs + query_count)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    corpus, queries = vectors[:-query_count], vectors[-query_count:]
+    # exact neighbours by brute force: the vectors are normalized, dot product = cosine
+    exact = np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+    write(f"{len(corpus)} documents, {len(queries)} queries from {utils.index_name}")
+
+    for config in params.get("configs", "hnsw:16:100,int8_hnsw:16:100,int8_hnsw:32:200").split(","):
+        index_type, m, ef_construction = config.split(":")
+        index = f"benchmark_vectors_{index_type}_{m}_{ef_construction}"
+        mapping = vector_mapping(
+            INDEX_TYPE=index_type, M=int(m), EF_CONSTRUCTION=int(ef_construction),
+            SIMILARITY=params.get("similarity", "dot_product"),
+        )
+        es.options(ignore_status=404).indices.delete(index=index)
+        es.indices.create(index=index, settings={"number_of_replicas": 0, "refresh_interval": "-1"},
+                          mappings={"properties": {EMBEDDING_FIELD: mapping}})
+        try:
+            started = time.perf_counter()
+            helpers.bulk(es, (
+                {"_index": index, "_id": str(i), "_source": {EMBEDDING_FIELD: vector.tolist()}}
+                for i, vector in enumerate(corpus)
+            ), chunk_size=1000, request_timeout=120)
+            es.indices.refresh(index=index)
+            es.options(request_timeout=3600).indices.forcemerge(index=index, max_num_segments=1)
+            write(f"{config}: built in {time.perf_counter() - started:.1f}s")
+
+            for num_candidates in candidates:
+                latencies = []
+                recalls = []
+                for query, expected in zip(queries, exact):
+                    call_started = time.perf_counter()
+                    response = es.search(index=index, knn={
+                        "field": EMBEDDING_FIELD, "query_vector": query.tolist(),
+                        "k": k, "num_candidates": max(k, num_candidates),
+                    }, source=False, size=k)
+                    latencies.append(time.perf_counter() - call_started)
+                    found = {int(hit["_id"]) for hit in response["hits"]["hits"]}
+                    recalls.append(len(found & set(expected.tolist())) / k)
+                write(format_summary(
+                    f"{config} nc={num_candidates}", summarize(latencies),
+                    recall=f"{sum(recalls) / len(recalls):.3f}",
+                ))
+        finally:
+            if params.get("keep") != "1":
+                es.indices.delete(index=index)
+
+
+@scenario("similar", help=(
+    "Similar movies with the Elasticsearch kNN query against the in-process vector "
+    "snapshot (local top-k + mget), on a live index with a snapshot (build_vector_snapshot). "
+    "Params: index=movies movies=200 repeat=1"
+))
+def similar_movies(params, write):
+    from django.conf import settings
+
+    from .ann import VectorIndex, snapshot_dir
+    from .utils import ElasticsearchUtils
+    from .views import INDEX_NAME
+
+    utils = ElasticsearchUtils(index_name=params.get("index", INDEX_NAME))
+    vector_index = VectorIndex(snapshot_dir(utils.index_generation()))
+    movies = [
+        (hit["_id"], hit["_source"]["embedding"])
+        for hit in utils.es.search(index=utils.index_name, body={
+            "size": int(params.get("movies", 200)), "_source": ["embedding"],
+            "query": {"exists": {"field": "embedding"}},
+        })["hits"]["hits"]
+    ]
+    repeat = int(params.get("repeat", 1))
+    candidates = settings.SIMILAR_MOVIES_RANKING["CANDIDATES"]
+    write(f"{len(vector_index)} movies in the snapshot ({vector_index.meta['dtype']}), {len(movies)} queries")
+
+    def run(func):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for movie_id, embedding in movies:
+                call_started = time.perf_counter()
+                func(movie_id, embedding)
+                latencies.append(time.perf_counter() - call_started)
+        return latencies, time.perf_counter() - started
+
+    overlap = []
+
+    def local(movie_id, embedding):
+        return utils.hydrate_movies(vector_index.similar(movie_id, candidates))
+
+    def compare(movie_id, embedding):
+        expected = {movie["poster_path"] for movie in utils.similar_movies_for(movie_id, embedding)}
+        found = {movie["poster_path"] for movie in local(movie_id, embedding)}
+        overlap.append(len(expected & found) / max(1, len(expected)))
+
+    for label, func in (
+        ("es-knn", utils.similar_movies_for),
+        ("local-topk", lambda movie_id, embedding: vector_index.similar(movie_id, candidates)),
+        ("local-topk+mget", local),
+    ):
+        write(format_summary(label, summarize(*run(func))))
+    compare_runs = [compare(movie_id, embedding) for movie_id, embedding in movies]
+    write(f"candidate overlap with es-knn (same reranker, approximate vs exact candidates): {sum(overlap) / max(1, len(compare_runs)):.3f}")
+
+
+def typed_prefixes(text, debounce_keys=1):
+    """The prefixes a user typing ``text`` sends, one every ``debounce_keys`` keystrokes, and the full text."""
+    prefixes = [text[:length] for length in range(1, len(text) + 1)]
+    return prefixes[debounce_keys - 1::debounce_keys] + ([text] if len(text) % debounce_keys else [])
+
+
+@scenario("suggest", help=(
+    "Autocomplete latency under a keystroke-rate load: every simulated user types a sample title, "
+    "sending the prefix every debounce keystrokes, against the in-process prefix index and the "
+    "multi_match of full_text_search. With target=http://host:8081 the users also hit the "
+    "/suggest/ endpoint concurrently, one keystroke every keystroke_ms. "
+    "Params: index=movies users=50 debounce=1 keystroke_ms=120 target="
+))
+def suggest(params, write):
+    from .utils import ElasticsearchUtils
+    from .views import INDEX_NAME
+
+    utils = ElasticsearchUtils(index_name=params.get("index", INDEX_NAME))
+    users = int(params.get("users", 50))
+    debounce = int(params.get("debounce", 1))
+    keystroke = float(params.get("keystroke_ms", 120)) / 1000
+    titles = [
+        hit["_source"]["title"]
+        for hit in utils.es.search(index=utils.index_name, body={
+            "size": users, "_source": ["title"], "query": {"function_score": {"random_score": {"seed": 1, "field": "_seq_no"}}},
+        })["hits"]["hits"]
+    ]
+    typed = [prefix for title in titles for prefix in typed_prefixes(title, debounce)]
+
+    started = time.perf_counter()
+    suggest_index = utils.suggest_index()
+    write(f"built the prefix index of {len(suggest_index)} suggestions in {time.perf_counter() - started:.2f}s, "
+          f"{len(typed)} requests from {len(titles)} users")
+
+    for label, func in (
+        ("prefix-index (first pass)", lambda prefix: suggest_index.suggest(prefix)),
+        ("prefix-index (cached)", lambda prefix: suggest_index.suggest(prefix)),
+        ("es-multi_match", lambda prefix: utils.full_text_search(prefix)),
+    ):
+        latencies = []
+        run_started = time.perf_counter()
+        for prefix in typed:
+            call_started = time.perf_counter()
+            func(prefix)
+            latencies.append(time.perf_counter() - call_started)
+        write(format_summary(label, summarize(latencies, time.perf_counter() - run_started)))
+
+    target = params.get("target")
+    if not target:
+        return
+    import aiohttp
+    from urllib.parse import quote
+
+    async def run():
+        latencies = []
+        errors = 0
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=users)) as session:
+            async def user(title):
+                nonlocal errors
+                for prefix in typed_prefixes(title, debounce):
+                    await asyncio.sleep(keystroke * debounce)
+                    call_started = time.perf_counter()
+                    try:
+                        async with session.get(f"{target}/imdb/movies/suggest/?q={quote(prefix)}") as response:
+                            await response.read()
+                            errors += response.status >= 400
+                    except aiohttp.ClientError:
+                        errors += 1
+                    latencies.append(time.perf_counter() - call_started)
+
+            run_started = time.perf_counter()
+            await asyncio.gather(*(user(title) for title in titles))
+            return latencies, time.perf_counter() - run_started, errors
+
+    latencies, elapsed, errors = asyncio.run(run())
+    write(format_summary("http /suggest/", summarize(latencies, elapsed), errors=errors, users=len(titles)))
+
+
+def synthetic_filter_matches(movie, filters):
+    """Evaluate facets.search_filters on a synthetic movie, for the exact filtered neighbours."""
+    year = int(movie["release_date"][:4])
+    return (
+        all(genre in movie["genre_tags"] for genre in filters.get("genres", ()))
+        and filters.get("year_from", year) <= year <= filters.get("year_to", year)
+        and filters.get("min_rating", 0) <= movie["vote_average"] <= filters.get("max_rating", 10)
+    )
+
+
+@scenario("filtered_knn", help=(
+    "Recall@k and latency of filtered kNN on synthetic movies, for filters of decreasing selectivity: "
+    "post-filtering an unfiltered kNN (k x overfetch), pre-filtering with a fixed num_candidates, and "
+    "pre-filtering with num_candidates adapted to the selectivity (facets.knn_limits). "
+    "Params: docs=50000 queries=100 k=10 num_candidates=100 overfetch=10 keep=0"
+))
+def filtered_knn(params, write):
+    from elasticsearch import helpers
+
+    from .es_client import get_elasticsearch_client
+    from .facets import filter_clauses, knn_limits
+    from .index_template import EMBEDDING_DIMS, EMBEDDING_FIELD, movie_index_mappings
+
+    docs = int(params.get("docs", 50000))
+    query_count = int(params.get("queries", 100))
+    k = int(params.get("k", 10))
+    base_candidates = int(params.get("num_candidates", 100))
+    overfetch = int(params.get("overfetch", 10))
+    es = get_elasticsearch_client()
+    index = "benchmark_filtered_knn"
+
+    rng = np.random.default_rng(0)
+    # clustered vectors, so that neighbourhoods are not uniform noise
+    centers = rng.standard_normal((64, EMBEDDING_DIMS), dtype=np.float32)
+    vectors = centers[rng.integers(0, len(centers), docs + query_count)] + 0.6 * rng.standard_normal(
+        (docs + query_count, EMBEDDING_DIMS), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    corpus, queries = vectors[:docs], vectors[docs:]
+    # skewed genre frequencies: common, rare and very rare filters
+    genres = ["Drama", "Comedy", "Action", "Thriller", "Romance", "Horror", "Animation", "Documentary", "Western"]
+    genre_weights = np.array([30, 25, 15, 10, 8, 5, 4, 2, 1], dtype=np.float64)
+    genre_weights /= genre_weights.sum()
+    movies = [
+        {
+            "genre_tags": sorted(set(rng.choice(genres, size=rng.integers(1, 4), p=genre_weights).tolist())),
+            "release_date": f"{rng.integers(1950, 2025)}-01-01",
+            "vote_average": round(float(rng.uniform(1, 10)), 1),
+        }
+        for _ in range(docs)
+    ]
+
+    es.options(ignore_status=404).indices.delete(index=index)
+    es.indices.create(index=index, settings={"number_of_replicas": 0, "refresh_interval": "-1"},
+                      mappings=movie_index_mappings())
+    try:
+        started = time.perf_counter()
+        helpers.bulk(es, (
+            {"_index": index, "_id": str(i), "_source": {**movie, EMBEDDING_FIELD: vector.tolist()}}
+            for i, (movie, vector) in enumerate(zip(movies, corpus))
+        ), chunk_size=1000, request_timeout=120)
+        es.indices.refresh(index=index)
+        es.options(request_timeout=3600).indices.forcemerge(index=index, max_num_segments=1)
+        write(f"{docs} synthetic movies indexed in {time.perf_counter() - started:.1f}s, {query_count} queries, k={k}")
+
+        cases = [
+            ("none", {}),
+            ("genre=Drama", {"genres": ("Drama",)}),
+            ("years=2015-2024", {"year_from": 2015, "year_to": 2024}),
+            ("genre=Animation", {"genres": ("Animation",)}),
+            ("genre=Western", {"genres": ("Western",)}),
+            ("Western+2000s+rating>=7", {"genres": ("Western",), "year_from": 2000, "year_to": 2009, "min_rating": 7.0}),
+        ]
+        for label, filters in cases:
+            mask = np.array([synthetic_filter_matches(movie, filters) for movie in movies])
+            matching = int(mask.sum())
+            if not matching:
+                continue
+            rows = np.flatnonzero(mask)
+            # exact filtered neighbours by brute force
+            exact = rows[np.argsort(-(queries @ corpus[rows].T), axis=1)[:, :k]]
+            adaptive_k, adaptive_candidates = knn_limits(k, base_candidates, matching, docs)
+            knn_filter = {"bool": {"filter": filter_clauses(filters)}}
+            strategies = {
+                "post-filter": lambda query: [
+                    hit for hit in es.search(index=index, source=False, size=k * overfetch, knn={
+                        "field": EMBEDDING_FIELD, "query_vector": query,
+                        "k": k * overfetch, "num_candidates": max(k * overfetch, base_candidates),
+                    })["hits"]["hits"] if mask[int(hit["_id"])]
+                ][:k],
+                "pre-filter": lambda query: es.search(index=index, source=False, size=k, knn={
+                    "field": EMBEDDING_FIELD, "query_vector": query, "k": min(k, matching),
+                    "num_candidates": base_candidates, "filter": knn_filter,
+                })["hits"]["hits"],
+                f"pre-filter adaptive nc={adaptive_candidates}": lambda query: es.search(index=index, source=False, size=k, knn={
+                    "field": EMBEDDING_FIELD, "query_vector": query, "k": adaptive_k,
+                    "num_candidates": adaptive_candidates, "filter": knn_filter,
+                })["hits"]["hits"],
+            }
+            write(f"filter {label}: {matching} matching movies ({100 * matching / docs:.2f}%)")
+            for name, search in strategies.items():
+                latencies = []
+                recalls = []
+                for query, expected in zip(queries, exact):
+                    call_started = time.perf_counter()
+                    hits = search(query.tolist())
+                    latencies.append(time.perf_counter() - call_started)
+                    found = {int(hit["_id"]) for hit in hits}
+                    recalls.append(len(found & set(expected.tolist())) / len(expected))
+                write(format_summary(f"  {name}", summarize(latencies), recall=f"{sum(recalls) / len(recalls):.3f}"))
+    finally:
+        if params.get("keep") != "1":
+            es.indices.delete(index=index)
+
+
+def synthetic_movie_sources(count, embeddings=True):
+    """_source documents shaped like the movies index (with a 384-float embedding if ``embeddings``)."""
+    rng = np.random.default_rng(0)
+    movies = []
+    for i in range(count):
+        movie = {
+            "title": f"Synthetic movie {i}", "original_title": f"Synthetic movie {i}",
+            "overview": "A synthetic overview. " * 10, "description": "A synthetic description. " * 10,
+            "genres": "Drama, Comedy", "actors": "Actor One, Actor Two, Actor Three", "directors": "Director",
+            "poster_path": f"/synthetic{i}.jpg", "imdb_id": f"tt{i:07d}", "release_date": "2001-01-01",
+            "popularity": float(rng.uniform(0, 100)), "vote_average": round(float(rng.uniform(1, 10)), 1),
+            "vote_count": int(rng.integers(0, 10000)), "runtime": int(rng.integers(80, 180)),
+        }
+        if embeddings:
+            movie["embeddings"] = rng.standard_normal(384).tolist()
+        movies.append(movie)
+    return movies
+
+
+@scenario("serialization", help=(
+    "Cost of shaping search results: MovieData2Serializer against the compact serializer, with and "
+    "without a fields= projection, including JSON rendering, for 10/100/1000 hits. "
+    "Params: sizes=10,100,1000 repeat=50 fields=movie_title,poster_path,vote_average embeddings=1"
+))
+def serialization(params, write):
+    from rest_framework.renderers import JSONRenderer
+
+    from .serializers import MovieData2Serializer, compact_movie_serializer
+
+    sizes = [int(size) for size in params.get("sizes", "10,100,1000").split(",")]
+    repeat = int(params.get("repeat", 50))
+    fields = params.get("fields", "movie_title,poster_path,vote_average").split(",")
+    source_fields = compact_movie_serializer.source_fields(fields)
+    movies = synthetic_movie_sources(max(sizes), embeddings=params.get("embeddings", "1") == "1")
+    renderer = JSONRenderer()
+
+    for size in sizes:
+        hits = movies[:size]
+        # the projection is pushed down to _source: Elasticsearch only returns these fields
+        projected = [{field: movie[field] for field in source_fields if field in movie} for movie in hits]
+        runs = {
+            "drf-serializer": lambda: renderer.render({"results": MovieData2Serializer(hits, many=True).data}),
+            "compact": lambda: renderer.render({"results": compact_movie_serializer.many(hits)}),
+            "compact fields=": lambda: renderer.render({"results": compact_movie_serializer.many(projected, fields)}),
+        }
+        for label, func in runs.items():
+            latencies, elapsed = time_calls(func, max(1, repeat * 10 // size))
+            write(format_summary(f"{size} hits {label}", summarize(latencies, elapsed), bytes=len(func())))
+
+
+@scenario("payloads", help=(
+    "Render + compress throughput and bytes on the wire of search payloads: the DRF JSONRenderer "
+    "(the previous setup) against orjson and MessagePack, uncompressed, gzip and brotli "
+    "(RESPONSE_COMPRESSION levels). Params: sizes=10,100,1000 repeat=200 gzip_level= brotli_quality="
+))
+def payloads(params, write):
+    import gzip
+
+    from django.conf import settings
+    from rest_framework.renderers import JSONRenderer
+
+    from .middleware import brotli
+    from .renderers import MessagePackRenderer, ORJSONRenderer
+    from .serializers import compact_movie_serializer
+
+    sizes = [int(size) for size in params.get("sizes", "10,100,1000").split(",")]
+    repeat = int(params.get("repeat", 200))
+    gzip_level = int(params.get("gzip_level", settings.RESPONSE_COMPRESSION["GZIP_LEVEL"]))
+    brotli_quality = int(params.get("brotli_quality", settings.RESPONSE_COMPRESSION["BROTLI_QUALITY"]))
+    renderers = {"drf-json": JSONRenderer(), "orjson": ORJSONRenderer()}
+    if MessagePackRenderer.available:
+        renderers["msgpack"] = MessagePackRenderer()
+    else:
+        write("msgpack is not installed, skipping MessagePack")
+    compressions = {"identity": lambda content: content, f"gzip-{gzip_level}": lambda content: gzip.compress(content, gzip_level, mtime=0)}
+    if brotli is not None:
+        compressions[f"br-{brotli_quality}"] = lambda content: brotli.compress(content, quality=brotli_quality)
+    else:
+        write("brotli is not installed, skipping brotli")
+
+    movies = synthetic_movie_sources(max(sizes), embeddings=False)
+    for size in sizes:
+        data = {"results": compact_movie_serializer.many(movies[:size])}
+        for renderer_name, renderer in renderers.items():
+            for compression_name, compress in compressions.items():
+                func = lambda: compress(renderer.render(data))
+                latencies, elapsed = time_calls(func, max(1, repeat * 10 // size))
+                write(format_summary(
+                    f"{size} hits {renderer_name} {compression_name}", summarize(latencies, elapsed), bytes=len(func()),
+                ))
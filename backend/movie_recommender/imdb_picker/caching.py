@@ -0,0 +1,361 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+from django.conf import settings
+
+from .metrics import CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+try:
+    import redis
+except ImportError:  # the shared tier is optional
+    redis = None
+
+
+class LRUTTLCache:
+    """
+    Thread-safe in-process cache with a maximum number of entries (least recently
+    used entries are evicted first) and a time to live for every entry.
+    """
+    def __init__(self, max_entries, ttl, name="default"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for ``key`` or ``default`` if missing or expired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    CACHE_HITS.labels(self.name, "local").inc()
+                    return value
+                del self._entries[key]
+                CACHE_EVICTIONS.labels(self.name, "local", "ttl").inc()
+        CACHE_MISSES.labels(self.name, "local").inc()
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Store ``value`` under ``key``, evicting the least recently used entries if full."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                CACHE_EVICTIONS.labels(self.name, "local", "size").inc()
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalRedis:
+    """
+    In-memory stand-in for a Redis client, implementing the few commands the
+    shared cache tier uses. Used for tests and for single-process setups.
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        expires_at = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+        return True
+
+
+def create_shared_cache_client(url):
+    """
+    Build the client used by shared cache tiers.
+    Args:
+        url (str): A redis:// URL, ``local://`` for the in-memory LocalRedis, or empty.
+    Returns:
+        A Redis compatible client, or None if the shared tier is disabled.
+    """
+    if not url:
+        return None
+    if url.startswith("local://"):
+        return LocalRedis()
+    if redis is None:
+        raise ImportError("The 'redis' package is required for a shared cache at " + url)
+    return redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+
+
+class SharedCacheTier:
+    """
+    Cache tier stored in Redis so that every gunicorn worker benefits from it.
+    Errors from the backend are counted as misses: the shared tier must never
+    fail a request.
+    """
+    def __init__(self, client, ttl, name="default", prefix="moviesense"):
+        self.client = client
+        self.ttl = ttl
+        self.name = name
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}:{self.name}:{key}"
+
+    def get(self, key):
+        try:
+            value = self.client.get(self._key(key))
+        except Exception:
+            value = None
+        if value is None:
+            CACHE_MISSES.labels(self.name, "shared").inc()
+        else:
+            CACHE_HITS.labels(self.name, "shared").inc()
+        return value
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.client.set(self._key(key), value, ex=self.ttl if ttl is None else ttl)
+        except Exception:
+            pass
+
+
+class QueryEmbeddingCache:
+    """
+    Two tier cache of query embeddings keyed by the normalized query text and
+    the embedding model id: an in-process LRU/TTL tier in front of an optional
+    shared tier.
+    """
+    name = "query_embedding"
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+
+    @staticmethod
+    def normalize(query):
+        """Lowercase the query and collapse whitespace so that trivial variants share an entry."""
+        return " ".join(query.casefold().split())
+
+    def key(self, query, model_id):
+        digest = hashlib.sha1(self.normalize(query).encode("utf-8")).hexdigest()
+        return f"{model_id}:{digest}"
+
+    def get(self, query, model_id):
+        key = self.key(query, model_id)
+        embedding = self.local.get(key)
+        if embedding is not None or self.shared is None:
+            return embedding
+        raw = self.shared.get(key)
+        if raw is None:
+            return None
+        embedding = np.frombuffer(raw, dtype=np.float32).tolist()
+        self.local.set(key, embedding)
+        return embedding
+
+    def set(self, query, model_id, embedding):
+        key = self.key(query, model_id)
+        self.local.set(key, embedding)
+        if self.shared is not None:
+            self.shared.set(key, np.asarray(embedding, dtype=np.float32).tobytes())
+
+    def get_or_compute(self, query, model_id, compute):
+        """
+        Return the cached embedding for ``query``, calling ``compute()`` on a miss.
+        """
+        embedding = self.get(query, model_id)
+        if embedding is None:
+            embedding = compute()
+            self.set(query, model_id, embedding)
+        return embedding
+
+    def clear(self):
+        self.local.clear()
+
+
+class ResponseCache:
+    """
+    In-process cache of response payloads.
+    - Entries are fresh for ``ttl`` seconds, then served stale for up to
+      ``stale_ttl`` more seconds while one background refresh recomputes them
+      (stale-while-revalidate).
+    - Concurrent misses on the same key are collapsed: one caller computes,
+      the others wait for its result (single-flight).
+    - The total size of the cached payloads (as JSON) is kept under
+      ``max_bytes`` by evicting the least recently used entries.
+    - Every entry carries an ETag so clients can revalidate with If-None-Match.
+    Callers put the index generation in their keys, so a reindex makes every
+    older entry unreachable at once.
+    """
+    def __init__(self, max_bytes, ttl, stale_ttl, name="response", wait_timeout=10.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._size = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._refresher = None
+
+    def _ensure_refresher(self):
+        # threads do not survive a fork (gunicorn preload_app), nor do the computations
+        # in flight in the parent: each worker starts its own. Called with self._lock held.
+        if self._pid != os.getpid():
+            self._inflight = {}
+            self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"{self.name}-refresh")
+            self._pid = os.getpid()
+
+    @staticmethod
+    def etag(payload_bytes):
+        return '"' + hashlib.sha1(payload_bytes).hexdigest() + '"'
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True, refresh=None):
+        """
+        Return ``(value, etag)`` for ``key``, calling ``compute()`` on a miss.
+        A caller waiting for another one's computation longer than ``wait_timeout``
+        computes the payload itself.
+        Args:
+            key (str): The cache key, including the index generation.
+            compute (callable): Builds the payload.
+            cacheable (callable): Tells whether a computed payload may be cached (e.g. not an error).
+            refresh (callable): Builds the payload in the background refresh of a stale
+                entry, ``compute`` by default. The refresh outlives the request that
+                triggered it, so it must not use that request's state (e.g. its StageTimer).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._ensure_refresher()
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, etag, size, fresh_until, stale_until = entry
+                if now < fresh_until:
+                    self._entries.move_to_end(key)
+                    CACHE_HITS.labels(self.name, "fresh").inc()
+                    return value, etag
+                if now < stale_until:
+                    self._entries.move_to_end(key)
+                    CACHE_HITS.labels(self.name, "stale").inc()
+                    if key not in self._inflight:
+                        self._inflight[key] = Future()
+                        self._refresher.submit(self._compute, key, refresh or compute, cacheable)
+                    return value, etag
+                self._remove(key)
+                CACHE_EVICTIONS.labels(self.name, "local", "ttl").inc()
+            CACHE_MISSES.labels(self.name, "local").inc()
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if leader:
+            return self._compute(key, compute, cacheable)
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except FutureTimeoutError:
+            # the leader is stuck: do not fail the request, compute without it
+            return self._evaluate(key, compute, cacheable)
+
+    def _evaluate(self, key, compute, cacheable):
+        value = compute()
+        payload_bytes = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+        result = (value, self.etag(payload_bytes))
+        if cacheable(value):
+            self._store(key, result, len(payload_bytes))
+        return result
+
+    def _compute(self, key, compute, cacheable):
+        future = self._inflight[key]
+        try:
+            result = self._evaluate(key, compute, cacheable)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def _store(self, key, result, size):
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (result[0], result[1], size, now + self.ttl, now + self.ttl + self.stale_ttl)
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                CACHE_EVICTIONS.labels(self.name, "local", "size").inc()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_query_embedding_cache = None
+_query_embedding_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache():
+    """Return the process-wide QueryEmbeddingCache configured by settings.QUERY_EMBEDDING_CACHE."""
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        with _query_embedding_cache_lock:
+            if _query_embedding_cache is None:
+                config = settings.QUERY_EMBEDDING_CACHE
+                local = LRUTTLCache(config["MAX_ENTRIES"], config["TTL"], name=QueryEmbeddingCache.name)
+                shared = None
+                client = create_shared_cache_client(config.get("SHARED_URL"))
+                if client is not None:
+                    shared = SharedCacheTier(client, config.get("SHARED_TTL", config["TTL"]), name=QueryEmbeddingCache.name)
+                _query_embedding_cache = QueryEmbeddingCache(local, shared)
+    return _query_embedding_cache
@@ -0,0 +1,73 @@
+import string
+import unicodedata
+
+# Alphabetical catalog buckets. Every movie is stored with a precomputed
+# ``title_initial`` keyword (computed at ingest time, or by the
+# backfill_title_initial command for existing indices) so that browsing a
+# letter is a term filter instead of a prefix query on the titles.
+
+TITLE_INITIAL_FIELD = "title_initial"
+DIGITS_BUCKET = "0-9"
+OTHER_BUCKET = "#"
+CATALOG_BUCKETS = [DIGITS_BUCKET, *string.ascii_uppercase, OTHER_BUCKET]
+
+# Latin letters that do not decompose to an ASCII base letter with NFKD
+LATIN_LETTERS = {
+    "Æ": "A", "Ð": "D", "Đ": "D", "Ħ": "H", "Ł": "L", "Ø": "O",
+    "Œ": "O", "Þ": "T", "ẞ": "S", "ß": "S", "ı": "I",
+}
+
+
+def title_initial(title):
+    """
+    Return the catalog bucket of a title.
+    Leading punctuation, quotes and spaces are skipped; accents are removed and
+    the letter is uppercased ("élite" -> "E"). Titles starting with a digit go to
+    "0-9", titles in other scripts (or without any letter or digit) go to "#".
+    Args:
+        title (str): The movie title.
+    Returns:
+        str: One of CATALOG_BUCKETS.
+    """
+    for char in unicodedata.normalize("NFKD", title or ""):
+        if unicodedata.combining(char):
+            continue
+        if char.isdecimal():
+            return DIGITS_BUCKET
+        if char.isalpha():
+            char = LATIN_LETTERS.get(char, char).upper()
+            return char if char in string.ascii_uppercase else OTHER_BUCKET
+    return OTHER_BUCKET
+
+
+def catalog_bucket(alphabet):
+    """Return the bucket asked for by the ``alphabet`` request parameter ("a", "A", "7", "0-9", "#"...)."""
+    if alphabet in CATALOG_BUCKETS:
+        return alphabet
+    return title_initial(alphabet)
+
+
+# Genres are stored as display strings ("Drama, Comedy"); ``genre_tags`` keeps
+# them as keywords, one per genre, for exact filters and facet counts (computed
+# at ingest time, or by the backfill_genre_tags command for existing indices).
+GENRES_FIELD = "genre_tags"
+
+
+def genre_tags(genres):
+    """
+    Return the genres of a movie as a list of keywords.
+    Args:
+        genres (str | list): A comma separated string or a list of genres.
+    Returns:
+        list: The stripped genres, without duplicates, in their original order.
+    """
+    if not genres:
+        return []
+    if isinstance(genres, str):
+        genres = genres.split(",")
+    tags = []
+    for genre in genres:
+        genre = str(genre).strip()
+        if genre and genre not in tags:
+            tags.append(genre)
+    return tags
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+
+DEFAULT_MODEL_KEY = "default"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+ONNX_CONFIG_FILE = "moviesense_onnx.json"
+
+
+class EmbeddingBackend:
+    """
+    Interface of the inference backends used to encode texts.
+    ``encode`` follows SentenceTransformer.encode: a single string gives a 1-D
+    array, a list of strings gives one row per string.
+    """
+    name = None
+
+    def encode(self, sentences, batch_size=32):
+        raise NotImplementedError
+
+
+class TorchEmbeddingBackend(EmbeddingBackend):
+    """Encode with the sentence-transformers model on torch."""
+    name = "torch"
+
+    def __init__(self, config):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(config["name"], revision=config["revision"])
+        self.model.eval()
+
+    def encode(self, sentences, batch_size=32):
+        return self.model.encode(sentences, batch_size=batch_size)
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """
+    Encode with an ONNX export of the transformer (see the export_onnx_model
+    command) on ONNX Runtime, optionally int8 quantized. Pooling and
+    normalization are done in NumPy the same way as the sentence-transformers
+    model, so neither torch nor transformers are imported.
+    """
+    name = "onnx"
+
+    def __init__(self, config):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = config["onnx_path"]
+        model_file = ONNX_QUANTIZED_MODEL_FILE if config.get("quantized") else ONNX_MODEL_FILE
+        if not os.path.exists(os.path.join(model_dir, model_file)):
+            raise FileNotFoundError(
+                f"No {model_file} in {model_dir}: run export_onnx_model"
+                + (" --quantize, or unset EMBEDDING_ONNX_QUANTIZED" if config.get("quantized") else "")
+            )
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE)) as f:
+            self.export_config = json.load(f)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if config.get("intra_op_threads"):
+            options.intra_op_num_threads = config["intra_op_threads"]
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.export_config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.export_config.get("pad_token_id", 0))
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        feeds = {name: value for name, value in feeds.items() if name in self.input_names}
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # mean pooling over the real (non padding) tokens
+        mask = attention_mask[:, :, None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.export_config.get("normalize"):
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+    def encode(self, sentences, batch_size=32):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batches = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        embeddings = np.concatenate(batches) if batches else np.empty((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+EMBEDDING_BACKENDS = {
+    TorchEmbeddingBackend.name: TorchEmbeddingBackend,
+    OnnxEmbeddingBackend.name: OnnxEmbeddingBackend,
+}
+
+
+class EmbeddingModelRegistry:
+    """
+    Process-wide registry of embedding models.
+    Each configured model is loaded at most once per process and then shared
+    read-only by every request. When gunicorn runs with ``preload_app`` the
+    models are loaded in the master before the fork, so workers share the
+    weights copy-on-write instead of loading their own copy.
+    """
+    _models = {}
+    _load_times = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def model_config(model_key=None):
+        """
+        Resolve the configuration of a model from ``settings.EMBEDDING_MODELS``.
+        Args:
+            model_key (str): The key of the model, ``"default"`` when omitted.
+        Returns:
+            dict: The model configuration with ``name``, ``revision`` and ``backend``.
+        """
+        model_key = model_key or DEFAULT_MODEL_KEY
+        try:
+            config = settings.EMBEDDING_MODELS[model_key]
+        except KeyError:
+            raise KeyError(f"Unknown embedding model '{model_key}'")
+        return {
+            "name": config["name"],
+            "revision": config.get("revision"),
+            "backend": config.get("backend", TorchEmbeddingBackend.name),
+            "onnx_path": config.get("onnx_path"),
+            "quantized": config.get("quantized", False),
+            "intra_op_threads": config.get("intra_op_threads"),
+        }
+
+    @staticmethod
+    def model_key_for_index(index_name):
+        """Return the embedding model key used by an Elasticsearch index."""
+        return settings.EMBEDDING_INDEX_MODELS.get(index_name, DEFAULT_MODEL_KEY)
+
+    @classmethod
+    def model_id(cls, model_key=None):
+        """Return a stable identifier (name@revision/backend) for a configured model."""
+        config = cls.model_config(model_key)
+        backend = config["backend"]
+        if backend == OnnxEmbeddingBackend.name and config["quantized"]:
+            backend += "-int8"
+        return f"{config['name']}@{config['revision'] or 'main'}/{backend}"
+
+    @classmethod
+    def get(cls, model_key=None):
+        """
+        Return the loaded model for ``model_key``, loading it on first use.
+        Args:
+            model_key (str): The key of the model in ``settings.EMBEDDING_MODELS``.
+        Returns:
+            EmbeddingBackend: The shared model instance.
+        """
+        model_key = model_key or DEFAULT_MODEL_KEY
+        model = cls._models.get(model_key)
+        if model is not None:
+            return model
+        with cls._lock:
+            # another thread may have finished loading while we waited
+            model = cls._models.get(model_key)
+            if model is None:
+                model = cls._load(model_key)
+                cls._models[model_key] = model
+        return model
+
+    @classmethod
+    def _load(cls, model_key):
+        config = cls.model_config(model_key)
+        try:
+            backend_class = EMBEDDING_BACKENDS[config["backend"]]
+        except KeyError:
+            raise KeyError(f"Unknown embedding backend '{config['backend']}'")
+        started = time.perf_counter()
+        model = backend_class(config)
+        cls._load_times[model_key] = time.perf_counter() - started
+        return model
+
+    @classmethod
+    def is_loaded(cls, model_key=None):
+        """Check whether a model is already loaded in this process."""
+        return (model_key or DEFAULT_MODEL_KEY) in cls._models
+
+    @classmethod
+    def warm_up(cls, model_keys=None):
+        """
+        Load the given models (all configured models when omitted) and run one
+        encode so that the first real request does not pay for lazy init.
+        """
+        for model_key in model_keys or settings.EMBEDDING_MODELS.keys():
+            cls.get(model_key).encode("warm up")
+
+    @classmethod
+    def status(cls):
+        """
+        Report the load state of every configured model.
+        Returns:
+            dict: Model key -> model id, load state and load time in seconds.
+        """
+        return {
+            model_key: {
+                "model": cls.model_id(model_key),
+                "backend": cls.model_config(model_key)["backend"],
+                "loaded": cls.is_loaded(model_key),
+                "load_seconds": cls._load_times.get(model_key),
+            }
+            for model_key in settings.EMBEDDING_MODELS
+        }
+
+    @classmethod
+    def reset(cls):
+        """Drop every loaded model (mainly for tests and reloads)."""
+        with cls._lock:
+            cls._models.clear()
+            cls._load_times.clear()
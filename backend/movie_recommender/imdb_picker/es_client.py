@@ -0,0 +1,207 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from elastic_transport import AsyncTransport, ConnectionError, ConnectionTimeout, Transport
+from elastic_transport.client_utils import DEFAULT, resolve_default
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+
+
+class JitteredRetryTransport(Transport):
+    """
+    Transport that waits between retries with exponential backoff and full
+    jitter, so that workers retrying after an Elasticsearch hiccup do not all
+    hit the cluster again at the same instant. The stock transport retries
+    immediately.
+    """
+    backoff_base = 0.05
+    backoff_max = 1.0
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def perform_request(self, method, target, *, max_retries=DEFAULT, retry_on_status=DEFAULT,
+                        retry_on_timeout=DEFAULT, **kwargs):
+        max_retries = resolve_default(max_retries, self.max_retries)
+        retry_on_status = resolve_default(retry_on_status, self.retry_on_status)
+        retry_on_timeout = resolve_default(retry_on_timeout, self.retry_on_timeout)
+        for attempt in range(max_retries + 1):
+            last_attempt = attempt >= max_retries
+            try:
+                response = super().perform_request(
+                    method, target, max_retries=0, retry_on_status=retry_on_status,
+                    retry_on_timeout=retry_on_timeout, **kwargs
+                )
+            except ConnectionTimeout:
+                if last_attempt or not retry_on_timeout:
+                    raise
+            except ConnectionError:
+                if last_attempt:
+                    raise
+            else:
+                if last_attempt or response.meta.status not in retry_on_status:
+                    return response
+            time.sleep(self.backoff(attempt))
+
+
+class JitteredRetryAsyncTransport(AsyncTransport):
+    """Async counterpart of JitteredRetryTransport, sleeping with asyncio between retries."""
+    backoff_base = JitteredRetryTransport.backoff_base
+    backoff_max = JitteredRetryTransport.backoff_max
+    backoff = JitteredRetryTransport.backoff
+
+    async def perform_request(self, method, target, *, max_retries=DEFAULT, retry_on_status=DEFAULT,
+                              retry_on_timeout=DEFAULT, **kwargs):
+        max_retries = resolve_default(max_retries, self.max_retries)
+        retry_on_status = resolve_default(retry_on_status, self.retry_on_status)
+        retry_on_timeout = resolve_default(retry_on_timeout, self.retry_on_timeout)
+        for attempt in range(max_retries + 1):
+            last_attempt = attempt >= max_retries
+            try:
+                response = await super().perform_request(
+                    method, target, max_retries=0, retry_on_status=retry_on_status,
+                    retry_on_timeout=retry_on_timeout, **kwargs
+                )
+            except ConnectionTimeout:
+                if last_attempt or not retry_on_timeout:
+                    raise
+            except ConnectionError:
+                if last_attempt:
+                    raise
+            else:
+                if last_attempt or response.meta.status not in retry_on_status:
+                    return response
+            await asyncio.sleep(self.backoff(attempt))
+
+
+def elasticsearch_client_options(alias="default"):
+    """
+    Translate ``settings.ELASTICSEARCH[alias]`` into Elasticsearch client arguments.
+    """
+    config = settings.ELASTICSEARCH[alias]
+    return {
+        "hosts": config["HOSTS"],
+        "connections_per_node": config["CONNECTIONS_PER_NODE"],
+        "http_compress": config["HTTP_COMPRESS"],
+        "request_timeout": config["REQUEST_TIMEOUT"],
+        "max_retries": config["MAX_RETRIES"],
+        "retry_on_timeout": config["RETRY_ON_TIMEOUT"],
+        "retry_on_status": tuple(config.get("RETRY_ON_STATUS", (429, 502, 503, 504))),
+        "sniff_on_start": config["SNIFF_ON_START"],
+        "sniff_on_node_failure": config["SNIFF_ON_NODE_FAILURE"],
+        "sniff_timeout": config.get("SNIFF_TIMEOUT", 1.0),
+        "min_delay_between_sniffing": config.get("MIN_DELAY_BETWEEN_SNIFFING", 60.0),
+    }
+
+
+def build_elasticsearch_client(alias="default", **overrides):
+    """
+    Build a new Elasticsearch client from the Django settings.
+    Args:
+        alias (str): The key of the cluster in ``settings.ELASTICSEARCH``.
+        overrides: Client arguments replacing the configured ones (e.g. ``hosts``).
+    Returns:
+        Elasticsearch: A client with its own connection pool.
+    """
+    config = settings.ELASTICSEARCH[alias]
+    client = Elasticsearch(
+        transport_class=JitteredRetryTransport,
+        **{**elasticsearch_client_options(alias), **overrides},
+    )
+    client.transport.backoff_base = config.get("RETRY_BACKOFF", JitteredRetryTransport.backoff_base)
+    client.transport.backoff_max = config.get("RETRY_BACKOFF_MAX", JitteredRetryTransport.backoff_max)
+    return client
+
+
+def build_async_elasticsearch_client(alias="default", **overrides):
+    """
+    Build a new AsyncElasticsearch client (aiohttp based) from the Django settings.
+    The client is bound to the event loop it is first used in.
+    """
+    config = settings.ELASTICSEARCH[alias]
+    client = AsyncElasticsearch(
+        transport_class=JitteredRetryAsyncTransport,
+        **{**elasticsearch_client_options(alias), **overrides},
+    )
+    client.transport.backoff_base = config.get("RETRY_BACKOFF", JitteredRetryTransport.backoff_base)
+    client.transport.backoff_max = config.get("RETRY_BACKOFF_MAX", JitteredRetryTransport.backoff_max)
+    return client
+
+
+_clients = {}
+# event loop -> ({(alias, hosts): client}, task closing them when the loop shuts down)
+_async_clients = weakref.WeakKeyDictionary()
+_clients_pid = None
+_clients_lock = threading.Lock()
+
+
+def _forget_clients():
+    # a forked child must never reuse the sockets of its parent
+    global _clients_pid
+    _clients.clear()
+    _async_clients.clear()
+    _clients_pid = None
+
+
+os.register_at_fork(after_in_child=_forget_clients)
+
+
+def get_elasticsearch_client(alias="default", hosts=None):
+    """
+    Return the shared client of this process for ``alias``.
+    Clients are built lazily and per process: a gunicorn worker builds its own
+    connection pool after the fork instead of inheriting the master's sockets.
+    """
+    global _clients_pid
+    key = (alias, tuple(hosts) if isinstance(hosts, (list, tuple)) else hosts)
+    client = _clients.get(key)
+    if client is not None and _clients_pid == os.getpid():
+        return client
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(key)
+        if client is None:
+            overrides = {"hosts": hosts} if hosts else {}
+            client = build_elasticsearch_client(alias, **overrides)
+            _clients[key] = client
+    return client
+
+
+def get_async_elasticsearch_client(alias="default", hosts=None):
+    """
+    Return the shared AsyncElasticsearch client of the running event loop for ``alias``.
+    aiohttp sessions cannot be shared between event loops, so there is one client per loop,
+    closed when the loop shuts down. A uvicorn worker runs a single loop; under WSGI the
+    async views run in a new loop per request (async_to_sync), whose clients are closed
+    at the end of the request.
+    """
+    loop = asyncio.get_running_loop()
+    key = (alias, tuple(hosts) if isinstance(hosts, (list, tuple)) else hosts)
+    entry = _async_clients.get(loop)
+    if entry is None:
+        clients = {}
+        entry = (clients, loop.create_task(_close_async_clients(loop, clients)))
+        _async_clients[loop] = entry
+    clients = entry[0]
+    client = clients.get(key)
+    if client is None:
+        overrides = {"hosts": hosts} if hosts else {}
+        client = clients[key] = build_async_elasticsearch_client(alias, **overrides)
+    return client
+
+
+async def _close_async_clients(loop, clients):
+    # asyncio.run (async_to_sync, uvicorn) cancels the pending tasks before closing the loop
+    try:
+        await asyncio.Event().wait()
+    finally:
+        _async_clients.pop(loop, None)
+        for client in list(clients.values()):
+            await client.close()
+        clients.clear()
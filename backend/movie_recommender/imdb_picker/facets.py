@@ -0,0 +1,138 @@
+import math
+
+from django.conf import settings
+
+from .catalog import GENRES_FIELD
+
+# Filtered and faceted search. The filters are clauses of the filter context
+# of a bool query: they are not scored, and each clause is cached by the node
+# query cache and reused by every request filtering on the same value. The
+# facet counts are aggregations over the filtered movies. The same clauses are
+# the pre-filter of the kNN searches (see knn_limits).
+
+# runtime facet in minutes, matching the min_runtime/max_runtime filters
+RUNTIME_BUCKETS = [
+    {"key": "<90", "to": 90},
+    {"key": "90-120", "from": 90, "to": 120},
+    {"key": "120-150", "from": 120, "to": 150},
+    {"key": "150+", "from": 150},
+]
+# rating facet: "at least" buckets, matching the min_rating filter
+RATING_BUCKETS = [
+    {"key": "8+", "from": 8},
+    {"key": "7+", "from": 7},
+    {"key": "6+", "from": 6},
+    {"key": "5+", "from": 5},
+]
+
+
+def _number(params, name, cast, low, high):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        value = cast(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return value
+
+
+def search_filters(params):
+    """
+    Filters of a request.
+    Args:
+        params (dict): The query parameters: genres (comma separated, movies must
+            have all of them), year_from, year_to, min_rating, max_rating,
+            min_runtime, max_runtime.
+    Returns:
+        dict: The filters that are set, see filter_clauses.
+    Raises:
+        ValueError: A parameter is malformed or out of range.
+    """
+    filters = {
+        "year_from": _number(params, "year_from", int, 1800, 2200),
+        "year_to": _number(params, "year_to", int, 1800, 2200),
+        "min_rating": _number(params, "min_rating", float, 0, 10),
+        "max_rating": _number(params, "max_rating", float, 0, 10),
+        "min_runtime": _number(params, "min_runtime", int, 0, 1000),
+        "max_runtime": _number(params, "max_runtime", int, 0, 1000),
+    }
+    genres = sorted({genre.strip() for genre in params.get("genres", "").split(",") if genre.strip()})
+    if len(genres) > settings.FACETED_SEARCH["MAX_GENRES"]:
+        raise ValueError(f"at most {settings.FACETED_SEARCH['MAX_GENRES']} genres")
+    filters["genres"] = tuple(genres)
+    return {name: value for name, value in filters.items() if value not in (None, ())}
+
+
+def _range(field, low, high):
+    bounds = {}
+    if low is not None:
+        bounds["gte"] = low
+    if high is not None:
+        bounds["lte"] = high
+    return {"range": {field: bounds}}
+
+
+def filter_clauses(filters):
+    """Return the filter context clauses of ``filters`` (see search_filters)."""
+    clauses = [{"term": {GENRES_FIELD: genre}} for genre in filters.get("genres", ())]
+    if "year_from" in filters or "year_to" in filters:
+        year_from, year_to = filters.get("year_from"), filters.get("year_to")
+        clauses.append(_range(
+            "release_date",
+            f"{year_from}-01-01" if year_from is not None else None,
+            f"{year_to}-12-31" if year_to is not None else None,
+        ))
+    if "min_rating" in filters or "max_rating" in filters:
+        clauses.append(_range("vote_average", filters.get("min_rating"), filters.get("max_rating")))
+    if "min_runtime" in filters or "max_runtime" in filters:
+        clauses.append(_range("runtime", filters.get("min_runtime"), filters.get("max_runtime")))
+    return clauses
+
+
+def filter_key(filters):
+    """A canonical, hashable form of ``filters``, for cache keys."""
+    return tuple(sorted(filters.items()))
+
+
+def facet_aggregations():
+    """The aggregations counting the movies per genre, release year, rating and runtime."""
+    return {
+        "genres": {"terms": {"field": GENRES_FIELD, "size": settings.FACETED_SEARCH["GENRE_FACET_SIZE"]}},
+        "years": {"date_histogram": {
+            "field": "release_date", "calendar_interval": "year", "format": "yyyy", "min_doc_count": 1,
+        }},
+        "rating": {"range": {"field": "vote_average", "ranges": RATING_BUCKETS}},
+        "runtime": {"range": {"field": "runtime", "ranges": RUNTIME_BUCKETS}},
+    }
+
+
+def facet_counts(aggregations):
+    """Turn the facet_aggregations of a response into {facet: [{"value", "count"}]}."""
+    return {
+        "genres": [{"value": bucket["key"], "count": bucket["doc_count"]} for bucket in aggregations["genres"]["buckets"]],
+        "years": [{"value": int(bucket["key_as_string"]), "count": bucket["doc_count"]} for bucket in aggregations["years"]["buckets"]],
+        "rating": [{"value": bucket["key"], "count": bucket["doc_count"]} for bucket in aggregations["rating"]["buckets"]],
+        "runtime": [{"value": bucket["key"], "count": bucket["doc_count"]} for bucket in aggregations["runtime"]["buckets"]],
+    }
+
+
+def knn_limits(k, num_candidates, matching, total):
+    """
+    k and num_candidates of a kNN search pre-filtered to ``matching`` of the ``total``
+    movies. The HNSW traversal only collects matching vectors, so the fewer there
+    are the more of the graph it must visit to keep the same recall:
+    num_candidates grows with 1 / sqrt(selectivity), up to FILTERED_KNN["MAX_NUM_CANDIDATES"].
+    It never exceeds the matching movies, below which Lucene searches them exactly.
+    Returns:
+        tuple: (k, num_candidates), (0, 0) when no movie matches.
+    """
+    if matching <= 0:
+        return 0, 0
+    k = min(k, matching)
+    if total and matching < total:
+        num_candidates = math.ceil(num_candidates / math.sqrt(matching / total))
+    num_candidates = min(num_candidates, settings.FILTERED_KNN["MAX_NUM_CANDIDATES"], matching)
+    return k, max(k, num_candidates)
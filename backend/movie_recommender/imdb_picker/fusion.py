@@ -0,0 +1,96 @@
+import math
+
+from django.conf import settings
+
+# Fusion of the ranked lists of the hybrid search (lexical multi_match and
+# semantic kNN). Both take a list of Elasticsearch hit lists, best first, and
+# one weight per list, and return the hits sorted by fused score, best first.
+# A document found by several lists keeps the _source of the first one.
+
+FUSION_METHODS = {}
+
+
+def fusion_method(name):
+    """Register a fusion method: a function (hit_lists, weights, **options) -> fused hits."""
+    def register(func):
+        FUSION_METHODS[name] = func
+        return func
+    return register
+
+
+def _fuse(hit_lists, weights, contribution):
+    scores = {}
+    hits = {}
+    for hit_list, weight, contributions in zip(hit_lists, weights, map(contribution, hit_lists)):
+        for hit, value in zip(hit_list, contributions):
+            scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + weight * value
+            hits.setdefault(hit["_id"], hit)
+    # ties keep the order of the first list they appear in
+    return [hits[doc_id] for doc_id in sorted(scores, key=lambda doc_id: -scores[doc_id])]
+
+
+@fusion_method("rrf")
+def reciprocal_rank_fusion(hit_lists, weights, rank_constant=60, **options):
+    """
+    Reciprocal rank fusion: sum of weight / (rank_constant + rank). Only ranks
+    count, so the BM25 and cosine scores need no calibration.
+    """
+    return _fuse(hit_lists, weights, lambda hits: [1.0 / (rank_constant + rank) for rank in range(1, len(hits) + 1)])
+
+
+@fusion_method("weighted")
+def weighted_score_fusion(hit_lists, weights, **options):
+    """
+    Weighted sum of the scores, min-max normalized per list (BM25 scores are
+    unbounded, kNN scores are in [0, 1]).
+    """
+    def normalized(hits):
+        scores = [hit["_score"] or 0.0 for hit in hits]
+        if not scores:
+            return []
+        low, spread = min(scores), max(scores) - min(scores)
+        return [(score - low) / spread if spread > 0 else 1.0 for score in scores]
+    return _fuse(hit_lists, weights, normalized)
+
+
+def hybrid_search_options(params):
+    """
+    Hybrid search tunables of a request, defaulting to settings.HYBRID_SEARCH.
+    Args:
+        params (dict): The query parameters (fusion, rank_constant, lexical_weight,
+            semantic_weight, size, window, budget_ms).
+    Returns:
+        dict: The options of ElasticsearchUtils.hybrid_search.
+    Raises:
+        ValueError: A parameter is malformed or out of range.
+    """
+    config = settings.HYBRID_SEARCH
+    options = {
+        "fusion": params.get("fusion", config["FUSION"]),
+        "rank_constant": int(params.get("rank_constant", config["RANK_CONSTANT"])),
+        "lexical_weight": float(params.get("lexical_weight", config["LEXICAL_WEIGHT"])),
+        "semantic_weight": float(params.get("semantic_weight", config["SEMANTIC_WEIGHT"])),
+        "size": int(params.get("size", config["SIZE"])),
+        "window": int(params.get("window", config["WINDOW"])),
+        "budget_ms": float(params.get("budget_ms", config["EMBEDDING_BUDGET_MS"])),
+    }
+    if options["fusion"] not in FUSION_METHODS:
+        raise ValueError(f"fusion must be one of {', '.join(FUSION_METHODS)}")
+    if options["rank_constant"] < 1:
+        raise ValueError("rank_constant must be at least 1")
+    if not all(math.isfinite(options[name]) for name in ("lexical_weight", "semantic_weight", "budget_ms")):
+        # nan passes the range checks below and would make every fused score nan
+        raise ValueError("lexical_weight, semantic_weight and budget_ms must be finite numbers")
+    if options["lexical_weight"] < 0 or options["semantic_weight"] < 0:
+        raise ValueError("weights must not be negative")
+    if not 1 <= options["size"] <= config["MAX_WINDOW"]:
+        raise ValueError(f"size must be between 1 and {config['MAX_WINDOW']}")
+    # at least a page of each list to fuse
+    options["window"] = min(max(options["window"], options["size"]), config["MAX_WINDOW"])
+    options["budget_ms"] = min(max(options["budget_ms"], 0.0), config["MAX_EMBEDDING_BUDGET_MS"])
+    return options
+
+
+def fuse(hit_lists, weights, fusion="rrf", **options):
+    """Fuse hit lists with a registered FUSION_METHODS method."""
+    return FUSION_METHODS[fusion](hit_lists, weights, **options)
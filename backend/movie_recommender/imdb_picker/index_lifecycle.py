@@ -0,0 +1,251 @@
+import re
+import string
+
+from django.conf import settings
+
+from .catalog import (
+    CATALOG_BUCKETS, DIGITS_BUCKET, GENRES_FIELD, LATIN_LETTERS, OTHER_BUCKET, TITLE_INITIAL_FIELD,
+)
+from .index_template import movie_index_mappings
+
+# Blue/green lifecycle of the movies index. The app only ever reads through the
+# alias settings.MOVIES_INDEX["ALIAS"]; every rebuild creates a new generation
+# <PREFIX><N> with bulk friendly settings, fills it, restores the serving
+# settings, force-merges and warms it, then moves the alias in one atomic
+# update_aliases call. The app notices the new generation behind the alias
+# (ElasticsearchUtils.index_generation) and drops its caches.
+
+# Settings while bulk loading: no refreshes and no replicas to copy every segment to
+BULK_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+
+# Representative queries run against a new generation before it serves traffic
+WARM_UP_QUERIES = [
+    "batman", "star wars", "love story in paris", "space movies", "christopher nolan",
+    "horror", "animated movies for kids", "the godfather", "tom hanks", "time travel",
+]
+
+# Reindex script deriving the fields computed at ingest time (ingestion.movie_document)
+# for documents copied from a generation that predates them: genre_tags (catalog.genre_tags)
+# and title_initial, with the same rules as catalog.title_initial
+DERIVED_FIELDS_SCRIPT = {
+    "lang": "painless",
+    "source": """
+        def genres = ctx._source.genres;
+        if (ctx._source[params.genres_field] == null && genres != null) {
+            def tags = new ArrayList();
+            for (def genre : (genres instanceof List ? genres : genres.toString().splitOnToken(','))) {
+                def tag = genre.toString().trim();
+                if (!tag.isEmpty() && !tags.contains(tag)) { tags.add(tag); }
+            }
+            ctx._source[params.genres_field] = tags;
+        }
+        if (ctx._source[params.initial_field] == null) {
+            String bucket = params.other_bucket;
+            def title = ctx._source.title;
+            if (title != null) {
+                String text = Normalizer.normalize(title.toString(), Normalizer.Form.NFKD);
+                int i = 0;
+                while (i < text.length()) {
+                    int start = i;
+                    int cp = text.codePointAt(i);
+                    i += Character.charCount(cp);
+                    int type = Character.getType(cp);
+                    if (type == Character.NON_SPACING_MARK || type == Character.ENCLOSING_MARK) { continue; }
+                    if (type == Character.DECIMAL_DIGIT_NUMBER) { bucket = params.digits_bucket; break; }
+                    if (Character.isLetter(cp)) {
+                        String letter = text.substring(start, i);
+                        letter = params.latin_letters.getOrDefault(letter, letter).toUpperCase();
+                        bucket = params.letters.contains(letter) ? letter : params.other_bucket;
+                        break;
+                    }
+                }
+            }
+            ctx._source[params.initial_field] = bucket;
+        }
+    """,
+    "params": {
+        "genres_field": GENRES_FIELD,
+        "initial_field": TITLE_INITIAL_FIELD,
+        "digits_bucket": DIGITS_BUCKET,
+        "other_bucket": OTHER_BUCKET,
+        "letters": list(string.ascii_uppercase),
+        "latin_letters": LATIN_LETTERS,
+    },
+}
+
+
+def generation_number(index, prefix=None):
+    """Return N for an index named <prefix>N, None for other indices."""
+    prefix = prefix or settings.MOVIES_INDEX["PREFIX"]
+    match = re.fullmatch(re.escape(prefix) + r"(\d+)", index)
+    return int(match.group(1)) if match else None
+
+
+def list_generations(es, prefix=None):
+    """Return the generation index names, oldest first."""
+    prefix = prefix or settings.MOVIES_INDEX["PREFIX"]
+    indices = es.indices.get(index=prefix + "*", filter_path="*.settings.index.uuid", allow_no_indices=True)
+    names = [name for name in indices if generation_number(name, prefix) is not None]
+    return sorted(names, key=lambda name: generation_number(name, prefix))
+
+
+def alias_targets(es, alias=None):
+    """Return the indices the alias points to (empty if it does not exist)."""
+    alias = alias or settings.MOVIES_INDEX["ALIAS"]
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return sorted(es.indices.get_alias(name=alias).keys())
+
+
+def write_index(es, index=None, alias=None):
+    """
+    Return the concrete index a write command targets: ``index`` itself, or the
+    generation behind it when it is the alias (the default). Writing through the
+    alias name would create a plain index called like the alias on a fresh
+    cluster, which the alias could then never be attached to.
+    Raises:
+        ValueError: The alias does not point to exactly one index.
+    """
+    alias = alias or settings.MOVIES_INDEX["ALIAS"]
+    index = index or alias
+    if index != alias and not es.indices.exists_alias(name=index):
+        return index
+    targets = alias_targets(es, index)
+    if not targets:
+        raise ValueError(
+            f"The alias '{index}' does not point to any index yet: pass --index with a generation "
+            f"(e.g. {next_generation(es)}), then switch the alias to it with reindex_movies --switch-to"
+        )
+    if len(targets) > 1:
+        raise ValueError(f"The alias '{index}' points to several indices ({', '.join(targets)}): pass --index")
+    return targets[0]
+
+
+def next_generation(es, prefix=None):
+    """Return the name of the next generation, one above the highest existing one."""
+    prefix = prefix or settings.MOVIES_INDEX["PREFIX"]
+    generations = list_generations(es, prefix)
+    number = generation_number(generations[-1], prefix) + 1 if generations else 1
+    return f"{prefix}{number}"
+
+
+def create_generation(es, index, mappings=None, shards=None):
+    """Create a generation index set up for bulk loading."""
+    index_settings = dict(BULK_SETTINGS)
+    if shards:
+        index_settings["number_of_shards"] = shards
+    es.indices.create(index=index, settings=index_settings, mappings=mappings or movie_index_mappings())
+
+
+def finalize_generation(es, index, replicas=None, max_num_segments=1):
+    """
+    Restore the serving settings of a loaded generation: refresh, force-merge to
+    ``max_num_segments`` (fewer segments, faster searches and kNN graphs), then
+    add the replicas, which copy the merged segments instead of merging themselves.
+    """
+    replicas = settings.MOVIES_INDEX["REPLICAS"] if replicas is None else replicas
+    es.indices.put_settings(index=index, settings={"refresh_interval": None})
+    es.indices.refresh(index=index)
+    es.options(request_timeout=3600).indices.forcemerge(index=index, max_num_segments=max_num_segments)
+    es.indices.put_settings(index=index, settings={"number_of_replicas": replicas})
+    es.options(request_timeout=600).cluster.health(index=index, wait_for_status="yellow" if replicas == 0 else "green", timeout="10m")
+
+
+def warm_up_generation(index, queries=None, alias=None):
+    """
+    Run representative queries against a generation so that its caches, the
+    file system cache and the kNN graphs are loaded before it takes traffic.
+    Also checks the alphabetical catalog: every document must have its title
+    initial, and the letters with movies in the generation the alias serves
+    must not come back empty.
+    Returns:
+        int: The number of queries and checks that failed.
+    """
+    from .utils import ElasticsearchUtils, MovieQueries, catalog_bucket_counts
+
+    utils = ElasticsearchUtils(index_name=index)
+    alias = alias or settings.MOVIES_INDEX["ALIAS"]
+    serving = {}
+    if alias_targets(utils.es, alias) not in ([], [index]):
+        serving = catalog_bucket_counts(utils.es.search(index=alias, body=MovieQueries.catalog_counts()))
+    failures = 0
+    for query in queries or WARM_UP_QUERIES:
+        failures += isinstance(utils.full_text_search(query), dict)
+    # the buckets are compared on title_initial, whether or not the catalog browses with it
+    counts = catalog_bucket_counts(utils.es.search(index=index, body=MovieQueries.catalog_counts()))
+    for bucket in CATALOG_BUCKETS:
+        result = utils.list_movies_by_alphabet(bucket)
+        failures += isinstance(result, dict) or (serving.get(bucket, 0) > 0 and not counts.get(bucket))
+    missing = utils.es.count(index=index, query={"bool": {"must_not": [{"exists": {"field": TITLE_INITIAL_FIELD}}]}})
+    failures += missing["count"] > 0
+    response = utils.es.search(index=index, body={
+        "size": 10, "_source": ["poster_path"], "query": {"exists": {"field": "poster_path"}},
+    })
+    for hit in response["hits"]["hits"]:
+        failures += "error" in utils.movie_info(hit["_source"]["poster_path"])
+    return failures
+
+
+def missing_derived_fields(es, index):
+    """
+    Number of documents of ``index`` without the fields derived at ingest time,
+    {field: count} for the fields missing on some documents. Indices created
+    before a field was added need its backfill command.
+    """
+    checks = {
+        TITLE_INITIAL_FIELD: {"bool": {"must_not": [{"exists": {"field": TITLE_INITIAL_FIELD}}]}},
+        GENRES_FIELD: {"bool": {
+            "filter": [{"exists": {"field": "genres"}}], "must_not": [{"exists": {"field": GENRES_FIELD}}],
+        }},
+    }
+    counts = {field: es.count(index=index, query=query)["count"] for field, query in checks.items()}
+    return {field: count for field, count in counts.items() if count}
+
+
+def switch_alias(es, index, alias=None):
+    """
+    Point the alias at ``index`` only, in one atomic update_aliases call.
+    Returns:
+        list: The indices the alias pointed to before.
+    """
+    alias = alias or settings.MOVIES_INDEX["ALIAS"]
+    if es.indices.exists(index=alias) and not es.indices.exists_alias(name=alias):
+        raise ValueError(f"'{alias}' is an index, not an alias: choose another MOVIES_INDEX_ALIAS")
+    previous = alias_targets(es, alias)
+    actions = [{"remove": {"index": old, "alias": alias}} for old in previous if old != index]
+    actions.append({"add": {"index": index, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
+    return previous
+
+
+def adopt_index(es, index=None, alias=None):
+    """
+    Point the alias at an index that predates it (settings.MOVIES_INDEX["ADOPT_INDEX"])
+    when the alias does not exist yet, so that an existing deployment keeps serving
+    its movies. Does nothing once the alias exists, or if there is no such index.
+    Returns:
+        str: The adopted index, None if nothing changed.
+    """
+    alias = alias or settings.MOVIES_INDEX["ALIAS"]
+    index = settings.MOVIES_INDEX["ADOPT_INDEX"] if index is None else index
+    if alias_targets(es, alias) or not index or not es.indices.exists(index=index):
+        return None
+    switch_alias(es, index, alias)
+    return index
+
+
+def collect_garbage(es, keep=None, alias=None, prefix=None):
+    """
+    Delete old generations, keeping the ``keep`` newest ones (for a rollback)
+    and any generation the alias still points to.
+    Returns:
+        list: The deleted indices.
+    """
+    keep = settings.MOVIES_INDEX["KEEP_GENERATIONS"] if keep is None else keep
+    live = set(alias_targets(es, alias))
+    generations = list_generations(es, prefix)
+    old = generations[:-keep] if keep > 0 else generations
+    deleted = [index for index in old if index not in live]
+    for index in deleted:
+        es.indices.delete(index=index)
+    return deleted
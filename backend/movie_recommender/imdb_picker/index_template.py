@@ -0,0 +1,90 @@
+from django.conf import settings
+
+from .catalog import GENRES_FIELD, TITLE_INITIAL_FIELD
+
+# Code-owned definition of the movies index. Bump TEMPLATE_VERSION with every
+# change: new generations (reindex_movies) are created from the current one and
+# the installed template records the version it was built from.
+
+TEMPLATE_NAME = "movies"
+TEMPLATE_VERSION = 2
+EMBEDDING_FIELD = "embedding"
+EMBEDDING_DIMS = 384
+
+
+def _text_with_keyword():
+    return {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+
+
+def vector_mapping(**overrides):
+    """
+    Mapping of the embedding field from settings.MOVIES_INDEX["VECTOR"].
+    The model outputs normalized vectors, so dot_product gives the cosine ranking
+    without normalizing at search time; int8_hnsw keeps a quantized copy of the
+    vectors in the HNSW graph (about 4x less memory) and rescores with the floats.
+    Args:
+        overrides: SIMILARITY, INDEX_TYPE, M or EF_CONSTRUCTION values replacing the settings (benchmarks).
+    """
+    vector = {**settings.MOVIES_INDEX["VECTOR"], **overrides}
+    index_options = {"type": vector["INDEX_TYPE"]}
+    if vector["INDEX_TYPE"] in ("hnsw", "int8_hnsw"):
+        index_options.update(m=vector["M"], ef_construction=vector["EF_CONSTRUCTION"])
+    return {
+        "type": "dense_vector",
+        "dims": EMBEDDING_DIMS,
+        "index": True,
+        "similarity": vector["SIMILARITY"],
+        "index_options": index_options,
+    }
+
+
+def movie_index_mappings(**vector_overrides):
+    """Return the mappings of a movies index."""
+    mappings = {
+        "dynamic": True,
+        "_meta": {"template_version": TEMPLATE_VERSION},
+        "properties": {
+            "title": _text_with_keyword(),
+            "original_title": _text_with_keyword(),
+            "description": {"type": "text"},
+            "genres": _text_with_keyword(),
+            "actors": _text_with_keyword(),
+            "directors": _text_with_keyword(),
+            "keywords": {"type": "text"},
+            "text": {"type": "text", "index": False},
+            "poster_path": _text_with_keyword(),
+            "imdb_id": {"type": "keyword"},
+            TITLE_INITIAL_FIELD: {"type": "keyword"},
+            GENRES_FIELD: {"type": "keyword"},
+            "release_date": {"type": "date", "ignore_malformed": True},
+            "vote_average": {"type": "float", "ignore_malformed": True},
+            "vote_count": {"type": "integer", "ignore_malformed": True},
+            "popularity": {"type": "float", "ignore_malformed": True},
+            "runtime": {"type": "integer", "ignore_malformed": True},
+            EMBEDDING_FIELD: vector_mapping(**vector_overrides),
+        },
+    }
+    if settings.MOVIES_INDEX["EXCLUDE_EMBEDDING_FROM_SOURCE"]:
+        # smaller stored documents, but the vectors can no longer be read back
+        # (similar movies by example) nor copied by the reindex API
+        mappings["_source"] = {"excludes": [EMBEDDING_FIELD]}
+    return mappings
+
+
+def movie_index_template():
+    """Return the body of the composable index template matching every generation."""
+    return {
+        "index_patterns": [settings.MOVIES_INDEX["PREFIX"] + "*"],
+        "version": TEMPLATE_VERSION,
+        "priority": 100,
+        "template": {
+            "settings": {"index": {"number_of_replicas": settings.MOVIES_INDEX["REPLICAS"]}},
+            "mappings": movie_index_mappings(),
+        },
+        "_meta": {"managed_by": "imdb_picker.index_template"},
+    }
+
+
+def install_movie_index_template(es):
+    """Create or update the movies index template."""
+    es.indices.put_index_template(name=TEMPLATE_NAME, body=movie_index_template())
@@ -0,0 +1,327 @@
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from elasticsearch import helpers
+
+from .catalog import GENRES_FIELD, TITLE_INITIAL_FIELD, genre_tags, title_initial
+from .embeddings import EmbeddingModelRegistry
+from .index_template import EMBEDDING_DIMS, EMBEDDING_FIELD, movie_index_mappings
+
+# Offline ingestion of a movie dump (CSV or JSON lines) into a movies index:
+# rows are read in order, embedded in large batches by a pool of processes and
+# written with helpers.parallel_bulk. A checkpoint records how many rows of the
+# source are safely indexed, and which of them failed, so that an interrupted
+# run can resume and a run with failures can retry them.
+
+# searched field -> column it is copied from when a dump does not have it. The
+# usual TMDB/IMDb dumps only have the display fields (overview, cast, director),
+# which are kept as is: the similar movies, the serializers and the frontend read
+# them, while the searches run on description, actors and directors.
+SEARCH_FIELD_SOURCES = {
+    "description": "overview",
+    "actors": "cast",
+    "directors": "director",
+}
+
+
+def read_movies(path, start=0, retry=()):
+    """
+    Stream the rows of a movie dump.
+    Args:
+        path (str): A .csv file or a JSON lines file (.jsonl/.ndjson).
+        start (int): Number of rows to skip (resuming from a checkpoint).
+        retry (set): Row numbers before ``start`` read again (failed rows of a checkpoint).
+    Yields:
+        tuple: (row number, row dict)
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row_number, row in enumerate(rows):
+            if row_number >= start or row_number in retry:
+                yield row_number, row
+
+
+def _as_text(value):
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value)
+    return str(value or "")
+
+
+def movie_document(row):
+    """
+    Turn a dump row into an index document (without its embedding).
+    Returns None for rows without a title.
+    """
+    document = {key: value for key, value in row.items() if value not in (None, "")}
+    if not document.get("title"):
+        return None
+    for field, source in SEARCH_FIELD_SOURCES.items():
+        if field not in document and source in document:
+            document[field] = document[source]
+    document.pop(EMBEDDING_FIELD, None)
+    document.pop("embeddings", None)
+    document[TITLE_INITIAL_FIELD] = title_initial(document["title"])
+    if document.get("genres"):
+        document[GENRES_FIELD] = genre_tags(document["genres"])
+    return document
+
+
+def movie_text(document):
+    """
+    Build the text embedded for a movie from its title, overview, genres and cast.
+    Dumps that already carry the embedded text in a ``text`` column keep it, so
+    that reindexing them does not move their vectors.
+    """
+    if document.get("text"):
+        return document["text"]
+    parts = [_as_text(document["title"])]
+    if document.get("description"):
+        parts.append(_as_text(document["description"]))
+    if document.get("genres"):
+        parts.append("Genres: " + _as_text(document["genres"]))
+    if document.get("actors"):
+        parts.append("Cast: " + _as_text(document["actors"]))
+    if document.get("directors"):
+        parts.append("Directed by: " + _as_text(document["directors"]))
+    return ". ".join(parts)
+
+
+def movie_id(document):
+    """Stable document id, so that a resumed or repeated run overwrites instead of duplicating."""
+    for key in ("id", "imdb_id"):
+        if document.get(key):
+            return str(document[key])
+    key = f"{document['title']}|{document.get('release_date', '')}|{document.get('poster_path', '')}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _init_embedding_worker(threads):
+    import django
+
+    django.setup()
+    # the workers share the cores, the model is loaded by the first batch
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def embed_texts(texts, model_key=None, batch_size=64):
+    """Embed ``texts`` with the same model as the search queries (GeneralUtils.create_vector_embedding)."""
+    model = EmbeddingModelRegistry.get(model_key)
+    embeddings = np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    # dot_product similarity rejects vectors that are not unit length
+    return embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+
+def synthetic_embeddings(texts, model_key=None, batch_size=64):
+    """Deterministic random unit vectors, to measure the pipeline without the model (benchmarks)."""
+    rng = np.random.default_rng(zlib.crc32(texts[0].encode("utf-8")) if texts else 0)
+    vectors = rng.standard_normal((len(texts), EMBEDDING_DIMS), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class Checkpoint:
+    """
+    Number of source rows known to be indexed, stored as JSON next to the source,
+    with the row numbers that failed before it. The source is only done once every
+    row is indexed. The file is replaced atomically so a crash never leaves a torn
+    checkpoint.
+    """
+    def __init__(self, path, source, index):
+        self.path = path
+        self.source = source
+        self.index = index
+
+    def load(self):
+        """Return the saved state for this source and index, or None."""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get("source") != os.path.abspath(self.source) or state.get("index") != self.index:
+            return None
+        return state
+
+    def save(self, rows, indexed, failed_rows, done=False):
+        if not self.path:
+            return
+        state = {
+            "source": os.path.abspath(self.source), "index": self.index,
+            "rows": rows, "indexed": indexed, "failed": len(failed_rows),
+            "failed_rows": sorted(failed_rows), "done": done,
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+def ensure_movie_index(es, index):
+    """
+    Create ``index`` with the movies mappings (see index_template) unless it exists.
+    Raises:
+        ValueError: ``index`` is the name of the alias (see index_lifecycle.write_index).
+    """
+    if not es.indices.exists(index=index):
+        if index == settings.MOVIES_INDEX["ALIAS"]:
+            raise ValueError(f"'{index}' is the name of the movies alias, not of a generation index")
+        es.indices.create(index=index, mappings=movie_index_mappings())
+
+
+def _embedded_batches(rows, embed, model_key, workers, embed_batch_size, encode_batch_size):
+    """
+    Group ``rows`` into batches of ``embed_batch_size`` documents and embed them,
+    on ``workers`` processes (in this process when 0), keeping the source order.
+    Yields:
+        tuple: (list of (row number, document), embeddings array)
+    """
+    def batches():
+        batch = []
+        for row_number, row in rows:
+            document = movie_document(row)
+            if document is None:
+                continue
+            batch.append((row_number, document))
+            if len(batch) >= embed_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def texts(batch):
+        return [movie_text(document) for _, document in batch]
+
+    if workers <= 0:
+        for batch in batches():
+            yield batch, embed(texts(batch), model_key, encode_batch_size)
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    # spawn, not fork: torch and ONNX Runtime thread pools do not survive a fork
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_embedding_worker,
+        initargs=(threads,),
+    ) as pool:
+        pending = deque()
+        for batch in batches():
+            pending.append((batch, pool.submit(embed, texts(batch), model_key, encode_batch_size)))
+            # bounded read ahead: two batches per worker in flight
+            if len(pending) >= 2 * workers:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+
+
+def ingest_movies(es, source, index, embed=embed_texts, model_key=None, workers=2, embed_batch_size=512,
+                  encode_batch_size=64, chunk_size=500, thread_count=4, queue_size=4,
+                  checkpoint_path=None, checkpoint_every=10000, restart=False, report=None, report_every=10.0):
+    """
+    Embed and index a movie dump.
+    Args:
+        es (Elasticsearch): The client to write with.
+        source (str): Path of the CSV or JSON lines dump.
+        index (str): The target index.
+        embed (callable): Module level function (texts, model_key, batch_size) -> array, run in the pool.
+        model_key (str): The embedding model, see settings.EMBEDDING_MODELS.
+        workers (int): Embedding processes, 0 embeds in this process.
+        embed_batch_size (int): Documents sent to a worker at once.
+        encode_batch_size (int): Batch size of the model inside a worker.
+        chunk_size (int): Documents per bulk request.
+        thread_count (int): Concurrent bulk requests.
+        queue_size (int): Bulk chunks prepared ahead of the bulk threads.
+        checkpoint_path (str): Where to record progress, None to disable.
+        checkpoint_every (int): Save the checkpoint every that many indexed rows.
+        restart (bool): Ignore an existing checkpoint. Otherwise the rows that failed
+            in the previous runs are retried before the run resumes.
+        report (callable): Called with a progress dict every ``report_every`` seconds and at the end.
+    Returns:
+        dict: rows, indexed, failed, errors (the first few), elapsed seconds, docs_per_second
+            and done (False while rows failed).
+    """
+    checkpoint = Checkpoint(checkpoint_path, source, index)
+    state = None if restart else checkpoint.load()
+    if state and state.get("done"):
+        return {**state, "elapsed": 0.0, "docs_per_second": 0.0, "errors": [], "resumed_from": state["rows"]}
+    start = state["rows"] if state else 0
+    indexed = state["indexed"] if state else 0
+    retry = set(state.get("failed_rows", [])) if state else set()
+    # rows failed in this session, the retried ones included
+    failed_rows = set()
+
+    # row numbers of the bulk actions in flight, in order: parallel_bulk yields
+    # one result per action in the same order (ThreadPool.imap)
+    in_flight = deque()
+    in_flight_lock = threading.Lock()
+
+    def actions():
+        rows = read_movies(source, start=start, retry=retry)
+        for batch, embeddings in _embedded_batches(rows, embed, model_key, workers, embed_batch_size, encode_batch_size):
+            for (row_number, document), embedding in zip(batch, embeddings):
+                document[EMBEDDING_FIELD] = embedding.tolist()
+                with in_flight_lock:
+                    in_flight.append(row_number)
+                yield {"_index": index, "_id": movie_id(document), "_source": document}
+
+    started = time.perf_counter()
+    last_report = started
+    session_indexed = 0
+    rows_done = start
+    errors = []
+
+    def progress(done=False):
+        elapsed = time.perf_counter() - started
+        return {
+            "rows": rows_done, "indexed": indexed, "failed": len(failed_rows), "elapsed": elapsed,
+            "docs_per_second": session_indexed / elapsed if elapsed else 0.0, "done": done,
+        }
+
+    results = helpers.parallel_bulk(
+        es, actions(), thread_count=thread_count, chunk_size=chunk_size, queue_size=queue_size,
+        raise_on_error=False, raise_on_exception=False,
+    )
+    for ok, item in results:
+        with in_flight_lock:
+            row_number = in_flight.popleft()
+        # retried rows come before the checkpoint
+        rows_done = max(rows_done, row_number + 1)
+        retry.discard(row_number)
+        if ok:
+            indexed += 1
+            session_indexed += 1
+        else:
+            failed_rows.add(row_number)
+            if len(errors) < 10:
+                errors.append(item)
+        if (session_indexed + len(failed_rows)) % checkpoint_every == 0:
+            checkpoint.save(rows_done, indexed, failed_rows | retry)
+        if report and time.perf_counter() - last_report >= report_every:
+            last_report = time.perf_counter()
+            report(progress())
+
+    # rows skipped on a retry (no title anymore) are not failures
+    done = not failed_rows
+    checkpoint.save(rows_done, indexed, failed_rows, done=done)
+    result = progress(done=done)
+    if report:
+        report(result)
+    return {**result, "errors": errors, "resumed_from": start}
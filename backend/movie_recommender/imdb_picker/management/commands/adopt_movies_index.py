@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import ConnectionError as ElasticsearchConnectionError
+
+from imdb_picker import index_lifecycle
+from imdb_picker.es_client import get_elasticsearch_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Point the read alias at the index served before the alias existed (MOVIES_INDEX_ADOPT), "
+        "if the alias does not exist yet. Safe to run on every start: once the alias exists it does nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", default=settings.MOVIES_INDEX["ADOPT_INDEX"])
+        parser.add_argument("--alias", default=settings.MOVIES_INDEX["ALIAS"])
+
+    def handle(self, *args, **options):
+        es = get_elasticsearch_client()
+        alias = options["alias"]
+        try:
+            adopted = index_lifecycle.adopt_index(es, options["index"], alias)
+        except ElasticsearchConnectionError as e:
+            # do not keep the app from starting, the endpoints report Elasticsearch errors themselves
+            self.stderr.write(f"Elasticsearch is unreachable, alias '{alias}' not checked: {e}")
+            return
+        except ValueError as e:
+            raise CommandError(str(e))
+        if adopted is None:
+            targets = index_lifecycle.alias_targets(es, alias)
+            self.stdout.write(f"Alias '{alias}' -> {', '.join(targets) or '(none, run reindex_movies --from-dump)'}")
+            return
+        self.stdout.write(f"Alias '{alias}' created on {adopted}")
+        # the adopted index predates the derived fields: the catalog and the genre filters would be empty
+        for field, count in index_lifecycle.missing_derived_fields(es, adopted).items():
+            self.stderr.write(f"{count} documents of {adopted} have no {field}: run backfill_{field} --index {adopted}")
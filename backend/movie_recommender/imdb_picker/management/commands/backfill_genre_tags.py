@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import helpers
+
+from imdb_picker.catalog import GENRES_FIELD, genre_tags
+from imdb_picker.es_client import get_elasticsearch_client
+from imdb_picker.index_lifecycle import write_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Add the genre_tags keyword field used by the genre filters and facets of the search to the "
+        "movies index and fill it for the documents that do not have it yet (all of them with --force)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", help="Generation index to update, defaults to the index behind the alias.")
+        parser.add_argument("--force", action="store_true", help="Recompute the field on every document.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        es = get_elasticsearch_client()
+        try:
+            index = write_index(es, options["index"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        es.indices.put_mapping(index=index, properties={GENRES_FIELD: {"type": "keyword"}})
+
+        query = {"exists": {"field": "genres"}}
+        if not options["force"]:
+            query = {"bool": {"filter": [query], "must_not": [{"exists": {"field": GENRES_FIELD}}]}}
+        # split here rather than in a painless script, with the same function as the ingestion
+        documents = helpers.scan(
+            es, index=index, query={"query": query, "_source": ["genres"]}, size=options["batch_size"],
+        )
+        actions = (
+            {
+                "_op_type": "update",
+                "_index": document["_index"],
+                "_id": document["_id"],
+                "doc": {GENRES_FIELD: genre_tags(document["_source"].get("genres"))},
+            }
+            for document in documents
+        )
+        updated = 0
+        for ok, item in helpers.streaming_bulk(es, actions, chunk_size=options["batch_size"], raise_on_error=False):
+            if ok:
+                updated += 1
+            else:
+                self.stderr.write(f"Failed to update {item}")
+        es.indices.refresh(index=index)
+        self.stdout.write(f"{index}: set {GENRES_FIELD} on {updated} documents")
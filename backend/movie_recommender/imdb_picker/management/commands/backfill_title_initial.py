@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import helpers
+
+from imdb_picker.catalog import TITLE_INITIAL_FIELD, title_initial
+from imdb_picker.es_client import get_elasticsearch_client
+from imdb_picker.index_lifecycle import write_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Add the title_initial keyword field used by the alphabetical catalog to the movies index "
+        "and fill it for the documents that do not have it yet (all of them with --force)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", help="Generation index to update, defaults to the index behind the alias.")
+        parser.add_argument("--force", action="store_true", help="Recompute the field on every document.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        es = get_elasticsearch_client()
+        try:
+            index = write_index(es, options["index"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        es.indices.put_mapping(index=index, properties={TITLE_INITIAL_FIELD: {"type": "keyword"}})
+
+        query = {"match_all": {}}
+        if not options["force"]:
+            query = {"bool": {"must_not": [{"exists": {"field": TITLE_INITIAL_FIELD}}]}}
+        # the initials are computed here rather than in a painless script so that
+        # there is a single definition of the buckets (imdb_picker.catalog)
+        documents = helpers.scan(
+            es, index=index, query={"query": query, "_source": ["title"]}, size=options["batch_size"],
+        )
+        actions = (
+            {
+                "_op_type": "update",
+                "_index": document["_index"],
+                "_id": document["_id"],
+                "doc": {TITLE_INITIAL_FIELD: title_initial(document["_source"].get("title"))},
+            }
+            for document in documents
+        )
+        updated = 0
+        for ok, item in helpers.streaming_bulk(es, actions, chunk_size=options["batch_size"], raise_on_error=False):
+            if ok:
+                updated += 1
+            else:
+                self.stderr.write(f"Failed to update {item}")
+        es.indices.refresh(index=index)
+        self.stdout.write(f"{index}: set {TITLE_INITIAL_FIELD} on {updated} documents")
+        if not settings.CATALOG_PAGINATION["TITLE_INITIAL"]:
+            self.stdout.write("Set CATALOG_TITLE_INITIAL=true to browse the catalog by title_initial")
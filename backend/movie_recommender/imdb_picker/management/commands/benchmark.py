@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_picker.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = "Run a benchmark scenario. Use --list to see the scenarios and their params."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", nargs="?")
+        parser.add_argument(
+            "--param", action="append", default=[], metavar="KEY=VALUE",
+            help="Scenario parameter, can be repeated.",
+        )
+        parser.add_argument("--list", action="store_true", help="List the available scenarios.")
+
+    def handle(self, *args, **options):
+        if options["list"] or not options["scenario"]:
+            for name, func in sorted(SCENARIOS.items()):
+                self.stdout.write(f"{name}: {func.help}")
+            return
+        try:
+            func = SCENARIOS[options["scenario"]]
+        except KeyError:
+            raise CommandError(f"Unknown scenario '{options['scenario']}', use --list")
+        params = {}
+        for param in options["param"]:
+            key, sep, value = param.partition("=")
+            if not sep:
+                raise CommandError(f"Invalid --param '{param}', expected KEY=VALUE")
+            params[key] = value
+        func(params, self.stdout.write)
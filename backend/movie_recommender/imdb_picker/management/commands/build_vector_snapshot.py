@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_picker.ann import build_vector_snapshot
+from imdb_picker.utils import ElasticsearchUtils
+from imdb_picker.views import INDEX_NAME
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the memory-mapped vector snapshot of the current generation of the movies index, "
+        "used by the workers for similar movies when VECTOR_SNAPSHOT_ENABLED is set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", default=INDEX_NAME, help="Index or alias to snapshot.")
+        parser.add_argument("--dtype", default=settings.VECTOR_SNAPSHOT["DTYPE"], choices=["float16", "float32"])
+        parser.add_argument("--output", default=settings.VECTOR_SNAPSHOT["PATH"], help="Root directory of the snapshots.")
+
+    def handle(self, *args, **options):
+        utils = ElasticsearchUtils(index_name=options["index"])
+        generation = utils.index_generation()
+        if generation is None:
+            raise CommandError(f"Cannot resolve the generation of '{options['index']}'")
+        try:
+            path = build_vector_snapshot(utils.es, options["index"], generation, options["output"], options["dtype"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Wrote the snapshot of {generation} to {path}")
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_picker.ann import VectorIndex, snapshot_dir
+from imdb_picker.utils import ElasticsearchUtils
+from imdb_picker.views import INDEX_NAME
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute the similar movies of every movie of the vector snapshot of the current index "
+        "generation (see build_vector_snapshot), so that movie_info serves them with a single mget."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", default=INDEX_NAME)
+        parser.add_argument("--k", type=int, default=10, help="Similar movies stored per movie.")
+        parser.add_argument("--candidates", type=int, default=100, help="Nearest movies ranked per movie.")
+        parser.add_argument("--block-size", type=int, default=256, help="Movies scored per matrix multiply.")
+        parser.add_argument("--workers", type=int, help="Threads, defaults to the number of cores.")
+
+    def handle(self, *args, **options):
+        generation = ElasticsearchUtils(index_name=options["index"]).index_generation()
+        if generation is None:
+            raise CommandError(f"Cannot resolve the generation of '{options['index']}'")
+        path = snapshot_dir(generation)
+        try:
+            vector_index = VectorIndex(path)
+        except FileNotFoundError:
+            raise CommandError(f"No vector snapshot of {generation} in {path}, run build_vector_snapshot first")
+        started = time.perf_counter()
+        vector_index.compute_neighbours(
+            k=options["k"], candidates=options["candidates"],
+            block_size=options["block_size"], workers=options["workers"],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Computed {options['k']} similar movies for {len(vector_index)} movies of {generation} "
+            f"in {elapsed:.1f}s ({len(vector_index) / elapsed:.0f} movies/s)"
+        )
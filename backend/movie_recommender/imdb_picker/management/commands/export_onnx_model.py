@@ -0,0 +1,119 @@
+import json
+import os
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_picker.embeddings import (
+    ONNX_CONFIG_FILE,
+    ONNX_MODEL_FILE,
+    ONNX_QUANTIZED_MODEL_FILE,
+    EmbeddingModelRegistry,
+    OnnxEmbeddingBackend,
+)
+
+PARITY_SENTENCES = [
+    "space movies",
+    "christopher nolan",
+    "A hobbit sets out to destroy a powerful ring.",
+    "romantic comedy set in paris",
+    "horror",
+    "Two imprisoned men bond over a number of years, finding solace and eventual redemption through acts of common decency.",
+    "animated movies for kids about talking animals",
+    "Le fabuleux destin d'Amélie Poulain",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Export an embedding model to ONNX (optionally with a dynamically int8 quantized copy) "
+        "and check that its vectors match the torch model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default="default", help="Key of the model in settings.EMBEDDING_MODELS.")
+        parser.add_argument("--output", help="Output directory, defaults to the model's onnx_path setting.")
+        parser.add_argument("--quantize", action="store_true", help="Also write a dynamically int8 quantized model.")
+        parser.add_argument("--opset", type=int, default=14)
+        parser.add_argument(
+            "--min-cosine", type=float, default=0.99,
+            help="Fail if any parity sentence has a lower cosine similarity to the torch vector.",
+        )
+        parser.add_argument(
+            "--min-cosine-int8", type=float, default=0.97,
+            help="Same as --min-cosine for the quantized model, which loses some precision.",
+        )
+        parser.add_argument("--skip-parity", action="store_true")
+
+    def handle(self, *args, **options):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        config = EmbeddingModelRegistry.model_config(options["model"])
+        output = options["output"] or config["onnx_path"]
+        if not output:
+            raise CommandError("No output directory given and the model has no onnx_path setting.")
+        os.makedirs(output, exist_ok=True)
+
+        model = SentenceTransformer(config["name"], revision=config["revision"], device="cpu")
+        model.eval()
+        transformer = model[0].auto_model
+        tokenizer = model.tokenizer
+
+        # export the transformer only, pooling and normalization are done by the backend
+        dummy = tokenizer(["export the model"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        model_path = os.path.join(output, ONNX_MODEL_FILE)
+        with torch.no_grad():
+            torch.onnx.export(
+                transformer,
+                tuple(dummy[name] for name in input_names),
+                model_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=options["opset"],
+            )
+        tokenizer.save_pretrained(output)
+
+        export_config = {
+            "model": config["name"],
+            "revision": config["revision"],
+            "max_seq_length": model.max_seq_length,
+            "pad_token_id": tokenizer.pad_token_id or 0,
+            "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        }
+        with open(os.path.join(output, ONNX_CONFIG_FILE), "w") as f:
+            json.dump(export_config, f, indent=2)
+        self.stdout.write(f"Wrote {model_path}")
+
+        if options["quantize"]:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantized_path = os.path.join(output, ONNX_QUANTIZED_MODEL_FILE)
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+            self.stdout.write(f"Wrote {quantized_path}")
+
+        if options["skip_parity"]:
+            return
+        reference = model.encode(PARITY_SENTENCES)
+        for quantized in ([False, True] if options["quantize"] else [False]):
+            backend = OnnxEmbeddingBackend({**config, "onnx_path": output, "quantized": quantized})
+            similarities = self.cosine_similarities(reference, backend.encode(PARITY_SENTENCES))
+            label = "int8" if quantized else "fp32"
+            self.stdout.write(
+                f"Parity {label}: min cosine {similarities.min():.5f}, mean cosine {similarities.mean():.5f}"
+            )
+            min_cosine = options["min_cosine_int8"] if quantized else options["min_cosine"]
+            if similarities.min() < min_cosine:
+                raise CommandError(
+                    f"ONNX {label} vectors differ from torch: min cosine {similarities.min():.5f} < {min_cosine}"
+                )
+
+    @staticmethod
+    def cosine_similarities(a, b):
+        a = a / np.linalg.norm(a, axis=1, keepdims=True)
+        b = b / np.linalg.norm(b, axis=1, keepdims=True)
+        return (a * b).sum(axis=1)
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_picker.embeddings import EmbeddingModelRegistry
+from imdb_picker.es_client import get_elasticsearch_client
+from imdb_picker.index_lifecycle import write_index
+from imdb_picker.ingestion import ensure_movie_index, ingest_movies
+from imdb_picker.views import INDEX_NAME
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed and index a movie dump (CSV or JSON lines): the embeddings are computed in batches on a "
+        "pool of processes and written with parallel bulk requests. Interrupted runs resume from the "
+        "checkpoint written next to the dump, and retry the rows that failed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Path of the .csv or .jsonl movie dump.")
+        parser.add_argument(
+            "--index", help="Generation index to fill, created if missing. Defaults to the index behind the alias."
+        )
+        parser.add_argument("--model", help="Key of the model in settings.EMBEDDING_MODELS, defaults to the index's model.")
+        parser.add_argument("--workers", type=int, default=2, help="Embedding processes, 0 to embed in this process.")
+        parser.add_argument("--embed-batch-size", type=int, default=512, help="Documents sent to a worker at once.")
+        parser.add_argument("--encode-batch-size", type=int, default=64, help="Batch size of the model.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Documents per bulk request.")
+        parser.add_argument("--thread-count", type=int, default=4, help="Concurrent bulk requests.")
+        parser.add_argument("--queue-size", type=int, default=4, help="Bulk chunks prepared ahead.")
+        parser.add_argument("--checkpoint", help="Checkpoint file, defaults to <source>.<index>.checkpoint.json.")
+        parser.add_argument("--checkpoint-every", type=int, default=10000)
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint.")
+
+    def handle(self, *args, **options):
+        es = get_elasticsearch_client()
+        try:
+            index = write_index(es, options["index"])
+            ensure_movie_index(es, index)
+        except ValueError as e:
+            raise CommandError(str(e))
+        model_key = options["model"] or EmbeddingModelRegistry.model_key_for_index(options["index"] or INDEX_NAME)
+        checkpoint = options["checkpoint"] or f"{options['source']}.{index}.checkpoint.json"
+
+        def report(progress):
+            self.stdout.write(
+                f"rows={progress['rows']} indexed={progress['indexed']} failed={progress['failed']} "
+                f"{progress['docs_per_second']:.1f} docs/s"
+            )
+
+        try:
+            result = ingest_movies(
+                es, options["source"], index,
+                model_key=model_key,
+                workers=options["workers"],
+                embed_batch_size=options["embed_batch_size"],
+                encode_batch_size=options["encode_batch_size"],
+                chunk_size=options["chunk_size"],
+                thread_count=options["thread_count"],
+                queue_size=options["queue_size"],
+                checkpoint_path=checkpoint,
+                checkpoint_every=options["checkpoint_every"],
+                restart=options["restart"],
+                report=report,
+            )
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        for error in result["errors"]:
+            self.stderr.write(f"Failed: {error}")
+        if result["resumed_from"]:
+            self.stdout.write(f"Resumed from row {result['resumed_from']} ({checkpoint})")
+        es.indices.refresh(index=index)
+        self.stdout.write(
+            f"{index}: indexed {result['indexed']} documents ({result['failed']} failed) in "
+            f"{result['elapsed']:.1f}s, {result['docs_per_second']:.1f} docs/s"
+        )
+        if not result["done"]:
+            self.stdout.write(f"Run the command again to retry the {result['failed']} failed rows ({checkpoint})")
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_picker.es_client import get_elasticsearch_client
+from imdb_picker.index_lifecycle import write_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Make sure the movies index has a poster_path.keyword subfield for exact lookups: "
+        "add it to the mapping if missing and reindex the documents in place to populate it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", help="Generation index to update, defaults to the index behind the alias.")
+        parser.add_argument("--force", action="store_true", help="Reindex even if the subfield already exists.")
+        parser.add_argument("--no-wait", action="store_true", help="Return the task id instead of waiting.")
+
+    def handle(self, *args, **options):
+        es = get_elasticsearch_client()
+        try:
+            index = write_index(es, options["index"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        mappings = es.indices.get_mapping(index=index)
+        for index_name, mapping in mappings.items():
+            poster_path = mapping["mappings"].get("properties", {}).get("poster_path")
+            if poster_path is None:
+                raise CommandError(f"Index '{index_name}' has no poster_path field")
+            if poster_path.get("type") == "keyword":
+                self.stdout.write(f"{index_name}: poster_path is already a keyword field, use it directly")
+                continue
+            if "keyword" in poster_path.get("fields", {}) and not options["force"]:
+                self.stdout.write(f"{index_name}: poster_path.keyword already exists")
+                continue
+
+            # adding a multi-field to an existing text field is allowed by the put mapping API,
+            # existing documents only get it once they are indexed again
+            fields = dict(poster_path.get("fields", {}))
+            fields["keyword"] = {"type": "keyword", "ignore_above": 256}
+            es.indices.put_mapping(index=index_name, properties={
+                "poster_path": {**poster_path, "fields": fields},
+            })
+            self.stdout.write(f"{index_name}: added poster_path.keyword to the mapping")
+
+            response = es.update_by_query(
+                index=index_name,
+                conflicts="proceed",
+                refresh=True,
+                wait_for_completion=not options["no_wait"],
+            )
+            if options["no_wait"]:
+                self.stdout.write(f"{index_name}: reindexing in task {response['task']}")
+            else:
+                self.stdout.write(f"{index_name}: reindexed {response['updated']} documents")
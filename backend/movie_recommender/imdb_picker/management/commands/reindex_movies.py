@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from imdb_picker import index_lifecycle
+from imdb_picker.es_client import get_elasticsearch_client
+from imdb_picker.index_template import TEMPLATE_VERSION, install_movie_index_template
+from imdb_picker.ingestion import ingest_movies
+
+
+class Command(BaseCommand):
+    help = (
+        "Build a new generation of the movies index (movies_vN) from a dump or from the index currently "
+        "behind the alias, force-merge and warm it, then switch the read alias to it atomically and "
+        "delete old generations. --switch-to only moves the alias (adopting an existing index or rolling back)."
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument("--from-dump", help="Ingest this CSV/JSON lines dump (see ingest_movies).")
+        source.add_argument("--from-index", help="Copy this index with the reindex API, defaults to the alias.")
+        source.add_argument("--switch-to", help="Only point the alias at this existing index.")
+        parser.add_argument("--alias", default=settings.MOVIES_INDEX["ALIAS"])
+        parser.add_argument("--shards", type=int, help="Primary shards of the new generation.")
+        parser.add_argument("--replicas", type=int, default=settings.MOVIES_INDEX["REPLICAS"])
+        parser.add_argument("--workers", type=int, default=2, help="Embedding processes for --from-dump.")
+        parser.add_argument("--no-warm-up", action="store_true")
+        parser.add_argument("--no-switch", action="store_true", help="Build and warm the generation but keep the alias.")
+        parser.add_argument("--keep", type=int, default=settings.MOVIES_INDEX["KEEP_GENERATIONS"],
+                            help="Generations to keep, including the live one.")
+
+    def handle(self, *args, **options):
+        es = get_elasticsearch_client()
+        alias = options["alias"]
+
+        if options["switch_to"]:
+            self.switch(es, options["switch_to"], alias)
+            return
+
+        source_index = options["from_index"]
+        if not options["from_dump"] and not source_index:
+            if not index_lifecycle.alias_targets(es, alias):
+                raise CommandError(f"Alias '{alias}' does not exist yet: use --from-dump, --from-index or --switch-to")
+            source_index = alias
+
+        install_movie_index_template(es)
+        index = index_lifecycle.next_generation(es)
+        index_lifecycle.create_generation(es, index, shards=options["shards"])
+        self.stdout.write(f"Created {index} from template version {TEMPLATE_VERSION} (refresh disabled, no replicas)")
+
+        if options["from_dump"]:
+            result = ingest_movies(
+                es, options["from_dump"], index, workers=options["workers"], checkpoint_path=None,
+                report=lambda progress: self.stdout.write(
+                    f"  rows={progress['rows']} {progress['docs_per_second']:.1f} docs/s"
+                ),
+            )
+            self.stdout.write(f"Indexed {result['indexed']} documents ({result['failed']} failed)")
+        else:
+            response = es.options(request_timeout=3600).reindex(
+                source={"index": source_index}, dest={"index": index}, script=index_lifecycle.DERIVED_FIELDS_SCRIPT,
+                wait_for_completion=True, refresh=False,
+            )
+            self.stdout.write(f"Copied {response['created']} documents from {source_index}")
+
+        index_lifecycle.finalize_generation(es, index, replicas=options["replicas"])
+        self.stdout.write(f"Force-merged {index} and restored {options['replicas']} replica(s)")
+
+        if not options["no_warm_up"]:
+            failures = index_lifecycle.warm_up_generation(index)
+            if failures:
+                raise CommandError(f"{failures} warm up queries or catalog checks failed on {index}, the alias was not switched")
+            self.stdout.write(f"Warmed up {index}")
+
+        if settings.VECTOR_SNAPSHOT["ENABLED"]:
+            # before the switch, so that workers find it as soon as they see the new generation
+            call_command("build_vector_snapshot", index=index, stdout=self.stdout)
+
+        if options["no_switch"]:
+            self.stdout.write(f"Not switching: run reindex_movies --switch-to {index} to serve it")
+            return
+        self.switch(es, index, alias)
+        deleted = index_lifecycle.collect_garbage(es, keep=options["keep"], alias=alias)
+        if deleted:
+            self.stdout.write(f"Deleted old generations: {', '.join(deleted)}")
+
+    def switch(self, es, index, alias):
+        if not es.indices.exists(index=index):
+            raise CommandError(f"Index '{index}' does not exist")
+        try:
+            previous = index_lifecycle.switch_alias(es, index, alias)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Alias '{alias}': {', '.join(previous) or '(none)'} -> {index}")
+        # an adopted index may predate the derived fields: the catalog and the genre filters would be empty
+        for field, count in index_lifecycle.missing_derived_fields(es, index).items():
+            self.stderr.write(f"{count} documents of {index} have no {field}: run backfill_{field} --index {index}")
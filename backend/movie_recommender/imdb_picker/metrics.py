@@ -0,0 +1,52 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Exported through the django_prometheus /metrics endpoint (the default registry,
+# aggregated over the gunicorn workers when prometheus_multiproc_dir is set).
+
+CACHE_HITS = Counter(
+    "moviesense_cache_hits_total",
+    "Number of cache hits",
+    ["cache", "tier"],
+)
+CACHE_MISSES = Counter(
+    "moviesense_cache_misses_total",
+    "Number of cache misses",
+    ["cache", "tier"],
+)
+CACHE_EVICTIONS = Counter(
+    "moviesense_cache_evictions_total",
+    "Number of entries evicted from a cache because of its size limit or TTL",
+    ["cache", "tier", "reason"],
+)
+
+EMBEDDING_QUEUE_DEPTH = Gauge(
+    "moviesense_embedding_queue_depth",
+    "Number of texts waiting in the embedding batcher queue",
+    ["model"],
+    multiprocess_mode="livesum",
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "moviesense_embedding_batch_size",
+    "Number of texts encoded per batched forward pass",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+EMBEDDING_QUEUE_WAIT = Histogram(
+    "moviesense_embedding_queue_wait_seconds",
+    "Time a text spent in the embedding batcher queue before being encoded",
+    ["model"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+HYBRID_SEARCH_FALLBACKS = Counter(
+    "moviesense_hybrid_search_fallbacks_total",
+    "Number of hybrid searches served lexical only, because the query embedding missed its budget, failed or was rejected (overloaded), or the kNN search failed (search)",
+    ["reason"],
+)
+
+STAGE_DURATION = Histogram(
+    "moviesense_request_stage_seconds",
+    "Duration of the stages of an endpoint (Elasticsearch round-trips, embedding, ...)",
+    ["endpoint", "stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
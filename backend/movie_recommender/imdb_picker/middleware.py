@@ -0,0 +1,69 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+def accepted_encodings(header):
+    """The codings of an Accept-Encoding header with a non-zero quality."""
+    codings = set()
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        codings.add(coding.strip().lower())
+    return codings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress API responses with brotli (when installed and accepted) or gzip.
+    Only responses of settings.RESPONSE_COMPRESSION["PATH_PREFIXES"] with one of
+    its CONTENT_TYPES and at least MIN_SIZE bytes are compressed: small payloads
+    gain nothing and pay the CPU. The levels favour speed over ratio, the JSON
+    arrays compress well even at low levels.
+    """
+    def process_response(self, request, response):
+        config = settings.RESPONSE_COMPRESSION
+        if (
+            not config["ENABLED"]
+            or response.streaming
+            or response.status_code != 200
+            or response.has_header("Content-Encoding")
+            or not request.path.startswith(tuple(config["PATH_PREFIXES"]))
+            or response.get("Content-Type", "").split(";")[0].strip() not in config["CONTENT_TYPES"]
+        ):
+            return response
+        # the payload depends on Accept-Encoding even when it is not compressed
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < config["MIN_SIZE"]:
+            return response
+
+        codings = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        if brotli is not None and "br" in codings:
+            content, encoding = brotli.compress(response.content, quality=config["BROTLI_QUALITY"]), "br"
+        elif "gzip" in codings:
+            content, encoding = gzip.compress(response.content, compresslevel=config["GZIP_LEVEL"], mtime=0), "gzip"
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = encoding
+        # the compressed bytes differ from the ones the ETag was computed on
+        if response.has_header("ETag") and not response["ETag"].startswith("W/"):
+            response["ETag"] = "W/" + response["ETag"]
+        return response
@@ -0,0 +1,172 @@
+import datetime
+import hashlib
+import re
+import threading
+
+import numpy as np
+from django.conf import settings
+
+# Application side ranking of similar movie candidates. The candidates come
+# from the Elasticsearch kNN query or from the in-process vector index, as a
+# dict of NumPy arrays (one value per candidate):
+#   similarity    cosine similarity to the movie
+#   imdb_rating, vote_average, popularity, release_year   NaN when missing
+#   vectors       (optional) normalized embeddings, for MMR diversity
+#   seed          the stable seed of the movie (stable_seed)
+# A candidate's score is its similarity, mapped from [-1, 1] to [0, 1] so that
+# a boost never lowers a candidate, multiplied by the factor of every
+# configured feature (settings.SIMILAR_MOVIES_RANKING). Everything is a pure
+# function of the candidates and of the Reranker (its reference year, like the
+# seed, is fixed), so every worker returns the same order and the results can
+# be cached.
+
+# fields of the documents the features are computed from
+FEATURE_SOURCE_FIELDS = ["imdb_rating", "vote_average", "popularity", "release_date"]
+
+RANKING_FEATURES = {}
+
+
+def ranking_feature(name):
+    """Register a feature: a function (candidates, **params) -> factor per candidate."""
+    def register(func):
+        RANKING_FEATURES[name] = func
+        return func
+    return register
+
+
+def stable_seed(key):
+    """
+    Seed derived from ``key`` that is the same in every process. The builtin
+    hash() of a str is salted per process (PYTHONHASHSEED), so gunicorn workers
+    would disagree on it.
+    """
+    return int.from_bytes(hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def release_year(value):
+    """Year of a release date such as "1999-03-31", NaN if there is none."""
+    match = re.match(r"\s*(\d{4})", str(value or ""))
+    return float(match.group(1)) if match else np.nan
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def candidate_features(sources):
+    """Feature arrays of candidates from their _source documents."""
+    return {
+        "imdb_rating": np.array([_as_float(source.get("imdb_rating")) for source in sources]),
+        "vote_average": np.array([_as_float(source.get("vote_average")) for source in sources]),
+        "popularity": np.array([_as_float(source.get("popularity")) for source in sources]),
+        "release_year": np.array([release_year(source.get("release_date")) for source in sources]),
+    }
+
+
+@ranking_feature("rating")
+def rating_boost(candidates, threshold=7.0, boost=1.5):
+    """``boost`` for movies rated ``threshold`` or more (imdb_rating, else vote_average)."""
+    rating = np.where(np.isnan(candidates["imdb_rating"]), candidates["vote_average"], candidates["imdb_rating"])
+    return np.where(np.nan_to_num(rating) >= threshold, boost, 1.0)
+
+
+@ranking_feature("popularity")
+def popularity_boost(candidates, factor=0.3):
+    """1 + log1p(factor x popularity): grows slowly, 1 for unknown popularity."""
+    return 1.0 + np.log1p(factor * np.clip(np.nan_to_num(candidates["popularity"]), 0, None))
+
+
+@ranking_feature("recency")
+def recency_boost(candidates, weight=0.0, half_life_years=10.0):
+    """1 + weight for a movie of the reference year, halved every ``half_life_years``; 1 for unknown dates."""
+    age = np.clip(candidates["reference_year"] - candidates["release_year"], 0, None)
+    return 1.0 + weight * np.nan_to_num(np.exp2(-age / half_life_years))
+
+
+@ranking_feature("random")
+def random_jitter(candidates, weight=0.0):
+    """1 + weight x uniform noise, seeded by the movie: varied but identical in every worker."""
+    return 1.0 + weight * np.random.default_rng(candidates["seed"]).random(len(candidates["similarity"]))
+
+
+def top_k(scores, k):
+    """Return the indices of the ``k`` highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def maximal_marginal_relevance(scores, vectors, k, diversity_lambda):
+    """
+    Pick ``k`` candidates greedily, trading relevance (``scores``) for novelty:
+    lambda x relevance - (1 - lambda) x highest similarity to the picked ones.
+    """
+    k = min(k, len(scores))
+    spread = scores.max() - scores.min()
+    relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+    similarities = vectors @ vectors.T
+    picked = []
+    redundancy = np.zeros(len(scores))
+    available = np.ones(len(scores), dtype=bool)
+    for _ in range(k):
+        mmr = np.where(available, diversity_lambda * relevance - (1 - diversity_lambda) * redundancy, -np.inf)
+        best = int(np.argmax(mmr))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarities[best])
+    return np.array(picked, dtype=np.int64)
+
+
+class Reranker:
+    """
+    Ranks candidates with a list of features (names of RANKING_FEATURES and
+    their parameters) and optional MMR diversity (``diversity_lambda`` < 1).
+    The recency of a movie is measured at ``reference_year``, the current year
+    when the Reranker is built by default.
+    """
+    def __init__(self, features, diversity_lambda=1.0, reference_year=None):
+        self.features = [
+            (RANKING_FEATURES[feature["name"]], {key: value for key, value in feature.items() if key != "name"})
+            for feature in features
+        ]
+        self.diversity_lambda = diversity_lambda
+        self.reference_year = reference_year or datetime.date.today().year
+
+    @property
+    def needs_vectors(self):
+        return self.diversity_lambda < 1.0
+
+    def scores(self, candidates):
+        # cosine and dot_product similarities are in [-1, 1]: a boost must not push a negative one further down
+        scores = (1.0 + np.asarray(candidates["similarity"], dtype=np.float64)) / 2
+        candidates = {**candidates, "reference_year": self.reference_year}
+        for feature, params in self.features:
+            scores *= feature(candidates, **params)
+        return scores
+
+    def rank(self, candidates, k):
+        """Return the indices of the ``k`` best candidates, best first."""
+        scores = self.scores(candidates)
+        if self.needs_vectors and candidates.get("vectors") is not None and len(scores):
+            return maximal_marginal_relevance(scores, np.asarray(candidates["vectors"], dtype=np.float32), k, self.diversity_lambda)
+        return top_k(scores, k)
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Return the Reranker configured by settings.SIMILAR_MOVIES_RANKING."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                config = settings.SIMILAR_MOVIES_RANKING
+                _reranker = Reranker(config["FEATURES"], config["DIVERSITY_LAMBDA"], config.get("REFERENCE_YEAR"))
+    return _reranker
@@ -21,3 +21,66 @@ class MovieData2Serializer(serializers.Serializer):
     vote_average = serializers.FloatField(required=False)
     movie_title = serializers.CharField(source="title", required=False)
     vote_count = serializers.IntegerField(required=False)
+
+
+class CompactMovieSerializer:
+    """
+    Read-only twin of MovieData2Serializer for search results: the same output
+    (declared fields only, ``title`` as ``movie_title``, missing fields left out,
+    None kept) from plain dict operations, without the per-field and per-element
+    overhead of a DRF Serializer. The fields are derived from MovieData2Serializer
+    so that both stay in sync.
+    """
+    # DRF field class -> plain conversion with the same result as its to_representation
+    CONVERSIONS = {
+        serializers.CharField: str,
+        serializers.FloatField: float,
+        serializers.IntegerField: int,
+    }
+
+    def __init__(self, serializer_class=MovieData2Serializer):
+        # (source field, output name, conversion)
+        self.fields = [
+            (field.source, name, self.conversion(field)) for name, field in serializer_class().fields.items()
+        ]
+        self.sources = {name: source for source, name, _ in self.fields}
+
+    @classmethod
+    def conversion(cls, field):
+        if isinstance(field, serializers.ListField) and type(field.child) in cls.CONVERSIONS:
+            convert = cls.CONVERSIONS[type(field.child)]
+            return lambda values: [convert(value) for value in values]
+        return cls.CONVERSIONS.get(type(field), field.to_representation)
+
+    def source_fields(self, names):
+        """
+        The _source fields to fetch for output ``names`` (the ``fields=`` projection).
+        Raises:
+            ValueError: A name is not a field of the serializer.
+        """
+        unknown = [name for name in names if name not in self.sources]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(self.sources)}")
+        return [self.sources[name] for name in names]
+
+    def to_representation(self, movie, names=None):
+        data = {}
+        for source, name, convert in self.fields:
+            if source in movie and (names is None or name in names):
+                value = movie[source]
+                data[name] = None if value is None else convert(value)
+        return data
+
+    def many(self, movies, names=None):
+        """Serialize a list of _source documents, keeping only the output ``names`` if given."""
+        names = set(names) if names else None
+        return [self.to_representation(movie, names) for movie in movies]
+
+
+compact_movie_serializer = CompactMovieSerializer()
+
+
+def requested_fields(params):
+    """The output field names of the ``fields=a,b`` projection of a request, None without one."""
+    names = [name.strip() for name in params.get("fields", "").split(",") if name.strip()]
+    return list(dict.fromkeys(names)) or None
@@ -0,0 +1,171 @@
+import threading
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+from django.conf import settings
+from elasticsearch import helpers
+
+from .caching import LRUTTLCache
+from .catalog import LATIN_LETTERS
+
+# In-process autocomplete index of the titles, actors and directors of the
+# catalog. Every word start of a normalized text is a key ("the dark knight",
+# "dark knight", "knight") and the keys are kept in one sorted list, so the
+# completions of a prefix are a contiguous range found with two binary
+# searches, ranked by weight (movie popularity; for people, the summed
+# popularity of their movies) with NumPy over the range. The top suggestions of
+# a prefix are cached: the short prefixes, whose ranges are the largest, are
+# also the most typed.
+
+SUGGEST_SOURCE_FIELDS = ["title", "actors", "directors", "poster_path", "popularity"]
+SUGGESTION_TYPES = ("title", "actor", "director")
+# weight factor of a suggestion whose text starts with the prefix, over a match on a later word
+START_BOOST = 2.0
+# the end of every key range: sorts after any character of a normalized key
+_MAX_CHAR = "\U0010ffff"
+
+
+def normalize(text):
+    """Casefold ``text``, strip accents and replace punctuation by spaces ("Amélie!" -> "amelie")."""
+    chars = []
+    for char in unicodedata.normalize("NFKD", text or ""):
+        if unicodedata.combining(char):
+            continue
+        char = LATIN_LETTERS.get(char, LATIN_LETTERS.get(char.upper(), char))
+        chars.append(char.casefold() if char.isalnum() else " ")
+    return " ".join("".join(chars).split())
+
+
+def names(value, limit=None):
+    """People of an actors/directors field, a list or a comma separated string."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    people = [name.strip() for name in value if isinstance(name, str) and name.strip()]
+    return people[:limit] if limit else people
+
+
+def word_starts(key):
+    """Offsets of the words of a normalized text."""
+    return [0] + [offset + 1 for offset, char in enumerate(key) if char == " "]
+
+
+class SuggestIndex:
+    """
+    Sorted prefix index over suggestions.
+    Args:
+        suggestions (list): dicts with "text", "type" (SUGGESTION_TYPES), "weight"
+            and optional extra fields (poster_path) returned as is.
+    """
+    def __init__(self, suggestions, cache_entries=4096):
+        self.suggestions = suggestions
+        pairs = sorted(
+            (text[offset:], number, offset)
+            for number, text in enumerate(normalize(suggestion["text"]) for suggestion in suggestions)
+            for offset in word_starts(text)
+        )
+        self.keys = [key for key, _, _ in pairs]
+        self.numbers = np.array([number for _, number, _ in pairs], dtype=np.int32)
+        self.at_start = np.array([offset == 0 for _, _, offset in pairs], dtype=bool)
+        self.weights = np.array([suggestion["weight"] for suggestion in suggestions], dtype=np.float64)
+        self.types = np.array([SUGGESTION_TYPES.index(suggestion["type"]) for suggestion in suggestions], dtype=np.int8)
+        self.cache = LRUTTLCache(cache_entries, 24 * 3600, name="suggest")
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def _rank(self, prefix, types):
+        low = bisect_left(self.keys, prefix)
+        high = bisect_left(self.keys, prefix + _MAX_CHAR, low)
+        numbers = self.numbers[low:high]
+        scores = self.weights[numbers] * np.where(self.at_start[low:high], START_BOOST, 1.0)
+        if types:
+            wanted = np.isin(self.types[numbers], [SUGGESTION_TYPES.index(kind) for kind in types])
+            numbers, scores = numbers[wanted], scores[wanted]
+        # best first, ties in catalog order; a text matching on several words keeps its best key
+        numbers = numbers[np.lexsort((numbers, -scores))]
+        _, first = np.unique(numbers, return_index=True)
+        best = numbers[np.sort(first)[:settings.SUGGEST["MAX_SIZE"]]]
+        return [self.suggestions[number] for number in best]
+
+    def suggest(self, prefix, size=10, types=None):
+        """
+        Return the ``size`` best suggestions completing ``prefix``.
+        Args:
+            types (tuple): Only return these SUGGESTION_TYPES, all if empty.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        key = (prefix, tuple(sorted(types or ())))
+        ranked = self.cache.get(key)
+        if ranked is None:
+            ranked = self._rank(prefix, types)
+            self.cache.set(key, ranked)
+        return ranked[:size]
+
+
+def suggestions_from_documents(documents, max_names=None):
+    """
+    Suggestions of an iterable of movie _source documents: one per title (remakes
+    keep their own poster), one per actor or director, weighted by popularity.
+    """
+    suggestions = []
+    people = {}
+    for document in documents:
+        popularity = _popularity(document.get("popularity"))
+        if document.get("title"):
+            suggestions.append({
+                "text": document["title"], "type": "title", "weight": popularity,
+                "poster_path": document.get("poster_path"),
+            })
+        for field, kind in (("actors", "actor"), ("directors", "director")):
+            for name in names(document.get(field), max_names):
+                person = people.setdefault((kind, name), {"text": name, "type": kind, "weight": 0.0})
+                person["weight"] += popularity
+    suggestions.extend(people.values())
+    return suggestions
+
+
+def _popularity(value):
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def build_suggest_index(es, index):
+    """Build the SuggestIndex of ``index`` with a scan of its titles and people."""
+    documents = (
+        hit["_source"]
+        for hit in helpers.scan(es, index=index, size=2000, query={"_source": SUGGEST_SOURCE_FIELDS})
+    )
+    config = settings.SUGGEST
+    return SuggestIndex(
+        suggestions_from_documents(documents, config["MAX_NAMES_PER_MOVIE"]),
+        cache_entries=config["CACHE_ENTRIES"],
+    )
+
+
+_suggest_indexes = {}
+_suggest_indexes_lock = threading.Lock()
+
+
+def get_suggest_index(generation, build):
+    """
+    Return the SuggestIndex of an index generation in this process, calling
+    ``build()`` the first time. Requests arriving during the build wait for it
+    instead of building their own.
+    """
+    suggest_index = _suggest_indexes.get(generation)
+    if suggest_index is not None:
+        return suggest_index
+    with _suggest_indexes_lock:
+        if generation not in _suggest_indexes:
+            suggest_index = build()
+            # one generation at a time: drop the index of the previous generation
+            _suggest_indexes.clear()
+            _suggest_indexes[generation] = suggest_index
+    return _suggest_indexes[generation]
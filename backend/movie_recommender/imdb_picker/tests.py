@@ -1,3 +1,1296 @@
-from django.test import TestCase
+import asyncio
+import fnmatch
+import gzip
+import importlib.util
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core import signing
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from elastic_transport import ApiResponseMeta, AsyncTransport, ConnectionTimeout, HttpHeaders, NodeConfig, Transport
+from elastic_transport import ConnectionError as TransportConnectionError
+from elasticsearch import NotFoundError
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from movie_recommender import logs
+
+from . import ann, async_views, es_client, index_lifecycle, ingestion, middleware, renderers, views
+from .batching import BackgroundEmbedder, EmbeddingBatcher, EmbeddingQueueFull
+from .caching import LocalRedis, LRUTTLCache, QueryEmbeddingCache, ResponseCache, SharedCacheTier
+from .catalog import DIGITS_BUCKET, OTHER_BUCKET, catalog_bucket, title_initial
+from .embeddings import EmbeddingModelRegistry, OnnxEmbeddingBackend, TorchEmbeddingBackend
+from .facets import facet_counts, filter_clauses, filter_key, knn_limits, search_filters
+from .fusion import fuse, hybrid_search_options
+from .ranking import Reranker, candidate_features, stable_seed
+from .serializers import MovieData2Serializer, compact_movie_serializer
+from .suggest import SuggestIndex, normalize, suggestions_from_documents
+from .ann import VectorIndex, build_vector_snapshot, snapshot_dir
+from .utils import MAX_SHARD_DOC, ElasticsearchUtils, MovieQueries, fuse_hybrid_results
+from .views import WATCHLIST_MAX_PAGE_SIZE, WATCHLIST_PAGE_SIZE, MovieViewSet, watchlist_page_params
+
+
+def installed(*modules):
+    return all(importlib.util.find_spec(module) is not None for module in modules)
+
+
+def cosine_similarities(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+class StubElasticsearch:
+    """
+    Elasticsearch client answering every call with ``responses[name]``, a value
+    or a function of the keyword arguments ("search", "indices.get"...), and
+    recording the calls.
+    """
+    def __init__(self, responses, prefix="", calls=None):
+        self.responses = responses
+        self.prefix = prefix
+        self.calls = [] if calls is None else calls
+
+    def __getattr__(self, name):
+        name = self.prefix + name
+        if name in ("indices", "cluster"):
+            return StubElasticsearch(self.responses, name + ".", self.calls)
+
+        def call(**kwargs):
+            self.calls.append((name, kwargs))
+            response = self.responses[name]
+            return response(**kwargs) if callable(response) else response
+        return call
+
+    def options(self, **kwargs):
+        return self
+
+    def called(self, name):
+        return [kwargs for called, kwargs in self.calls if called == name]
+
+
+class StubbedElasticsearchUtils(ElasticsearchUtils):
+    """ElasticsearchUtils on a StubElasticsearch."""
+    def __init__(self, index_name, responses):
+        super().__init__(index_name)
+        self.stub = StubElasticsearch(responses)
+
+    @property
+    def es(self):
+        return self.stub
+
+
+def generation_of(name):
+    """indices.get response of a single index ``name``."""
+    return {name: {"settings": {"index": {"uuid": name + "-uuid"}}}}
+
+
+@unittest.skipUnless(installed("torch", "sentence_transformers", "onnxruntime", "tokenizers"), "needs torch and ONNX Runtime")
+class OnnxParityTests(SimpleTestCase):
+    """The ONNX export (fp32 and int8) encodes like the torch model it was exported from."""
+    SENTENCES = [
+        "space movies",
+        "A hobbit sets out to destroy a powerful ring.",
+        "romantic comedy set in paris",
+        "Le fabuleux destin d'Amélie Poulain",
+        "horror",
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.output = tempfile.TemporaryDirectory()
+        call_command("export_onnx_model", output=cls.output.name, quantize=True, skip_parity=True, stdout=io.StringIO())
+        cls.config = {**EmbeddingModelRegistry.model_config("default"), "onnx_path": cls.output.name}
+        cls.reference = TorchEmbeddingBackend(cls.config).encode(cls.SENTENCES)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.output.cleanup()
+        super().tearDownClass()
+
+    def test_fp32_matches_torch(self):
+        vectors = OnnxEmbeddingBackend({**self.config, "quantized": False}).encode(self.SENTENCES)
+        self.assertEqual(vectors.shape, self.reference.shape)
+        self.assertGreater(cosine_similarities(self.reference, vectors).min(), 0.999)
+
+    def test_int8_close_to_torch(self):
+        vectors = OnnxEmbeddingBackend({**self.config, "quantized": True}).encode(self.SENTENCES)
+        self.assertGreater(cosine_similarities(self.reference, vectors).min(), 0.97)
+
+    def test_single_sentence_is_one_vector(self):
+        vector = OnnxEmbeddingBackend({**self.config, "quantized": False}).encode(self.SENTENCES[0])
+        self.assertEqual(vector.ndim, 1)
+        np.testing.assert_allclose(vector, self.reference[0], atol=1e-3)
+
+    def test_missing_quantized_model_is_explicit(self):
+        with tempfile.TemporaryDirectory() as empty:
+            with self.assertRaisesRegex(FileNotFoundError, "--quantize"):
+                OnnxEmbeddingBackend({**self.config, "onnx_path": empty, "quantized": True})
+
+
+class LRUTTLCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUTTLCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        cache = LRUTTLCache(max_entries=10, ttl=60)
+        cache.set("a", 1, ttl=0)
+        self.assertEqual(cache.get("a", "missing"), "missing")
+        self.assertEqual(len(cache), 0)
+
+
+class QueryEmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.shared = SharedCacheTier(LocalRedis(), ttl=60, name="query_embedding")
+
+    def cache(self):
+        # every gunicorn worker has its own local tier in front of the shared one
+        return QueryEmbeddingCache(LRUTTLCache(max_entries=10, ttl=60), self.shared)
+
+    def test_trivial_variants_share_an_entry(self):
+        cache = self.cache()
+        cache.set("Space  Movies", "model", [0.5, 0.25])
+        self.assertEqual(cache.get(" space movies ", "model"), [0.5, 0.25])
+        self.assertIsNone(cache.get("space movies", "other-model"))
+
+    def test_shared_tier_fills_other_workers(self):
+        self.cache().set("space movies", "model", [0.5, 0.25])
+        other = self.cache()
+        computed = []
+        embedding = other.get_or_compute("space movies", "model", lambda: computed.append(1))
+        self.assertEqual(embedding, [0.5, 0.25])
+        self.assertEqual(computed, [])
+        # promoted to the local tier of the other worker
+        self.assertEqual(other.local.get(other.key("space movies", "model")), [0.5, 0.25])
+
+    def test_shared_tier_errors_are_misses(self):
+        class BrokenRedis:
+            def get(self, key):
+                raise ConnectionError("down")
+
+            def set(self, key, value, ex=None):
+                raise ConnectionError("down")
+
+        cache = QueryEmbeddingCache(LRUTTLCache(max_entries=10, ttl=60), SharedCacheTier(BrokenRedis(), ttl=60))
+        self.assertEqual(cache.get_or_compute("horror", "model", lambda: [1.0]), [1.0])
+        self.assertEqual(cache.get("horror", "model"), [1.0])
+
+    def test_local_redis_expiry(self):
+        client = LocalRedis()
+        client.set("key", b"value", ex=60)
+        client.set("expired", b"value", ex=1e-9)
+        time.sleep(0.001)
+        self.assertEqual(client.get("key"), b"value")
+        self.assertIsNone(client.get("expired"))
+        self.assertEqual(client.delete("key", "missing"), 1)
+
+
+class EmbeddingBatcherTests(SimpleTestCase):
+    def test_concurrent_texts_share_a_batch(self):
+        batches = []
+
+        def encode_batch(texts):
+            batches.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+        batcher = EmbeddingBatcher(encode_batch, max_batch_size=8, max_wait=0.2, name="test-batch")
+        futures = [batcher.submit(text) for text in ["a", "bb", "ccc"]]
+        self.assertEqual([future.result(timeout=2) for future in futures], [[1.0], [2.0], [3.0]])
+        self.assertEqual(batches, [["a", "bb", "ccc"]])
+
+    def test_batches_are_capped(self):
+        batches = []
+
+        def encode_batch(texts):
+            batches.append(len(texts))
+            return [[0.0]] * len(texts)
+
+        batcher = EmbeddingBatcher(encode_batch, max_batch_size=2, max_wait=0.05, name="test-cap")
+        futures = [batcher.submit(str(number)) for number in range(5)]
+        for future in futures:
+            future.result(timeout=2)
+        self.assertLessEqual(max(batches), 2)
+        self.assertEqual(sum(batches), 5)
+
+    def test_full_queue_rejects(self):
+        release = threading.Event()
+
+        def encode_batch(texts):
+            release.wait(2)
+            return [[0.0]] * len(texts)
+
+        batcher = EmbeddingBatcher(encode_batch, max_batch_size=1, max_wait=0, max_queue_size=1, name="test-full")
+        try:
+            first = batcher.submit("running")
+            # wait for the worker to take the first text out of the queue
+            deadline = time.monotonic() + 2
+            while batcher._queue.qsize() and time.monotonic() < deadline:
+                time.sleep(0.001)
+            batcher.submit("queued")
+            with self.assertRaises(EmbeddingQueueFull):
+                batcher.submit("rejected")
+        finally:
+            release.set()
+        self.assertEqual(first.result(timeout=2), [0.0])
+
+    def test_errors_reach_every_caller(self):
+        def encode_batch(texts):
+            raise RuntimeError("model failed")
+
+        batcher = EmbeddingBatcher(encode_batch, max_wait=0.05, name="test-error")
+        futures = [batcher.submit(text) for text in ["a", "b"]]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, "model failed"):
+                future.result(timeout=2)
+
+
+class BackgroundEmbedderTests(SimpleTestCase):
+    def test_in_flight_keys_share_a_future_and_are_bounded(self):
+        release = threading.Event()
+        calls = []
+
+        def encode(query):
+            calls.append(query)
+            release.wait(2)
+            return [1.0]
+
+        embedder = BackgroundEmbedder(encode, max_workers=1, max_pending=2, name="test")
+        try:
+            first = embedder.submit("a", "a")
+            self.assertIs(embedder.submit("a", "a"), first)
+            embedder.submit("b", "b")
+            with self.assertRaises(EmbeddingQueueFull):
+                embedder.submit("c", "c")
+        finally:
+            release.set()
+        self.assertEqual(first.result(timeout=2), [1.0])
+        embedder.executor.shutdown(wait=True)
+        self.assertEqual(calls, ["a", "b"])
+        self.assertEqual(embedder.pending, {})
+
+    def test_forked_worker_starts_its_own_pool(self):
+        embedder = BackgroundEmbedder(lambda query: [1.0], max_workers=1, max_pending=1, name="test-fork")
+        self.assertIsNone(embedder.executor)
+        embedder.submit("a", "a").result(timeout=2)
+        parent_executor = embedder.executor
+        # as in a worker forked from a preloaded master, with an embedding left in flight
+        embedder._pid = -1
+        embedder.pending["stuck"] = Future()
+        self.assertEqual(embedder.submit("b", "b").result(timeout=2), [1.0])
+        self.assertIsNot(embedder.executor, parent_executor)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def test_concurrent_misses_compute_once(self):
+        cache = ResponseCache(max_bytes=10**6, ttl=60, stale_ttl=60)
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(2)
+            return {"movies": ["Alien"]}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [1])
+        self.assertEqual(len(set(etag for _, etag in results)), 1)
+
+    def test_follower_computes_when_leader_is_stuck(self):
+        cache = ResponseCache(max_bytes=10**6, ttl=60, stale_ttl=60, wait_timeout=0.05)
+        release = threading.Event()
+        leader = threading.Thread(target=cache.get_or_compute, args=("key", lambda: release.wait(2) and {"by": "leader"}))
+        leader.start()
+        time.sleep(0.02)
+        try:
+            value, _ = cache.get_or_compute("key", lambda: {"by": "follower"})
+        finally:
+            release.set()
+            leader.join()
+        self.assertEqual(value, {"by": "follower"})
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        cache = ResponseCache(max_bytes=10**6, ttl=0.01, stale_ttl=60)
+        cache.get_or_compute("key", lambda: {"version": 1})
+        time.sleep(0.02)
+        refreshed = threading.Event()
+
+        def refresh():
+            refreshed.set()
+            return {"version": 2}
+
+        value, _ = cache.get_or_compute("key", lambda: {"version": "compute"}, refresh=refresh)
+        self.assertEqual(value, {"version": 1})
+        self.assertTrue(refreshed.wait(2))
+        deadline = time.monotonic() + 2
+        while cache.get_or_compute("key", refresh)[0] != {"version": 2} and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(cache.get_or_compute("key", refresh)[0], {"version": 2})
+
+    def test_uncacheable_payloads_are_recomputed(self):
+        cache = ResponseCache(max_bytes=10**6, ttl=60, stale_ttl=60)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"error": "Not found"}
+
+        for _ in range(2):
+            cache.get_or_compute("key", compute, cacheable=lambda value: "error" not in value)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_forked_worker_starts_its_own_refresher(self):
+        cache = ResponseCache(max_bytes=10**6, ttl=0.01, stale_ttl=60)
+        cache.get_or_compute("key", lambda: {"version": 1})
+        parent_refresher = cache._refresher
+        # as in a worker forked from a preloaded master, with a computation left in flight
+        cache._pid = -1
+        cache._inflight["key"] = Future()
+        time.sleep(0.02)
+        refreshed = threading.Event()
+        cache.get_or_compute("key", lambda: refreshed.set() or {"version": 2})
+        self.assertIsNot(cache._refresher, parent_refresher)
+        self.assertTrue(refreshed.wait(2))
+
+    def test_size_is_bounded(self):
+        cache = ResponseCache(max_bytes=40, ttl=60, stale_ttl=60)
+        for number in range(5):
+            cache.get_or_compute(f"key{number}", lambda: {"title": "x" * 10})
+        self.assertLessEqual(cache._size, 40)
+        self.assertLess(len(cache), 5)
+
+
+class TitleInitialTests(SimpleTestCase):
+    def test_buckets(self):
+        cases = {
+            "Alien": "A",
+            "élite": "E",
+            "  'Twas the Night": "T",
+            "Ødegaard": "O",
+            "Æon Flux": "A",
+            "2001: A Space Odyssey": DIGITS_BUCKET,
+            "東京物語": OTHER_BUCKET,
+            "Москва": OTHER_BUCKET,
+            "...": OTHER_BUCKET,
+            "": OTHER_BUCKET,
+            None: OTHER_BUCKET,
+        }
+        for title, bucket in cases.items():
+            with self.subTest(title=title):
+                self.assertEqual(title_initial(title), bucket)
+
+    def test_catalog_bucket_of_request(self):
+        self.assertEqual(catalog_bucket("a"), "A")
+        self.assertEqual(catalog_bucket("7"), DIGITS_BUCKET)
+        self.assertEqual(catalog_bucket("0-9"), DIGITS_BUCKET)
+        self.assertEqual(catalog_bucket("#"), OTHER_BUCKET)
+
+    def test_catalog_query(self):
+        # indices without title_initial keep the prefix query until the setting is enabled
+        self.assertEqual(MovieQueries.movies_by_alphabet("a"), {"prefix": {"title.keyword": "a"}})
+        with self.settings(CATALOG_PAGINATION={**settings.CATALOG_PAGINATION, "TITLE_INITIAL": True}):
+            self.assertEqual(MovieQueries.movies_by_alphabet("é"), {"bool": {"filter": [{"term": {"title_initial": "E"}}]}})
+
+
+def hits(*ids, scores=None):
+    scores = scores or [None] * len(ids)
+    return [{"_id": doc_id, "_score": score, "_source": {"title": doc_id}} for doc_id, score in zip(ids, scores)]
+
+
+class FusionTests(SimpleTestCase):
+    def test_rrf_favours_documents_found_by_both_lists(self):
+        fused = fuse([hits("a", "b", "c"), hits("c", "d")], [1.0, 1.0], "rrf", rank_constant=60)
+        self.assertEqual([hit["_id"] for hit in fused], ["c", "a", "b", "d"])
+
+    def test_rrf_weights(self):
+        fused = fuse([hits("a"), hits("b")], [1.0, 2.0], "rrf")
+        self.assertEqual([hit["_id"] for hit in fused], ["b", "a"])
+
+    def test_weighted_normalizes_each_list(self):
+        # BM25 scores are unbounded, kNN scores are in [0, 1]
+        lexical = hits("a", "b", scores=[30.0, 10.0])
+        semantic = hits("b", "c", scores=[0.9, 0.8])
+        fused = fuse([lexical, semantic], [1.0, 1.0], "weighted")
+        self.assertEqual([hit["_id"] for hit in fused], ["a", "b", "c"])
+        fused = fuse([lexical, semantic], [1.0, 3.0], "weighted")
+        self.assertEqual(fused[0]["_id"], "b")
+
+    def test_first_source_is_kept(self):
+        fused = fuse([hits("a"), [{"_id": "a", "_score": 1.0, "_source": {"title": "other"}}]], [1.0, 1.0], "rrf")
+        self.assertEqual(fused[0]["_source"], {"title": "a"})
+
+    def test_failed_semantic_search_serves_lexical_results(self):
+        options = {**hybrid_search_options({}), "size": 2}
+        responses = [
+            {"hits": {"hits": hits("a", "b", "c")}},
+            {"error": {"type": "search_phase_execution_exception", "reason": "knn failed"}, "status": 500},
+        ]
+        with self.assertLogs("imdb_picker.utils", "WARNING"):
+            result = fuse_hybrid_results(responses, options)
+        self.assertEqual(result, {"results": [{"title": "a"}, {"title": "b"}], "mode": "lexical"})
+        with self.assertRaisesRegex(RuntimeError, "knn failed"):
+            fuse_hybrid_results(responses[::-1], options)
+
+    def test_options_are_validated(self):
+        self.assertEqual(hybrid_search_options({"fusion": "weighted"})["fusion"], "weighted")
+        invalid = (
+            {"fusion": "unknown"}, {"rank_constant": "0"}, {"lexical_weight": "-1"}, {"size": "0"},
+            {"lexical_weight": "nan"}, {"semantic_weight": "inf"}, {"budget_ms": "nan"},
+        )
+        for params in invalid:
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                hybrid_search_options(params)
+
+
+class SearchFiltersTests(SimpleTestCase):
+    AGGREGATIONS = {
+        "genres": {"buckets": [{"key": "Drama", "doc_count": 12}, {"key": "Comedy", "doc_count": 3}]},
+        "years": {"buckets": [{"key": 915148800000, "key_as_string": "1999", "doc_count": 4}]},
+        "rating": {"buckets": [{"key": "8+", "from": 8.0, "doc_count": 2}, {"key": "7+", "from": 7.0, "doc_count": 5}]},
+        "runtime": {"buckets": [{"key": "<90", "to": 90.0, "doc_count": 0}, {"key": "150+", "from": 150.0, "doc_count": 1}]},
+    }
+
+    def test_search_filters(self):
+        self.assertEqual(search_filters({}), {})
+        self.assertEqual(search_filters({"genres": " Drama,Comedy,,Drama ", "year_from": "1990", "min_rating": "7.5", "max_runtime": ""}), {
+            "genres": ("Comedy", "Drama"), "year_from": 1990, "min_rating": 7.5,
+        })
+
+    def test_invalid_filters(self):
+        invalid = [
+            {"year_from": "nineteen"}, {"year_to": "1700"}, {"min_rating": "11"}, {"max_runtime": "1.5"},
+            {"genres": "a,b,c,d,e,f"},
+        ]
+        for params in invalid:
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                search_filters(params)
+
+    def test_filter_clauses(self):
+        filters = search_filters({"genres": "Drama,Comedy", "year_from": "1990", "year_to": "1999", "max_rating": "6", "min_runtime": "90"})
+        self.assertEqual(filter_clauses(filters), [
+            {"term": {"genre_tags": "Comedy"}},
+            {"term": {"genre_tags": "Drama"}},
+            {"range": {"release_date": {"gte": "1990-01-01", "lte": "1999-12-31"}}},
+            {"range": {"vote_average": {"lte": 6.0}}},
+            {"range": {"runtime": {"gte": 90}}},
+        ])
+        self.assertEqual(filter_clauses({}), [])
+
+    def test_filter_key(self):
+        self.assertEqual(
+            filter_key(search_filters({"genres": "Drama,Comedy", "year_to": "1999"})),
+            filter_key(search_filters({"year_to": "1999", "genres": "Comedy, Drama"})),
+        )
+
+    def test_facet_counts(self):
+        self.assertEqual(facet_counts(self.AGGREGATIONS), {
+            "genres": [{"value": "Drama", "count": 12}, {"value": "Comedy", "count": 3}],
+            "years": [{"value": 1999, "count": 4}],
+            "rating": [{"value": "8+", "count": 2}, {"value": "7+", "count": 5}],
+            "runtime": [{"value": "<90", "count": 0}, {"value": "150+", "count": 1}],
+        })
+
+    def test_browse_facets_are_cached(self):
+        response = {"hits": {"hits": [{"_source": {"title": "Heat"}}], "total": {"value": 1}}, "aggregations": self.AGGREGATIONS}
+        utils = StubbedElasticsearchUtils("facets_browse", {"indices.get": generation_of("facets_browse-1"), "search": response})
+        filters = search_filters({"genres": "Drama"})
+        first = utils.filtered_search("", filters)
+        second = utils.filtered_search("", filters)
+        self.assertEqual(first, second)
+        self.assertEqual(first["facets"], facet_counts(self.AGGREGATIONS))
+        bodies = [call["body"] for call in utils.stub.called("search")]
+        self.assertEqual(["aggs" in body for body in bodies], [True, False])
+        self.assertEqual(bodies[0]["query"]["bool"]["filter"], [{"term": {"genre_tags": "Drama"}}])
+        # a text query is scored per request, its facets are not cached
+        utils.filtered_search("heat", filters)
+        self.assertIn("aggs", utils.stub.called("search")[-1]["body"])
+
+
+@override_settings(FILTERED_KNN={"MAX_K": 100, "MAX_NUM_CANDIDATES": 2000, "COUNT_TTL": 3600})
+class KnnLimitsTests(SimpleTestCase):
+    def test_unfiltered(self):
+        self.assertEqual(knn_limits(10, 100, 1000, 1000), (10, 100))
+
+    def test_selective_filters_get_more_candidates(self):
+        self.assertEqual(knn_limits(10, 100, 10000, 1000000), (10, 1000))
+
+    def test_capped(self):
+        self.assertEqual(knn_limits(10, 100, 100000, 100000000), (10, 2000))
+        self.assertEqual(knn_limits(10, 100, 50, 1000000), (10, 50))
+        self.assertEqual(knn_limits(10, 100, 3, 1000000), (3, 3))
+
+    def test_no_match(self):
+        self.assertEqual(knn_limits(10, 100, 0, 1000), (0, 0))
+
+
+class SuggestIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SuggestIndex(suggestions_from_documents([
+            {"title": "The Dark Knight", "actors": "Christian Bale, Heath Ledger", "directors": "Christopher Nolan", "popularity": 90, "poster_path": "/dk.jpg"},
+            {"title": "Dark City", "actors": ["Rufus Sewell"], "directors": "Alex Proyas", "popularity": 20, "poster_path": "/dc.jpg"},
+            {"title": "Amélie", "actors": "Audrey Tautou", "directors": "Jean-Pierre Jeunet", "popularity": 40, "poster_path": "/am.jpg"},
+            {"title": "Knight and Day", "actors": "Tom Cruise", "popularity": 60, "poster_path": "/kd.jpg"},
+        ]))
+
+    def texts(self, prefix, **options):
+        return [suggestion["text"] for suggestion in self.index.suggest(prefix, **options)]
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  Amélie!  Poulain "), "amelie poulain")
+
+    def test_prefix_of_any_word(self):
+        self.assertEqual(self.texts("dark"), ["The Dark Knight", "Dark City"])
+        # a match on the first word counts START_BOOST times more
+        self.assertEqual(self.texts("knig"), ["Knight and Day", "The Dark Knight"])
+
+    def test_accents_and_case_are_ignored(self):
+        self.assertEqual(self.texts("AMEL"), ["Amélie"])
+
+    def test_people_weighted_by_their_movies(self):
+        self.assertEqual(self.texts("chris", types=("actor", "director")), ["Christian Bale", "Christopher Nolan"])
+        self.assertEqual(self.texts("chris", types=("director",)), ["Christopher Nolan"])
+
+    def test_size_and_empty_prefix(self):
+        self.assertEqual(len(self.index.suggest("d", size=1)), 1)
+        self.assertEqual(self.index.suggest("  "), [])
+        self.assertEqual(self.index.suggest("zzz"), [])
+
+
+@override_settings(SIMILAR_MOVIES_RANKING={"FEATURES": [], "DIVERSITY_LAMBDA": 1.0})
+class RerankerTests(SimpleTestCase):
+    FEATURES = [
+        {"name": "rating", "threshold": 7.0, "boost": 1.5},
+        {"name": "popularity", "factor": 0.3},
+        {"name": "recency", "weight": 0.5, "half_life_years": 10.0},
+        {"name": "random", "weight": 0.2},
+    ]
+
+    def candidates(self, seed_key="tt0133093"):
+        rng = np.random.default_rng(0)
+        sources = [
+            {"imdb_rating": rating, "vote_average": 6.0, "popularity": popularity, "release_date": "1999-03-31"}
+            for rating, popularity in zip(rng.uniform(4, 9, 50), rng.uniform(0, 100, 50))
+        ]
+        candidates = candidate_features(sources)
+        candidates.update(similarity=rng.uniform(0.5, 1.0, 50), seed=stable_seed(seed_key))
+        return candidates
+
+    def test_same_order_in_every_worker(self):
+        first = Reranker(self.FEATURES, reference_year=2020).rank(self.candidates(), 10)
+        second = Reranker(self.FEATURES, reference_year=2020).rank(self.candidates(), 10)
+        np.testing.assert_array_equal(first, second)
+        self.assertEqual(len(first), 10)
+
+    def test_stable_seed_is_not_salted(self):
+        self.assertEqual(stable_seed("tt0133093"), stable_seed("tt0133093"))
+        self.assertEqual(stable_seed(42), stable_seed("42"))
+        self.assertNotEqual(stable_seed("tt0133093"), stable_seed("tt0110912"))
+
+    def test_best_first(self):
+        candidates = self.candidates()
+        reranker = Reranker(self.FEATURES)
+        scores = reranker.scores(candidates)[reranker.rank(candidates, 50)]
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_recency_is_measured_at_the_reference_year(self):
+        candidates = candidate_features([{"release_date": "2019-01-01"}, {"release_date": "2009-01-01"}, {}])
+        candidates.update(similarity=np.ones(3), seed=0)
+        reranker = Reranker([{"name": "recency", "weight": 1.0, "half_life_years": 10.0}], reference_year=2019)
+        np.testing.assert_allclose(reranker.scores(candidates), [2.0, 1.5, 1.0])
+        later = Reranker([{"name": "recency", "weight": 1.0, "half_life_years": 10.0}], reference_year=2029)
+        np.testing.assert_allclose(later.scores(candidates), [1.5, 1.25, 1.0])
+
+    def test_boosts_do_not_invert_negative_similarities(self):
+        # dot_product similarities can be negative: the boosted movie must not drop below the other one
+        candidates = candidate_features([{"imdb_rating": 9.0}, {"imdb_rating": 5.0}])
+        candidates.update(similarity=np.array([-0.2, -0.2]), seed=0)
+        reranker = Reranker([{"name": "rating", "threshold": 7.0, "boost": 1.5}], reference_year=2020)
+        self.assertEqual(reranker.rank(candidates, 2).tolist(), [0, 1])
+        candidates["similarity"] = np.array([-0.3, 0.9])
+        self.assertEqual(reranker.rank(candidates, 2).tolist(), [1, 0])
+
+    def test_diversity_is_deterministic(self):
+        candidates = self.candidates()
+        vectors = np.random.default_rng(1).normal(size=(50, 8))
+        candidates["vectors"] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        reranker = Reranker(self.FEATURES, diversity_lambda=0.5)
+        ranked = reranker.rank(candidates, 10)
+        np.testing.assert_array_equal(ranked, reranker.rank(candidates, 10))
+        self.assertEqual(len(set(ranked.tolist())), 10)
+
+
+class CompactMovieSerializerTests(SimpleTestCase):
+    MOVIES = [
+        {
+            "title": "The Matrix", "overview": "A hacker learns the truth.", "popularity": 83, "vote_average": "8.2",
+            "runtime": 136.0, "vote_count": "20000", "adult": False, "release_date": "1999-03-31",
+            "poster_path": "/matrix.jpg", "embedding": [0.1, 0.2], "director": "The Wachowskis",
+        },
+        {"title": None, "genres": "Drama", "imdb_id": "tt0000001"},
+        {},
+    ]
+
+    def test_same_output_as_the_drf_serializer(self):
+        for movie in self.MOVIES:
+            with self.subTest(movie=movie):
+                self.assertEqual(compact_movie_serializer.to_representation(movie), dict(MovieData2Serializer(movie).data))
+
+    def test_projection(self):
+        movie = self.MOVIES[0]
+        self.assertEqual(compact_movie_serializer.many([movie], ["movie_title", "runtime"]), [{"movie_title": "The Matrix", "runtime": 136}])
+        self.assertEqual(compact_movie_serializer.source_fields(["movie_title", "overview"]), ["title", "overview"])
+        with self.assertRaisesRegex(ValueError, "Unknown fields: cast"):
+            compact_movie_serializer.source_fields(["cast"])
+
+
+class SemanticSearchProjectionTests(SimpleTestCase):
+    MOVIES = [{"title": "The Matrix", "overview": "A hacker learns the truth.", "poster_path": "/matrix.jpg"}]
+
+    def test_fields_are_fetched_and_serialized(self):
+        view = MovieViewSet.as_view({"get": "movie_semantic_search"})
+        with mock.patch.object(views.ElasticsearchUtils, "semantic_search", return_value=self.MOVIES) as semantic_search:
+            response = view(APIRequestFactory().get("/movies/semantic_search/", {"q": "hackers", "fields": "movie_title,poster_path"}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data["results"], [{"movie_title": "The Matrix", "poster_path": "/matrix.jpg"}])
+            self.assertEqual(semantic_search.call_args.kwargs["output_fields"], ["title", "poster_path"])
+
+            response = view(APIRequestFactory().get("/movies/semantic_search/", {"q": "hackers"}))
+            self.assertEqual(response.data["results"], self.MOVIES)
+            self.assertNotIn("output_fields", semantic_search.call_args.kwargs)
+
+            response = view(APIRequestFactory().get("/movies/semantic_search/", {"q": "hackers", "fields": "cast"}))
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(semantic_search.call_count, 2)
+
+    def test_async_fields_are_fetched_and_serialized(self):
+        with mock.patch.object(async_views.AsyncElasticsearchUtils, "semantic_search", mock.AsyncMock(return_value=self.MOVIES)) as semantic_search:
+            request = RequestFactory().get("/async/movies/semantic_search/", {"q": "hackers", "fields": "movie_title"})
+            response = async_to_sync(async_views.movie_semantic_search)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["results"], [{"movie_title": "The Matrix"}])
+        self.assertEqual(semantic_search.call_args.kwargs["output_fields"], ["title"])
+
+
+class FilteredMovieInfoTests(SimpleTestCase):
+    MOVIE = {"_id": "1", "_source": {"title": "Alien", "poster_path": "/alien.jpg", "embedding": [0.1, 0.2]}}
+
+    def utils(self, index_name):
+        return StubbedElasticsearchUtils(index_name, {
+            "indices.get": generation_of(index_name + "_v1"),
+            "search": lambda body, **kwargs: {"hits": {"hits": [] if "knn" in body else [self.MOVIE]}},
+            # once its id is known, the movie is fetched by id
+            "get": self.MOVIE,
+            "count": {"count": 10},
+        })
+
+    def test_filters_reach_the_similar_movies_knn(self):
+        utils = self.utils("filtered_info")
+        movie = utils.movie_info("/alien.jpg", filters={"genres": ("Horror",), "year_from": 1970})
+        self.assertEqual(movie["title"], "Alien")
+        knn = [call["body"]["knn"] for call in utils.stub.called("search") if "knn" in call["body"]]
+        self.assertEqual(len(knn), 1)
+        self.assertIn({"term": {"genre_tags": "Horror"}}, knn[0]["filter"]["bool"]["filter"])
+
+    def test_filters_are_part_of_the_cache_key(self):
+        utils = self.utils("filtered_info_cache")
+        for filters in ({}, {"genres": ("Horror",)}, {"genres": ("Horror",)}, {"genres": ("Drama",)}):
+            utils.cached_movie_info("/alien.jpg", filters=filters)
+        filtered = [call for call in utils.stub.called("search") if "knn" in call["body"] and call["body"]["knn"]["filter"]["bool"]["filter"]]
+        self.assertEqual(len(filtered), 2)
+
+
+class WatchlistTests(SimpleTestCase):
+    def test_one_msearch_in_watchlist_order(self):
+        found = {"/b.jpg": "B", "/a.jpg": "A", "Heat": "Heat"}
+
+        def msearch(searches):
+            responses = []
+            for query in searches[1::2]:
+                clause = query["query"]
+                entry = clause["bool"]["filter"][0]["term"]["poster_path.keyword"] if "bool" in clause else clause["multi_match"]["query"]
+                responses.append({"hits": {"hits": [{"_source": {"title": found[entry]}}] if entry in found else []}})
+            return {"responses": responses}
+
+        utils = StubbedElasticsearchUtils("watchlist", {"msearch": msearch})
+        movies = utils.get_watchlist(["/b.jpg", "/missing.jpg", " Heat ", "", "/a.jpg"])
+        self.assertEqual([movie["title"] for movie in movies], ["B", "Heat", "A"])
+        self.assertEqual(len(utils.stub.calls), 1)
+        self.assertEqual(StubbedElasticsearchUtils("watchlist", {}).get_watchlist(["", " "]), [])
+
+    def test_failed_entries_are_skipped(self):
+        utils = StubbedElasticsearchUtils("watchlist", {"msearch": {"responses": [
+            {"error": {"reason": "shard failure"}, "status": 500},
+            {"hits": {"hits": [{"_source": {"title": "A"}}]}},
+        ]}})
+        self.assertEqual(utils.get_watchlist(["/x.jpg", "/a.jpg"]), [{"title": "A"}])
+
+    def test_page_params(self):
+        self.assertEqual(watchlist_page_params({}), (1, WATCHLIST_PAGE_SIZE))
+        self.assertEqual(watchlist_page_params({"page": "2", "page_size": "10"}), (2, 10))
+        invalid = ({"page": "abc"}, {"page": "0"}, {"page_size": "0"}, {"page_size": "-5"}, {"page_size": str(WATCHLIST_MAX_PAGE_SIZE + 1)})
+        for params in invalid:
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                watchlist_page_params(params)
+
+
+class StubCluster:
+    """Indices and aliases of a cluster, served through a StubElasticsearch."""
+    def __init__(self, indices, aliases=None):
+        self.indices = set(indices)
+        self.aliases = {alias: set(targets) for alias, targets in (aliases or {}).items()}
+        self.es = StubElasticsearch({
+            "indices.exists": lambda index: index in self.indices or index in self.aliases,
+            "indices.exists_alias": lambda name: bool(self.aliases.get(name)),
+            "indices.get_alias": lambda name: {index: {"aliases": {name: {}}} for index in self.aliases[name]},
+            "indices.get": lambda index, **kwargs: {
+                name: {"settings": {"index": {"uuid": name}}} for name in self.indices if fnmatch.fnmatch(name, index)
+            },
+            "indices.update_aliases": self.update_aliases,
+            "indices.delete": lambda index: self.indices.remove(index),
+            "indices.put_settings": {}, "indices.refresh": {}, "indices.forcemerge": {}, "cluster.health": {},
+            "count": {"count": 0},
+        })
+
+    def update_aliases(self, actions):
+        for action in actions:
+            (kind, target), = action.items()
+            targets = self.aliases.setdefault(target["alias"], set())
+            (targets.add if kind == "add" else targets.discard)(target["index"])
+        return {"acknowledged": True}
+
+
+@override_settings(MOVIES_INDEX={
+    **settings.MOVIES_INDEX, "ALIAS": "movies", "PREFIX": "movies_v", "ADOPT_INDEX": "movie_data_9", "KEEP_GENERATIONS": 2,
+})
+class IndexLifecycleTests(SimpleTestCase):
+    def test_switch_alias_is_one_atomic_update(self):
+        cluster = StubCluster(["movies_v1", "movies_v2"], {"movies": ["movies_v1"]})
+        self.assertEqual(index_lifecycle.switch_alias(cluster.es, "movies_v2"), ["movies_v1"])
+        self.assertEqual(cluster.es.called("indices.update_aliases"), [{"actions": [
+            {"remove": {"index": "movies_v1", "alias": "movies"}}, {"add": {"index": "movies_v2", "alias": "movies"}},
+        ]}])
+        self.assertEqual(cluster.aliases["movies"], {"movies_v2"})
+
+    def test_switch_alias_refuses_an_index_named_like_the_alias(self):
+        cluster = StubCluster(["movies", "movies_v1"])
+        with self.assertRaisesRegex(ValueError, "is an index, not an alias"):
+            index_lifecycle.switch_alias(cluster.es, "movies_v1")
+
+    def test_collect_garbage_keeps_the_newest_and_the_live_generations(self):
+        # rolled back to movies_v2
+        cluster = StubCluster(["movies_v1", "movies_v2", "movies_v3", "movies_v10", "movie_data_9"], {"movies": ["movies_v2"]})
+        self.assertEqual(index_lifecycle.collect_garbage(cluster.es), ["movies_v1"])
+        self.assertEqual(cluster.indices, {"movies_v2", "movies_v3", "movies_v10", "movie_data_9"})
+        self.assertEqual(index_lifecycle.next_generation(cluster.es), "movies_v11")
+
+    def test_finalize_generation_merges_before_adding_replicas(self):
+        cluster = StubCluster(["movies_v1"])
+        index_lifecycle.finalize_generation(cluster.es, "movies_v1", replicas=1)
+        self.assertEqual([name for name, _ in cluster.es.calls], [
+            "indices.put_settings", "indices.refresh", "indices.forcemerge", "indices.put_settings", "cluster.health",
+        ])
+        self.assertEqual(cluster.es.calls[0][1]["settings"], {"refresh_interval": None})
+        self.assertEqual(cluster.es.calls[3][1]["settings"], {"number_of_replicas": 1})
+        self.assertEqual(cluster.es.calls[4][1]["wait_for_status"], "green")
+
+    def test_adopt_index_is_idempotent(self):
+        cluster = StubCluster(["movie_data_9"])
+        self.assertEqual(index_lifecycle.adopt_index(cluster.es), "movie_data_9")
+        self.assertEqual(cluster.aliases["movies"], {"movie_data_9"})
+        self.assertIsNone(index_lifecycle.adopt_index(cluster.es))
+        self.assertEqual(len(cluster.es.called("indices.update_aliases")), 1)
+        self.assertIsNone(index_lifecycle.adopt_index(StubCluster([]).es))
+
+    def test_write_index_resolves_the_alias(self):
+        cluster = StubCluster(["movies_v1"], {"movies": ["movies_v1"]})
+        self.assertEqual(index_lifecycle.write_index(cluster.es), "movies_v1")
+        self.assertEqual(index_lifecycle.write_index(cluster.es, "movies_v7"), "movies_v7")
+        with self.assertRaisesRegex(ValueError, "does not point to any index"):
+            index_lifecycle.write_index(StubCluster([]).es)
+
+
+def not_found():
+    meta = ApiResponseMeta(status=404, http_version="1.1", headers=HttpHeaders(), duration=0.0, node=NodeConfig("http", "localhost", 9200))
+    return NotFoundError("not found", meta, {})
+
+
+class CursorPaginationTests(SimpleTestCase):
+    def catalog(self, titles, expired=()):
+        """StubbedElasticsearchUtils over sorted ``titles``, answering search_after pages."""
+        def search(body, index=None):
+            if body.get("pit", {}).get("id") in expired:
+                raise not_found()
+            after = body.get("search_after", [None])[0]
+            page = [title for title in titles if after is None or title > after][:body["size"]]
+            sort = [[title, f"/{title}.jpg"] + ([len(title)] if "pit" in body else []) for title in page]
+            return {"hits": {"hits": [{"_source": {"title": title}, "sort": values} for title, values in zip(page, sort)]}}
+
+        opened = iter(f"pit-{number}" for number in range(1, 10))
+        return StubbedElasticsearchUtils("catalog", {
+            "search": search,
+            "count": {"count": len(titles)},
+            "open_point_in_time": lambda **kwargs: {"id": next(opened)},
+            "close_point_in_time": {"succeeded": True},
+        })
+
+    def test_single_page_opens_no_point_in_time(self):
+        utils = self.catalog(["Alien", "Aliens"])
+        result = utils.list_movies_by_cursor("A", movies_per_page=5)
+        self.assertEqual([movie["title"] for movie in result["movies"]], ["Alien", "Aliens"])
+        self.assertIsNone(result["next_cursor"])
+        self.assertEqual(utils.stub.called("open_point_in_time") + utils.stub.called("close_point_in_time"), [])
+
+    def test_point_in_time_opened_for_the_next_page(self):
+        utils = self.catalog(["Alien", "Aliens", "Amelie", "Avatar", "Awakenings"])
+        first = utils.list_movies_by_cursor("A", movies_per_page=2)
+        self.assertNotIn("pit", utils.stub.called("search")[0]["body"])
+        self.assertEqual(first["next_cursor"], {"pit": "pit-1", "after": ["Aliens", "/Aliens.jpg", MAX_SHARD_DOC], "total": 5})
+        second = utils.list_movies_by_cursor("A", cursor=first["next_cursor"], movies_per_page=2)
+        self.assertEqual([movie["title"] for movie in second["movies"]], ["Amelie", "Avatar"])
+        self.assertEqual(second["total_movies"], 5)
+        last = utils.list_movies_by_cursor("A", cursor=second["next_cursor"], movies_per_page=2)
+        self.assertEqual([movie["title"] for movie in last["movies"]], ["Awakenings"])
+        self.assertIsNone(last["next_cursor"])
+        # counted once, one point in time, released on the last page
+        self.assertEqual(len(utils.stub.called("count")), 1)
+        self.assertEqual(len(utils.stub.called("open_point_in_time")), 1)
+        self.assertEqual(utils.stub.called("close_point_in_time"), [{"id": "pit-1"}])
+
+    def test_expired_point_in_time_is_reopened_at_the_same_position(self):
+        utils = self.catalog(["Alien", "Aliens", "Amelie", "Avatar"], expired={"pit-0"})
+        cursor = {"pit": "pit-0", "after": ["Aliens", "/Aliens.jpg", 6], "total": 4}
+        result = utils.list_movies_by_cursor("A", cursor=cursor, movies_per_page=2)
+        self.assertEqual([movie["title"] for movie in result["movies"]], ["Amelie", "Avatar"])
+        retried = utils.stub.called("search")[-1]["body"]
+        self.assertEqual((retried["pit"]["id"], retried["search_after"]), ("pit-1", ["Aliens", "/Aliens.jpg", 6]))
+        self.assertEqual(result["next_cursor"]["pit"], "pit-1")
+
+    def test_cursor_is_signed(self):
+        view = MovieViewSet.as_view({"get": "list_movies"})
+        page = {"movies": [{"title": "Amelie"}], "total_movies": 3, "next_cursor": {"pit": "pit-1", "after": ["Amelie", "/a.jpg", 1], "total": 3}}
+        with mock.patch.object(views.ElasticsearchUtils, "list_movies_by_cursor", return_value=page) as list_movies:
+            response = view(APIRequestFactory().get("/movies/list_movies/", {"cursor": "", "alphabet": "A", "movies_per_page": "1"}))
+            self.assertEqual(response.status_code, 200)
+            cursor = response.data["next_cursor"]
+            # the letter and page size come from the cursor, not from the request
+            view(APIRequestFactory().get("/movies/list_movies/", {"cursor": cursor, "alphabet": "B", "movies_per_page": "50"}))
+            self.assertEqual(list_movies.call_args.args[0], "A")
+            self.assertEqual(list_movies.call_args.kwargs["cursor"]["after"], ["Amelie", "/a.jpg", 1])
+            self.assertEqual(list_movies.call_args.kwargs["movies_per_page"], 1)
+            tampered = signing.dumps({"pit": "pit-1", "after": ["Z"], "alphabet": "A", "size": 1}, salt="another salt")
+            for invalid in (cursor[:-2] + "xx", tampered, "garbage"):
+                response = view(APIRequestFactory().get("/movies/list_movies/", {"cursor": invalid}))
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(list_movies.call_count, 2)
+
+
+class VectorSnapshotTests(SimpleTestCase):
+    # "c" is less similar to "a" than "b" but rated above the boost threshold
+    DOCUMENTS = [
+        {"_id": "a", "_source": {"embedding": [1.0, 0.0, 0.0], "imdb_rating": 6.0}},
+        {"_id": "b", "_source": {"embedding": [0.9, 0.1, 0.0], "imdb_rating": 6.0}},
+        {"_id": "c", "_source": {"embedding": [0.5, 0.5, 0.0], "imdb_rating": 9.0}},
+        {"_id": "d", "_source": {"embedding": [0.0, 0.0, 2.0], "imdb_rating": 9.0}},
+    ]
+    RERANKER = Reranker([{"name": "rating", "threshold": 7.0, "boost": 1.5}], reference_year=2020)
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        scan = mock.patch.object(ann.helpers, "scan", side_effect=lambda *args, **kwargs: iter(
+            [{"_id": document["_id"], "_source": dict(document["_source"])} for document in self.DOCUMENTS]
+        ))
+        scan.start()
+        self.addCleanup(scan.stop)
+
+    def test_round_trip(self):
+        path = build_vector_snapshot(None, "movies", "movies-1@uuid", self.root.name)
+        self.assertEqual(path, snapshot_dir("movies-1@uuid", self.root.name))
+        self.assertFalse(os.path.exists(path + ".tmp"))
+        vector_index = VectorIndex(path)
+        self.assertIsInstance(vector_index.vectors, np.memmap)
+        self.assertEqual(vector_index.vectors.dtype, np.float16)
+        self.assertEqual(len(vector_index), 4)
+        np.testing.assert_allclose(vector_index.vector("d"), [0.0, 0.0, 1.0])
+        self.assertEqual(vector_index.similar("a", candidates=3, size=2, reranker=Reranker([])), ["b", "c"])
+        self.assertEqual(vector_index.similar("a", candidates=3, size=2, reranker=self.RERANKER), ["c", "b"])
+        self.assertIsNone(vector_index.similar("unknown", candidates=3, size=2, reranker=self.RERANKER))
+
+    def test_build_vector_snapshot_command(self):
+        with mock.patch.object(ElasticsearchUtils, "index_generation", return_value="movies-2@uuid"):
+            call_command("build_vector_snapshot", index="movies", output=self.root.name, dtype="float32", stdout=io.StringIO())
+        vector_index = VectorIndex(snapshot_dir("movies-2@uuid", self.root.name))
+        self.assertEqual(vector_index.meta["dtype"], "float32")
+        self.assertEqual(vector_index.ids, ["a", "b", "c", "d"])
+
+        with mock.patch.object(ElasticsearchUtils, "index_generation", return_value=None):
+            with self.assertRaises(CommandError):
+                call_command("build_vector_snapshot", index="movies", output=self.root.name, stdout=io.StringIO())
+
+    def test_compute_neighbours(self):
+        vector_index = VectorIndex(build_vector_snapshot(None, "movies", "movies-3@uuid", self.root.name))
+        self.assertIsNone(vector_index.neighbour_table())
+        table = vector_index.compute_neighbours(k=2, candidates=3, block_size=3, workers=2, reranker=self.RERANKER)
+        self.assertEqual(table.shape, (4, 2))
+        for doc_id, rows in zip(vector_index.ids, table):
+            self.assertNotIn(vector_index.rows[doc_id], rows)
+            self.assertEqual(
+                [vector_index.ids[row] for row in rows],
+                vector_index.similar(doc_id, candidates=3, size=2, reranker=self.RERANKER),
+            )
+        # a new process serves the precomputed table without scoring
+        reloaded = VectorIndex(vector_index.path)
+        with mock.patch.object(VectorIndex, "search", side_effect=AssertionError("scored")):
+            self.assertEqual(reloaded.similar("a", candidates=3, size=2), ["c", "b"])
+            self.assertEqual(reloaded.similar("a", candidates=3, size=1), ["c"])
+        self.assertIsNone(reloaded.similar("unknown", candidates=3, size=2))
+
+    def test_compute_neighbours_command(self):
+        with override_settings(VECTOR_SNAPSHOT={"ENABLED": True, "PATH": self.root.name, "DTYPE": "float16"}):
+            with mock.patch.object(ElasticsearchUtils, "index_generation", return_value="movies-4@uuid"):
+                with self.assertRaises(CommandError):
+                    call_command("compute_neighbours", index="movies", stdout=io.StringIO())
+                build_vector_snapshot(None, "movies", "movies-4@uuid", self.root.name)
+                call_command("compute_neighbours", index="movies", k=3, candidates=3, stdout=io.StringIO())
+        table = VectorIndex(snapshot_dir("movies-4@uuid", self.root.name)).neighbour_table()
+        self.assertEqual(table.shape, (4, 3))
+        self.assertTrue(np.all(table >= 0))
+
+
+class IngestionTests(SimpleTestCase):
+    ROWS = [{"id": f"m{number}", "title": f"Movie {number}", "overview": "A plot."} for number in range(5)]
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.source = os.path.join(self.root.name, "movies.jsonl")
+        with open(self.source, "w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in self.ROWS)
+        self.checkpoint = self.source + ".checkpoint.json"
+
+    def ingest(self, failing=(), crash_after=None, **kwargs):
+        """ingest_movies through a parallel_bulk stub failing the ids ``failing``; returns (result, indexed ids)."""
+        sent = []
+
+        def parallel_bulk(es, actions, **options):
+            for action in actions:
+                if crash_after is not None and len(sent) == crash_after:
+                    raise ConnectionError("interrupted")
+                sent.append(action["_id"])
+                yield action["_id"] not in failing, {"index": {"_id": action["_id"]}}
+
+        with mock.patch.object(ingestion.helpers, "parallel_bulk", side_effect=parallel_bulk):
+            result = ingestion.ingest_movies(
+                None, self.source, "movies-1", embed=ingestion.synthetic_embeddings, workers=0,
+                embed_batch_size=2, checkpoint_path=self.checkpoint, **kwargs
+            )
+        return result, sent
+
+    def test_movie_document(self):
+        document = ingestion.movie_document({
+            "title": "Élite", "overview": "Students.", "description": "", "cast": "A, B", "director": "C",
+            "genres": "Drama, Thriller, Drama", "embeddings": [0.1], "tagline": None,
+        })
+        self.assertEqual(document, {
+            "title": "Élite", "overview": "Students.", "description": "Students.", "cast": "A, B", "actors": "A, B",
+            "director": "C", "directors": "C", "genres": "Drama, Thriller, Drama", "title_initial": "E",
+            "genre_tags": ["Drama", "Thriller"],
+        })
+        self.assertEqual(ingestion.movie_document({"title": "Up", "overview": "Balloons.", "description": "A house flies."})["description"], "A house flies.")
+        self.assertIsNone(ingestion.movie_document({"title": "", "overview": "No title."}))
+
+    def test_failed_rows_are_retried(self):
+        result, sent = self.ingest(failing={"m2"})
+        self.assertEqual(sent, ["m0", "m1", "m2", "m3", "m4"])
+        self.assertEqual((result["indexed"], result["failed"], result["done"]), (4, 1, False))
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)["failed_rows"], [2])
+
+        result, sent = self.ingest()
+        self.assertEqual(sent, ["m2"])
+        self.assertEqual((result["rows"], result["indexed"], result["failed"], result["done"]), (5, 5, 0, True))
+
+        result, sent = self.ingest()
+        self.assertEqual(sent, [])
+        self.assertTrue(result["done"])
+
+    def test_interrupted_run_resumes_from_the_checkpoint(self):
+        with self.assertRaises(ConnectionError):
+            self.ingest(failing={"m0"}, crash_after=3, checkpoint_every=2)
+        with open(self.checkpoint) as f:
+            self.assertEqual({key: value for key, value in json.load(f).items() if key not in ("source", "index")},
+                             {"rows": 2, "indexed": 1, "failed": 1, "failed_rows": [0], "done": False})
+
+        result, sent = self.ingest()
+        self.assertEqual(sent, ["m0", "m2", "m3", "m4"])
+        self.assertEqual((result["resumed_from"], result["indexed"], result["done"]), (2, 5, True))
+
+        result, sent = self.ingest(restart=True)
+        self.assertEqual(len(sent), 5)
+
+
+class JitteredRetryTransportTests(SimpleTestCase):
+    NODES = [NodeConfig("http", "localhost", 9200)]
+
+    @staticmethod
+    def response(status):
+        return mock.Mock(meta=mock.Mock(status=status))
+
+    def transport(self, transport_class=es_client.JitteredRetryTransport, **options):
+        return transport_class(self.NODES, max_retries=2, retry_on_status=(503,), retry_on_timeout=True, **options)
+
+    def test_retries_with_backoff(self):
+        ok = self.response(200)
+        with mock.patch.object(Transport, "perform_request", side_effect=[self.response(503), TransportConnectionError("reset"), ok]) as perform, \
+                mock.patch.object(es_client.time, "sleep") as sleep:
+            self.assertIs(self.transport().perform_request("GET", "/"), ok)
+        # every attempt goes through the stock transport without its own retries
+        self.assertEqual([call.kwargs["max_retries"] for call in perform.call_args_list], [0, 0, 0])
+        self.assertEqual(sleep.call_count, 2)
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertTrue(0 <= first <= 0.05 and 0 <= second <= 0.1)
+
+    def test_last_attempt_is_returned_or_raised(self):
+        unavailable = self.response(503)
+        with mock.patch.object(Transport, "perform_request", return_value=unavailable) as perform, \
+                mock.patch.object(es_client.time, "sleep"):
+            self.assertIs(self.transport().perform_request("GET", "/"), unavailable)
+        self.assertEqual(perform.call_count, 3)
+        with mock.patch.object(Transport, "perform_request", side_effect=TransportConnectionError("refused")) as perform, \
+                mock.patch.object(es_client.time, "sleep"):
+            with self.assertRaises(TransportConnectionError):
+                self.transport().perform_request("GET", "/")
+        self.assertEqual(perform.call_count, 3)
+
+    def test_timeouts_are_not_retried_unless_configured(self):
+        with mock.patch.object(Transport, "perform_request", side_effect=ConnectionTimeout("timeout")) as perform, \
+                mock.patch.object(es_client.time, "sleep") as sleep:
+            with self.assertRaises(ConnectionTimeout):
+                self.transport().perform_request("GET", "/", retry_on_timeout=False)
+        self.assertEqual(perform.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_backoff_is_capped(self):
+        transport = self.transport()
+        transport.backoff_max = 0.2
+        self.assertTrue(all(0 <= transport.backoff(attempt) <= 0.2 for attempt in range(20)))
+
+    def test_async_retries_with_backoff(self):
+        async def retry():
+            transport = self.transport(es_client.JitteredRetryAsyncTransport)
+            try:
+                return await transport.perform_request("GET", "/")
+            finally:
+                await transport.close()
+
+        ok = self.response(200)
+        with mock.patch.object(AsyncTransport, "perform_request", mock.AsyncMock(side_effect=[ConnectionTimeout("timeout"), ok])), \
+                mock.patch.object(es_client.asyncio, "sleep", mock.AsyncMock()) as sleep:
+            self.assertIs(asyncio.run(retry()), ok)
+        sleep.assert_awaited_once()
+
+
+class ElasticsearchClientTests(SimpleTestCase):
+    HOSTS = ["http://clients-test:9200"]
+
+    def setUp(self):
+        self.addCleanup(es_client._forget_clients)
+
+    def test_one_client_per_process(self):
+        with mock.patch.object(es_client, "build_elasticsearch_client", side_effect=lambda alias, **overrides: object()) as build:
+            client = es_client.get_elasticsearch_client(hosts=self.HOSTS)
+            self.assertIs(es_client.get_elasticsearch_client(hosts=self.HOSTS), client)
+            build.assert_called_once_with("default", hosts=self.HOSTS)
+            # a worker forked after the client was built
+            with mock.patch.object(es_client.os, "getpid", return_value=os.getpid() + 1):
+                child_client = es_client.get_elasticsearch_client(hosts=self.HOSTS)
+            self.assertIsNot(child_client, client)
+            es_client._forget_clients()
+            self.assertIsNot(es_client.get_elasticsearch_client(hosts=self.HOSTS), child_client)
+        self.assertEqual(build.call_count, 3)
+
+    def test_client_options(self):
+        client = es_client.build_elasticsearch_client(hosts=self.HOSTS)
+        self.assertIsInstance(client.transport, es_client.JitteredRetryTransport)
+        self.assertEqual(client.transport.backoff_base, settings.ELASTICSEARCH["default"]["RETRY_BACKOFF"])
+        self.assertEqual(client.transport.backoff_max, settings.ELASTICSEARCH["default"]["RETRY_BACKOFF_MAX"])
+
+
+@override_settings(RESPONSE_COMPRESSION={
+    "ENABLED": True, "MIN_SIZE": 200, "GZIP_LEVEL": 5, "BROTLI_QUALITY": 4,
+    "PATH_PREFIXES": ["/imdb/"], "CONTENT_TYPES": ["application/json"],
+})
+class CompressionMiddlewareTests(SimpleTestCase):
+    PAYLOAD = b'{"results": [' + b", ".join(b'{"movie_title": "The Matrix"}' for _ in range(20)) + b"]}"
+
+    def process(self, accept_encoding="gzip", path="/imdb/movies/search/", content=PAYLOAD,
+                content_type="application/json", status=200, etag='"v1"'):
+        request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+        response = HttpResponse(content, content_type=content_type, status=status)
+        if etag:
+            response["ETag"] = etag
+        return middleware.CompressionMiddleware(lambda request: response).process_response(request, response)
+
+    def test_accepted_encodings(self):
+        self.assertEqual(middleware.accepted_encodings("gzip;q=0, BR, deflate;q=0.5, zstd;q=x"), {"br", "deflate"})
+
+    def test_gzip(self):
+        response = self.process()
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.PAYLOAD)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        # the strong ETag of the uncompressed bytes becomes weak
+        self.assertEqual(response["ETag"], 'W/"v1"')
+        self.assertEqual(self.process(etag='W/"v1"')["ETag"], 'W/"v1"')
+
+    def test_negotiation(self):
+        brotli = mock.Mock(compress=mock.Mock(return_value=b"br"))
+        with mock.patch.object(middleware, "brotli", brotli):
+            self.assertEqual(self.process("gzip, br")["Content-Encoding"], "br")
+            self.assertEqual(self.process("gzip, br;q=0")["Content-Encoding"], "gzip")
+        with mock.patch.object(middleware, "brotli", None):
+            self.assertEqual(self.process("gzip, br")["Content-Encoding"], "gzip")
+            response = self.process("br")
+            self.assertFalse(response.has_header("Content-Encoding"))
+            self.assertEqual(response.content, self.PAYLOAD)
+        response = self.process("gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual((response["ETag"], response["Vary"]), ('"v1"', "Accept-Encoding"))
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.process(content=b'{"results": []}')
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual((response.content, response["ETag"]), (b'{"results": []}', '"v1"'))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+    def test_other_responses_are_untouched(self):
+        for options in ({"path": "/admin/"}, {"content_type": "text/html"}, {"status": 404}):
+            with self.subTest(**options):
+                response = self.process(**options)
+                self.assertFalse(response.has_header("Content-Encoding"))
+                self.assertFalse(response.has_header("Vary"))
+        with override_settings(RESPONSE_COMPRESSION={**settings.RESPONSE_COMPRESSION, "ENABLED": False}):
+            self.assertFalse(self.process().has_header("Content-Encoding"))
+
+
+class RendererTests(SimpleTestCase):
+    DATA = {"results": [{"movie_title": "Heat", "vote_average": Decimal("8.3"), "embedding": np.array([0.5, 0.25])}], 1: None}
+
+    def test_same_json_as_drf(self):
+        expected = json.loads(JSONRenderer().render(self.DATA))
+        self.assertEqual(json.loads(renderers.ORJSONRenderer().render(self.DATA)), expected)
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertEqual(json.loads(renderers.ORJSONRenderer().render(self.DATA)), expected)
+        self.assertEqual(renderers.ORJSONRenderer().render(None), b"")
+
+    @unittest.skipUnless(installed("msgpack"), "needs msgpack")
+    def test_msgpack(self):
+        import msgpack
+
+        data = msgpack.unpackb(renderers.MessagePackRenderer().render({"results": self.DATA["results"]}), raw=False)
+        self.assertEqual(data, {"results": [{"movie_title": "Heat", "vote_average": 8.3, "embedding": [0.5, 0.25]}]})
+
+    def test_negotiation_skips_missing_libraries(self):
+        def select(accept):
+            request = Request(APIRequestFactory().get("/imdb/movies/search/", HTTP_ACCEPT=accept))
+            renderer, _ = renderers.AvailableRenderersNegotiation().select_renderer(
+                request, [renderer() for renderer in renderers.API_RENDERERS]
+            )
+            return renderer
+
+        with mock.patch.object(renderers.MessagePackRenderer, "available", False):
+            self.assertIsInstance(select("application/json"), renderers.ORJSONRenderer)
+            with self.assertRaises(NotAcceptable):
+                select("application/msgpack")
+            response = renderers.render_response(RequestFactory().get("/", HTTP_ACCEPT="application/msgpack"), {"a": 1})
+            self.assertEqual((response["Content-Type"], response.content), ("application/json", b'{"a":1}'))
+        with mock.patch.object(renderers.MessagePackRenderer, "available", True):
+            self.assertIsInstance(select("application/msgpack"), renderers.MessagePackRenderer)
+
+
+class LogsTests(SimpleTestCase):
+    @staticmethod
+    def record(name="imdb_picker.requests", level=logging.INFO, created=1000.0, **extra):
+        record = logging.LogRecord(name, level, __file__, 1, "search %s", ("heat",), None)
+        record.created = created
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.LogRecord("imdb_picker", logging.ERROR, __file__, 1, "failed %s", ("heat",), sys.exc_info())
+        record.created = 0.0
+        record.__dict__.update(query="heat", results=np.int64(3), _private=1)
+        expected = {
+            "time": "1970-01-01T00:00:00.000+00:00", "level": "ERROR", "logger": "imdb_picker",
+            "message": "failed heat", "pid": record.process, "query": "heat", "results": 3,
+        }
+        payload = json.loads(logs.JSONFormatter().format(record))
+        self.assertIn("ValueError: boom", payload.pop("exception"))
+        self.assertEqual(payload, expected)
+        with mock.patch.object(logs, "orjson", None), mock.patch.object(logs, "json", json, create=True):
+            payload = json.loads(logs.JSONFormatter().format(record))
+        payload.pop("exception")
+        self.assertEqual(payload, {**expected, "results": "3"})
+
+    def test_sampling_rate(self):
+        sampling = logs.SamplingFilter({"imdb_picker.requests": {"rate": 0.0}})
+        self.assertFalse(sampling.filter(self.record()))
+        self.assertFalse(sampling.filter(self.record("imdb_picker.requests.search")))
+        self.assertTrue(sampling.filter(self.record(level=logging.WARNING)))
+        self.assertTrue(sampling.filter(self.record("imdb_picker")))
+        self.assertTrue(logs.SamplingFilter({"imdb_picker.requests": {"rate": 1.0}}).filter(self.record()))
+
+    def test_sampling_per_second(self):
+        sampling = logs.SamplingFilter({"imdb_picker.requests": {"rate": 1.0, "per_second": 2}})
+        kept = [sampling.filter(self.record(created=created)) for created in (1000.0, 1000.1, 1000.2, 1000.3, 1000.8, 1002.0, 1002.0, 1002.0)]
+        self.assertEqual(kept, [True, True, False, False, True, True, True, False])
+
+    def test_queue_handler(self):
+        stream = io.StringIO()
+        handler = logs.QueueStreamHandler(stream, queue_size=1)
+        handler.setFormatter(logs.JSONFormatter())
+        handler.listener.stop()
+        for number in range(3):
+            handler.handle(self.record(number=number))
+        # the queue holds one record, the next ones were dropped
+        self.assertEqual(handler.queue.get_nowait().number, 0)
+        handler.listener.start()
+        handler.handle(self.record(number=3))
+        handler.close()
+        self.assertEqual([json.loads(line) for line in stream.getvalue().splitlines()][0]["dropped_records"], 2)
@@ -2,6 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from imdb_picker.views import MovieViewSet
 from imdb_picker import views
+from imdb_picker import async_views
 
 
 router = DefaultRouter()
@@ -10,5 +11,11 @@ router.register(r'movies', MovieViewSet, basename='movie')
 
 urlpatterns = [
     path('', include(router.urls)),
+    # async (ASGI) versions of the read-only endpoints
+    path('async/movies/full_text_search/', async_views.movie_full_text_search, name='async-movie-full-text-search'),
+    path('async/movies/semantic_search/', async_views.movie_semantic_search, name='async-movie-semantic-search'),
+    path('async/movies/hybrid_search/', async_views.movie_hybrid_search, name='async-movie-hybrid-search'),
+    path('async/movies/info/', async_views.movie_info, name='async-movie-info'),
+    path('async/movies/list_movies/', async_views.list_movies, name='async-movie-list-movies'),
 ]
 
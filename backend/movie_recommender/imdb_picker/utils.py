@@ -1,9 +1,28 @@
-from elasticsearch import Elasticsearch, NotFoundError, ConnectionError
-from sentence_transformers import SentenceTransformer
+from elasticsearch import NotFoundError, ConnectionError
+from django.conf import settings
 from django.http import JsonResponse
+from .embeddings import EmbeddingModelRegistry
+from .ann import get_vector_index
+from .ranking import FEATURE_SOURCE_FIELDS, candidate_features, get_reranker, stable_seed
+from .catalog import CATALOG_BUCKETS, TITLE_INITIAL_FIELD, catalog_bucket
+from .caching import LRUTTLCache, ResponseCache, get_query_embedding_cache
+from .batching import BackgroundEmbedder, EmbeddingQueueFull, get_embedding_batcher
+from .es_client import get_async_elasticsearch_client, get_elasticsearch_client
+from .metrics import HYBRID_SEARCH_FALLBACKS, STAGE_DURATION
+from .facets import facet_aggregations, facet_counts, filter_clauses, filter_key, knn_limits
+from .fusion import fuse
+from .suggest import build_suggest_index, get_suggest_index
+import asyncio
+import logging
+import numpy as np
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import os
+import time
+from contextlib import contextmanager
 import requests
 
+logger = logging.getLogger(__name__)
+
 
 
 def api_error_handler(func):
@@ -13,26 +32,112 @@ def api_error_handler(func):
         except NotFoundError:
             return {"error": "Not found"}
         except ConnectionError:
+            logger.warning("Elasticsearch connection error", extra={"function": func.__qualname__})
             return {"error": "Elasticsearch connection error"}
         except Exception as e:
+            logger.exception("Request failed", extra={"function": func.__qualname__})
             return {"error": str(e)}
     return wrapper
 
+def async_api_error_handler(func):
+    async def wrapper(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except NotFoundError:
+            return {"error": "Not found"}
+        except ConnectionError:
+            logger.warning("Elasticsearch connection error", extra={"function": func.__qualname__})
+            return {"error": "Elasticsearch connection error"}
+        except Exception as e:
+            logger.exception("Request failed", extra={"function": func.__qualname__})
+            return {"error": str(e)}
+    return wrapper
+
+class StageTimer:
+    """
+    Records how long each stage of a request takes. The timings are exported
+    to Prometheus and can be returned to the client as a Server-Timing header.
+    """
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = elapsed
+            STAGE_DURATION.labels(self.endpoint, name).observe(elapsed)
+
+    def server_timing(self):
+        """Format the recorded stages as a Server-Timing header value."""
+        return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in self.stages.items())
+
 class GeneralUtils:
     @staticmethod
-    def create_vector_embedding(query):
+    def create_vector_embedding(query, model_key=None):
         """    Create a vector embedding for the query using SentenceTransformer.
         Args:
             query (str): The input query to be embedded.
-        This function initializes a SentenceTransformer model and encodes the query into a vector.
+            model_key (str): The embedding model to use, see settings.EMBEDDING_MODELS.
+        The model is loaded once per process by EmbeddingModelRegistry and shared between requests,
+        and embeddings of repeated queries are served from the query embedding cache.
         """
         if type(query) is not str:
             query = " ".join(query)
-        # Initialize the SentenceTransformer model
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        # Create the embedding
-        embedding = model.encode(query)
-        return embedding.tolist()  # Convert to list for compatibility with Elasticsearch
+
+        def encode():
+            if settings.EMBEDDING_BATCHING["ENABLED"]:
+                # Share one forward pass with the other requests in flight
+                return get_embedding_batcher(model_key).encode(query)
+            # Reuse the process-wide model instead of loading the weights again
+            model = EmbeddingModelRegistry.get(model_key)
+            # Create the embedding
+            embedding = model.encode(query)
+            return embedding.tolist()  # Convert to list for compatibility with Elasticsearch
+
+        model_id = EmbeddingModelRegistry.model_id(model_key)
+        return get_query_embedding_cache().get_or_compute(query, model_id, encode)
+    @staticmethod
+    def create_vector_embedding_within(query, model_key=None, budget_ms=None):
+        """
+        Create the embedding of the query if it takes less than ``budget_ms``.
+        Cached embeddings are returned at once; otherwise the embedding runs on
+        HYBRID_EMBEDDINGS (shared with the identical queries in flight) and is
+        abandoned after the budget, but still finishes and fills the cache for
+        the next request.
+        Returns:
+            list: The embedding, or None if it was not ready within the budget.
+        Raises:
+            EmbeddingQueueFull: Too many embeddings are already in flight.
+        """
+        model_id = EmbeddingModelRegistry.model_id(model_key)
+        cached = get_query_embedding_cache().get(query, model_id)
+        if cached is not None:
+            return cached
+        future = HYBRID_EMBEDDINGS.submit((model_id, query), query, model_key)
+        try:
+            return future.result(timeout=None if budget_ms is None else budget_ms / 1000)
+        except FutureTimeoutError:
+            return None
+    @staticmethod
+    def is_cacheable(payload):
+        """Error payloads (see api_error_handler) must not be cached."""
+        if isinstance(payload, dict):
+            return "error" not in payload and all(GeneralUtils.is_cacheable(value) for value in payload.values())
+        return True
+
+    @staticmethod
+    def is_cacheable_movie_info(movie):
+        """
+        A movie that is not found yet (e.g. while it is being ingested) must not
+        be cached for the TTL of the response cache, nor must errors.
+        """
+        return movie != ElasticsearchUtils.MOVIE_NOT_FOUND and GeneralUtils.is_cacheable(movie)
+
     @staticmethod
     def calculate_total_pages(total_items, items_per_page):
         """Calculate the total number of pages given total items and items per page."""
@@ -41,21 +146,22 @@ class GeneralUtils:
         return (total_items + items_per_page - 1) // items_per_page
     
     
-class ElasticsearchUtils:
-    def __init__(self, index_name, host_address):
-        self.es = Elasticsearch(host_address)
-        self.index_name = index_name
-    @api_error_handler
-    def full_text_search(self, query,output_fields=["title", "description", "genres", "actors", "directors","poster_path"],search_fields=["title", "description", "genres", "actors", "directors"]):
-        """
-        Perform a full-text search on the Elasticsearch index for movies.
-        Args:
-            query (str): The search query.
-            index_name (str): The name of the Elasticsearch index.
-        """
+class MovieQueries:
+    """
+    Builders for the Elasticsearch request bodies, shared by the sync and the
+    async Elasticsearch utils.
+    """
+    # fields displayed for every similar movie
+    SIMILAR_MOVIE_FIELDS = [
+        "title", "vote_average", "tagline", "cast", "director",
+        "producer", "release_date", "overview", "poster_path"
+    ]
+
+    @staticmethod
+    def full_text_search(query, output_fields, search_fields):
         ## ["title", "vote_average", "tagline", "cast", "director", "producer", "release_date", "overview", "release_date", "poster_path", "genres", "poster_path", "popularity", "academy_winner"],
         # filter the output fields
-        search_query = {
+        return {
             "_source": output_fields,
             "query": {
                 "multi_match": {
@@ -64,117 +170,618 @@ class ElasticsearchUtils:
                 }
             }
         }
-        response = self.es.search(index=self.index_name, body=search_query)
-        return [hit['_source'] for hit in response['hits']['hits']]
 
-    @api_error_handler
-    def semantic_search(self, query, output_fields=["title", "description", "genres", "actors", "directors", "poster_path  "], k=5, num_candidates=100):
-        """
-        Perform a semantic search on the Elasticsearch index for movies.
-        Args:
-            query (str): The search query.
-            index_name (str): The name of the Elasticsearch index.
-        """
-        query_vector = GeneralUtils.create_vector_embedding(query)
-        search_query = {
+    @staticmethod
+    def semantic_search(query_vector, output_fields, k, num_candidates, filters=None):
+        knn = {
+            "field": "embedding",  # Assuming 'embeddings' is the field with vector data
+            "query_vector": query_vector,  # Use the created vector
+            "k": k,  # Number of nearest neighbors to returnn
+            "num_candidates": num_candidates # Number of candidates to consider
+        }
+        if filters:
+            # pre-filter: the HNSW traversal only collects matching movies
+            knn["filter"] = {"bool": {"filter": filter_clauses(filters)}}
+        return {
             ## "_source": ["title", "vote_average", "tagline", "cast", "director", "producer", "release_date", "overview", "release_date", "poster_path", "genres", "poster_path", "popularity", "academy_winner"],
             "_source": output_fields,
+            "query": {"knn": knn}
+        }
+
+    @staticmethod
+    def count_matching(filters):
+        return {"bool": {"filter": filter_clauses(filters)}}
+
+    @staticmethod
+    def get_source_params(source):
+        """Translate a search style _source filter into the arguments of a GET/mget."""
+        if source is True:
+            return {}
+        if isinstance(source, dict):
+            return {"source_excludes": source.get("excludes"), "source_includes": source.get("includes")}
+        return {"source_includes": source}
+
+    @staticmethod
+    def movie_by_poster_path(poster_path, source=True):
+        # exact lookup on the keyword subfield in filter context: no scoring, cacheable,
+        # and no risk of an analyzed match returning another movie first
+        return {
+            "size": 1,
+            "_source": source,
             "query": {
-                "knn": {
-                    "field": "embedding",  # Assuming 'embeddings' is the field with vector data
-                    "query_vector": query_vector,  # Use the created vector
-                    "k": k,  # Number of nearest neighbors to returnn
-                    "num_candidates": num_candidates # Number of candidates to consider
+                "bool": {
+                    "filter": [{"term": {"poster_path.keyword": poster_path}}]
                 }
             }
         }
-        response = self.es.search(index=self.index_name, body=search_query)
-        return [hit['_source'] for hit in response['hits']['hits']]
-    
-    @api_error_handler
-    def fetch_embedding(self, poster_path):
-            search_query = {
-                    "_source": ["title", "embedding"],
-                    "query": {
-                        "match": {
-                            "poster_path": poster_path
-                        }
-                    }
-                }
-            response = self.es.search(index="movie_data_9", body=search_query)
-            # lets get the vector embedding for the movie
-            vector_embedding = response["hits"]["hits"][0]["_source"]["embedding"]
-            id = response["hits"]["hits"][0]["_id"]
-            return id, vector_embedding
-    @api_error_handler
-    def fetch_similar_movies(self, poster_path):
-        """
-        Fetch similar movies for a given poster path using KNN + function_score query in Elasticsearch.
-        """
-        print("hello from fetch_similar_movies")
 
-        id, vector_embed = self.fetch_embedding(poster_path)
+    @staticmethod
+    def movie_with_similar_movies(id, similar_ids, fields=None):
+        # mget docs: the movie without its embedding (or only ``fields``), then the display fields of its similar movies
+        return [
+            {"_id": id, "_source": {"includes": fields} if fields else {"excludes": ["embedding"]}},
+            *({"_id": similar_id, "_source": MovieQueries.SIMILAR_MOVIE_FIELDS} for similar_id in similar_ids),
+        ]
+
+    @staticmethod
+    def watchlist_entry(movie, output_fields):
+        if movie.startswith("/"):
+            # entries saved by update_watchlist are poster paths: exact match, no scoring
+            query = {"bool": {"filter": [{"term": {"poster_path.keyword": movie}}]}}
+        else:
+            # older entries are movie names, take the best full text match
+            query = {"multi_match": {"query": movie, "fields": ["title", "description", "genres", "actors", "directors"]}}
+        return {"size": 1, "_source": output_fields, "query": query}
+
+    @staticmethod
+    def hybrid_search(index, query, query_vector, output_fields, search_fields, window, num_candidates):
+        # msearch body: the lexical and the semantic searches in one round-trip,
+        # their top ``window`` hits are fused by the application (fusion.fuse)
+        searches = [{"index": index}, {**MovieQueries.full_text_search(query, output_fields, search_fields), "size": window}]
+        if query_vector is not None:
+            searches += [{"index": index}, {**MovieQueries.semantic_search(query_vector, output_fields, window, num_candidates), "size": window}]
+        return searches
 
-        # Construct KNN and filter query
-        knn_query = {
+    @staticmethod
+    def filtered_search(query, filters, output_fields, search_fields, page, movies_per_page, facets=True):
+        # the filters are not scored: filter context, cached per clause by the node query cache
+        must = [{"multi_match": {"query": query, "fields": search_fields}}] if query else []
+        body = {
+            "from": (page - 1) * movies_per_page,
+            "size": movies_per_page,
+            "_source": output_fields,
+            "track_total_hits": True,
+            "query": {"bool": {"must": must, "filter": filter_clauses(filters)}},
+            # without a query, the most popular movies first
+            "sort": ["_score"] if query else [
+                {"popularity": {"order": "desc", "missing": "_last"}}, {"title.keyword": "asc"},
+            ],
+        }
+        if facets:
+            body["aggs"] = facet_aggregations()
+        return body
+
+    @staticmethod
+    def similar_movies(id, vector_embed, k, num_candidates, source, filters=None):
+        # kNN candidates only: they are ranked in the application (ranking.Reranker),
+        # so that the order is the same in every worker and can be cached
+        return {
+            "size": k,
+            "_source": source,
             "knn": {
                 "field": "embedding",
                 "query_vector": vector_embed,
-                "k": 100,
-                "num_candidates": 1000
+                "k": k,
+                "num_candidates": num_candidates,
+                # the movie itself, and the movies not matching the filters
+                "filter": {"bool": {"must_not": [{"ids": {"values": [id]}}], "filter": filter_clauses(filters or {})}}
             }
         }
 
-        must_not_filter = {
-            "term": {
-                "movie_id.keyword": id
+    @staticmethod
+    def movies_by_alphabet(alphabet):
+        if settings.CATALOG_PAGINATION["TITLE_INITIAL"]:
+            # precomputed bucket, in filter context: no scoring and cached by Elasticsearch
+            return {
+                "bool": {
+                    "filter": [{"term": {TITLE_INITIAL_FIELD: catalog_bucket(alphabet)}}]
+                }
+            }
+        return {
+            "prefix": {
+                "title.keyword": alphabet.lower()
             }
         }
 
-        # Define scoring functions
-        functions = [
-            {
-                "filter": {"range": {"imdb_rating": {"gte": 7.0}}},
-                "weight": 1.5
-            },
-            {
-                "field_value_factor": {
-                    "field": "popularity",
-                    "factor": 0.3,
-                    "modifier": "log1p"
-                }
-            },
-            {
-                "random_score": {
-                    "seed": hash(id) % 1000
-                },
-                "weight": 0.3
+    @staticmethod
+    def catalog_counts():
+        return {
+            "size": 0,
+            "aggs": {
+                "initials": {"terms": {"field": TITLE_INITIAL_FIELD, "size": len(CATALOG_BUCKETS)}}
             }
-        ]
+        }
 
-        # Combine everything into one search query
+    @staticmethod
+    def list_movies_by_alphabet(alphabet, page, movies_per_page, track_total_hits=True):
+        # Calculate the starting index for pagination
+        start_index = (page - 1) * movies_per_page
+
+        return {
+            "_source": ["title", "poster_path", "release_date", "vote_average"],
+            "query": MovieQueries.movies_by_alphabet(alphabet),
+            "from": start_index,
+            "size": movies_per_page,
+            "sort": [
+                {"title.keyword": {"order": "asc"}}
+            ],
+            "track_total_hits": track_total_hits,
+        }
+
+    @staticmethod
+    def list_movies_after(alphabet, movies_per_page, pit_id=None, keep_alive=None, search_after=None):
+        # search_after on a point in time: every page costs the same however deep it is.
+        # The poster path breaks ties between equal titles (remakes); on the point in
+        # time, _shard_doc breaks the remaining ones. The first page has no point in time.
         search_query = {
-            "size": 10,
-            "_source": [
-                "title", "vote_average", "tagline", "cast", "director",
-                "producer", "release_date", "overview", "poster_path"
+            "_source": ["title", "poster_path", "release_date", "vote_average"],
+            "query": MovieQueries.movies_by_alphabet(alphabet),
+            "size": movies_per_page,
+            "sort": [
+                {"title.keyword": {"order": "asc"}},
+                {"poster_path.keyword": {"order": "asc"}},
             ],
-            "query": {
-                "function_score": {
-                    "query": {
-                        "bool": {
-                            "must": [knn_query],
-                            "must_not": [must_not_filter]
-                        }
-                    },
-                    "functions": functions,
-                    "score_mode": "multiply"
-                }
-            }
+            "track_total_hits": False,
         }
+        if pit_id is not None:
+            search_query["sort"].append({"_shard_doc": {"order": "asc"}})
+            search_query["pit"] = {"id": pit_id, "keep_alive": keep_alive}
+        if search_after is not None:
+            search_query["search_after"] = search_after
+        return search_query
+
+
+# the highest _shard_doc sort value: search_after it skips every document tied on the other sort values
+MAX_SHARD_DOC = 2 ** 63 - 1
+
+# (index, poster path) -> document id, filled by lookup_movie so that known movies are fetched with a GET
+POSTER_PATH_IDS = LRUTTLCache(
+    settings.POSTER_PATH_ID_CACHE["MAX_ENTRIES"], settings.POSTER_PATH_ID_CACHE["TTL"], name="poster_path_id"
+)
+
+# (index, generation, query) -> number of matching movies, so pages do not have to track total hits
+CATALOG_COUNTS = LRUTTLCache(1024, settings.CATALOG_PAGINATION["COUNT_TTL"], name="catalog_count")
+
+# (index, generation, filters) -> facet counts of the filtered searches without a text query
+FACET_COUNTS = LRUTTLCache(
+    settings.FACETED_SEARCH["FACET_CACHE_ENTRIES"], settings.FACETED_SEARCH["FACET_TTL"], name="facet_counts"
+)
+
+# (index, generation, filters) -> number of matching movies, to size the filtered kNN searches
+FILTER_COUNTS = LRUTTLCache(4096, settings.FILTERED_KNN["COUNT_TTL"], name="filter_count")
+
+# index name -> generation stamp of the physical index(es) behind it
+INDEX_GENERATIONS = LRUTTLCache(256, settings.RESPONSE_CACHE["GENERATION_TTL"], name="index_generation")
+RESPONSE_CACHE = ResponseCache(
+    settings.RESPONSE_CACHE["MAX_BYTES"], settings.RESPONSE_CACHE["TTL"], settings.RESPONSE_CACHE["STALE_TTL"],
+)
+# index name -> generation seen last, to notice when an alias is switched to a new index
+LAST_GENERATIONS = {}
+
+
+def catalog_bucket_counts(response):
+    """{title initial bucket: number of movies} of a MovieQueries.catalog_counts response."""
+    return {bucket['key']: bucket['doc_count'] for bucket in response['aggregations']['initials']['buckets']}
+
+
+def invalidate_index_caches():
+    """
+    Drop the caches holding data of a previous index generation. Responses are
+    keyed by generation and would only age out, the document ids and counts
+    would be served as is.
+    """
+    POSTER_PATH_IDS.clear()
+    CATALOG_COUNTS.clear()
+    FACET_COUNTS.clear()
+    FILTER_COUNTS.clear()
+    RESPONSE_CACHE.clear()
+
+
+def remember_generation(index_name, indices):
+    """
+    Build the generation stamp of ``index_name`` from the indices.get response
+    of the indices behind it and cache it, dropping the caches if it changed.
+    """
+    generation = ",".join(sorted(
+        f"{name}@{index['settings']['index']['uuid']}" for name, index in indices.items()
+    ))
+    INDEX_GENERATIONS.set(index_name, generation)
+    if LAST_GENERATIONS.setdefault(index_name, generation) != generation:
+        # the alias was switched (see reindex_movies)
+        LAST_GENERATIONS[index_name] = generation
+        invalidate_index_caches()
+    return generation
+
+
+# background embeddings of the hybrid searches, bounded so that a model slower than the
+# budget under load rejects new queries instead of queueing work nobody waits for
+HYBRID_EMBEDDINGS = BackgroundEmbedder(
+    GeneralUtils.create_vector_embedding,
+    max_workers=settings.HYBRID_SEARCH["EMBEDDING_THREADS"],
+    max_pending=settings.HYBRID_SEARCH["MAX_PENDING_EMBEDDINGS"],
+    name="hybrid",
+)
+
+SEARCH_FIELDS = ["title", "description", "genres", "actors", "directors"]
+
+
+def search_error(response):
+    """The reason of a failed msearch response."""
+    error = response["error"]
+    return error.get("reason", "search failed") if isinstance(error, dict) else error
+
+
+def fuse_hybrid_results(responses, options):
+    """
+    Fuse the msearch responses of MovieQueries.hybrid_search.
+    Returns:
+        dict: The ``size`` best sources and the mode, "hybrid" or "lexical".
+    """
+    lexical, *semantic = responses
+    if "error" in lexical:
+        raise RuntimeError(search_error(lexical))
+    if semantic and "error" in semantic[0]:
+        # served lexical only, as when the embedding misses its budget
+        HYBRID_SEARCH_FALLBACKS.labels("search").inc()
+        logger.warning("Semantic half of a hybrid search failed", extra={"error": search_error(semantic[0])})
+        semantic = []
+    hit_lists = [response["hits"]["hits"] for response in [lexical, *semantic]]
+    weights = [options["lexical_weight"], options["semantic_weight"]][:len(hit_lists)]
+    hits = fuse(hit_lists, weights, fusion=options["fusion"], rank_constant=options["rank_constant"])
+    return {
+        "results": [hit["_source"] for hit in hits[:options["size"]]],
+        "mode": "hybrid" if len(hit_lists) > 1 else "lexical",
+    }
+
+
+def movie_info_source(fields=None, with_embedding=True):
+    """_source filter of the movie of movie_info: ``fields`` or everything, plus the embedding for the kNN query."""
+    if fields:
+        return {"includes": fields + ["embedding"] if with_embedding else fields}
+    return True if with_embedding else {"excludes": ["embedding"]}
+
+
+def similar_movies_query(id, vector_embed, reranker, limits=None, filters=None):
+    """
+    The kNN query of the similar movie candidates, with the fields needed to display and rank them.
+    Args:
+        limits (tuple): (k, num_candidates), defaults to SIMILAR_MOVIES_RANKING (see knn_limits).
+    """
+    config = settings.SIMILAR_MOVIES_RANKING
+    k, num_candidates = limits or (config["CANDIDATES"], config["NUM_CANDIDATES"])
+    source = MovieQueries.SIMILAR_MOVIE_FIELDS + FEATURE_SOURCE_FIELDS
+    if reranker.needs_vectors:
+        source = source + ["embedding"]
+    return MovieQueries.similar_movies(id, vector_embed, k, num_candidates, source, filters)
+
+
+def rank_similar_movies(id, hits, reranker):
+    """Rank the kNN hits of a movie and return the display fields of the best ones."""
+    if not hits:
+        return []
+    sources = [hit['_source'] for hit in hits]
+    candidates = candidate_features(sources)
+    # kNN _score of dot_product and cosine similarities is (1 + cosine) / 2
+    candidates.update(similarity=np.array([2 * hit['_score'] - 1 for hit in hits]), seed=stable_seed(id))
+    if reranker.needs_vectors and all(source.get("embedding") for source in sources):
+        # without vectors (embedding excluded from _source) the ranking falls back to relevance only
+        candidates["vectors"] = np.array([source["embedding"] for source in sources], dtype=np.float32)
+    best = reranker.rank(candidates, settings.SIMILAR_MOVIES_RANKING["SIZE"])
+    return [
+        {field: sources[i][field] for field in MovieQueries.SIMILAR_MOVIE_FIELDS if field in sources[i]}
+        for i in best
+    ]
+
+
+class ElasticsearchUtils:
+    # movie_info of a poster path that is not in the index
+    MOVIE_NOT_FOUND = {'similar_movies': []}
 
+    def __init__(self, index_name, host_address=None, client_alias="default"):
+        self.index_name = index_name
+        self.host_address = host_address
+        self.client_alias = client_alias
+
+    @property
+    def es(self):
+        """The pooled Elasticsearch client of the current process (see es_client.get_elasticsearch_client)."""
+        return get_elasticsearch_client(self.client_alias, hosts=self.host_address)
+
+    def index_generation(self):
+        """
+        Return a stamp of the physical index(es) behind ``self.index_name`` (name and uuid).
+        It changes when the index is rebuilt or an alias is switched, which invalidates every
+        response cached under the previous stamp, checked every RESPONSE_CACHE_GENERATION_TTL
+        seconds. Returns None if Elasticsearch cannot be reached.
+        """
+        generation = INDEX_GENERATIONS.get(self.index_name)
+        if generation is None:
+            try:
+                indices = self.es.indices.get(index=self.index_name, filter_path="*.settings.index.uuid")
+            except Exception:
+                return None
+            generation = remember_generation(self.index_name, indices)
+        return generation
+
+    def vector_index(self):
+        """The in-process VectorIndex of the current generation, None to use the Elasticsearch kNN query."""
+        return get_vector_index(self.index_generation())
+
+    def cached(self, parts, compute, cacheable=GeneralUtils.is_cacheable, refresh=None):
+        """
+        Serve ``compute()`` from the response cache under a key made of the index,
+        its generation and ``parts``.
+        Args:
+            cacheable (callable): Tells whether a payload may be cached.
+            refresh (callable): Recomputes a stale payload in the background (see ResponseCache.get_or_compute).
+        Returns:
+            tuple: (payload, etag). The etag is None when the cache was bypassed.
+        """
+        generation = self.index_generation()
+        if generation is None:
+            return compute(), None
+        key = ":".join([self.index_name, generation, *parts])
+        return RESPONSE_CACHE.get_or_compute(key, compute, cacheable=cacheable, refresh=refresh)
+
+    @api_error_handler
+    def full_text_search(self, query,output_fields=["title", "description", "genres", "actors", "directors","poster_path"],search_fields=["title", "description", "genres", "actors", "directors"]):
+        """
+        Perform a full-text search on the Elasticsearch index for movies.
+        Args:
+            query (str): The search query.
+            index_name (str): The name of the Elasticsearch index.
+        """
+        search_query = MovieQueries.full_text_search(query, output_fields, search_fields)
+        response = self.es.search(index=self.index_name, body=search_query)
+        return [hit['_source'] for hit in response['hits']['hits']]
+
+    def count_matching(self, filters):
+        """Number of movies matching ``filters``, cached per index generation."""
+        generation = self.index_generation()
+        key = (self.index_name, generation, filter_key(filters))
+        matching = FILTER_COUNTS.get(key) if generation else None
+        if matching is None:
+            matching = self.es.count(index=self.index_name, query=MovieQueries.count_matching(filters))['count']
+            if generation:
+                FILTER_COUNTS.set(key, matching)
+        return matching
+
+    def knn_limits(self, k, num_candidates, filters):
+        """k and num_candidates of a kNN search pre-filtered by ``filters`` (see facets.knn_limits)."""
+        if not filters:
+            return k, num_candidates
+        return knn_limits(k, num_candidates, self.count_matching(filters), self.count_matching({}))
+
+    @api_error_handler
+    def semantic_search(self, query, output_fields=["title", "description", "genres", "actors", "directors", "poster_path"], k=5, num_candidates=100, filters=None):
+        """
+        Perform a semantic search on the Elasticsearch index for movies.
+        Args:
+            query (str): The search query.
+            index_name (str): The name of the Elasticsearch index.
+            filters (dict): Structured filters (see facets.search_filters) applied inside the kNN
+                search; k and num_candidates are then adapted to their selectivity.
+        """
+        k, num_candidates = self.knn_limits(k, num_candidates, filters)
+        if not k:
+            return []
+        query_vector = GeneralUtils.create_vector_embedding(
+            query, model_key=EmbeddingModelRegistry.model_key_for_index(self.index_name)
+        )
+        search_query = MovieQueries.semantic_search(query_vector, output_fields, k, num_candidates, filters)
+        response = self.es.search(index=self.index_name, body=search_query)
+        return [hit['_source'] for hit in response['hits']['hits']]
+    
+    @api_error_handler
+    def hybrid_search(self, query, options, output_fields=["title", "description", "genres", "actors", "directors", "poster_path"], timer=None):
+        """
+        Lexical (multi_match) and semantic (kNN) search in one msearch request, fused
+        with reciprocal rank fusion or weighted scores. If the query embedding is not
+        ready within options["budget_ms"], only the lexical search runs.
+        Args:
+            query (str): The search query.
+            options (dict): The tunables, see fusion.hybrid_search_options.
+            timer (StageTimer): Records the embedding and search stages.
+        """
+        timer = timer or StageTimer("hybrid_search")
+        with timer.stage("embedding"):
+            try:
+                query_vector = GeneralUtils.create_vector_embedding_within(
+                    query, EmbeddingModelRegistry.model_key_for_index(self.index_name), options["budget_ms"]
+                )
+            except EmbeddingQueueFull:
+                HYBRID_SEARCH_FALLBACKS.labels("overloaded").inc()
+                query_vector = None
+            except Exception:
+                # the model failed to load, ...
+                HYBRID_SEARCH_FALLBACKS.labels("error").inc()
+                query_vector = None
+            else:
+                if query_vector is None:
+                    HYBRID_SEARCH_FALLBACKS.labels("budget").inc()
+        searches = MovieQueries.hybrid_search(
+            self.index_name, query, query_vector, output_fields, SEARCH_FIELDS,
+            options["window"], settings.HYBRID_SEARCH["NUM_CANDIDATES"],
+        )
+        with timer.stage("search"):
+            response = self.es.msearch(searches=searches)
+        return fuse_hybrid_results(response["responses"], options)
+
+    @api_error_handler
+    def filtered_search(self, query, filters, page=1, movies_per_page=20, output_fields=["title", "description", "genres", "actors", "directors", "poster_path", "release_date", "vote_average", "runtime"]):
+        """
+        Search (or browse, without ``query``) the movies matching ``filters`` with facet counts.
+        The facets of a browse depend only on the filters and the index generation:
+        they are cached in FACET_COUNTS and the search then runs without aggregations.
+        Args:
+            query (str): Full text query, may be empty.
+            filters (dict): See facets.search_filters.
+        Returns:
+            dict: movies, total_movies and facets.
+        """
+        generation = None if query else self.index_generation()
+        key = (self.index_name, generation, filter_key(filters))
+        facets = FACET_COUNTS.get(key) if generation else None
+        search_query = MovieQueries.filtered_search(
+            query, filters, output_fields, SEARCH_FIELDS, page, movies_per_page, facets=facets is None,
+        )
         response = self.es.search(index=self.index_name, body=search_query)
-        return [hit['_source'] for hit in response['hits']['hits']] if response['hits']['hits'] else []
+        if facets is None:
+            facets = facet_counts(response['aggregations'])
+            if generation:
+                FACET_COUNTS.set(key, facets)
+        return {
+            'movies': [hit['_source'] for hit in response['hits']['hits']],
+            'total_movies': response['hits']['total']['value'],
+            'facets': facets,
+        }
+
+    def suggest_index(self):
+        """The in-process SuggestIndex of the current generation, built on first use."""
+        generation = self.index_generation()
+        if generation is None:
+            raise ConnectionError("Cannot resolve the generation of " + self.index_name)
+        return get_suggest_index(generation, lambda: build_suggest_index(self.es, self.index_name))
+
+    @api_error_handler
+    def suggest(self, prefix, size=10, types=None):
+        """
+        Autocomplete ``prefix`` with titles, actors and directors from the in-process
+        prefix index: no Elasticsearch round-trip once the index is loaded.
+        """
+        return self.suggest_index().suggest(prefix, size, types)
+
+    def lookup_movie(self, poster_path, source=True):
+        """
+        Find a movie by its exact poster path.
+        Known poster paths are resolved to their document id and fetched with a
+        GET; unknown ones with a term filter on poster_path.keyword.
+        Args:
+            poster_path (str): The poster path of the movie.
+            source: The _source filter (True, a list of fields or {"excludes": [...]}).
+        Returns:
+            dict: The hit with '_id' and '_source', or None if there is no such movie.
+        """
+        key = (self.index_name, poster_path)
+        doc_id = POSTER_PATH_IDS.get(key)
+        if doc_id is not None:
+            try:
+                doc = self.es.get(index=self.index_name, id=doc_id, **MovieQueries.get_source_params(source))
+                return {'_id': doc['_id'], '_source': doc['_source']}
+            except NotFoundError:
+                # the document was deleted or the index rebuilt since we cached its id
+                POSTER_PATH_IDS.delete(key)
+        response = self.es.search(index=self.index_name, body=MovieQueries.movie_by_poster_path(poster_path, source))
+        hits = response['hits']['hits']
+        if not hits:
+            return None
+        POSTER_PATH_IDS.set(key, hits[0]['_id'])
+        return hits[0]
+
+    def similar_movies_of(self, id, poster_path, vector_embed=None, vector_index=None, filters=None):
+        """
+        Similar movies of a movie, from the in-process vector index when there is
+        one (Elasticsearch then only returns the display fields of the chosen
+        movies), otherwise with the KNN query.
+        """
+        if vector_index is not None and not filters:
+            candidates = vector_index.similar(id, settings.SIMILAR_MOVIES_RANKING["CANDIDATES"])
+            if candidates is not None:
+                return self.hydrate_movies(candidates)
+            # indexed after the snapshot was taken
+            vector_embed = self.lookup_movie(poster_path, source=["embedding"])['_source']['embedding']
+        if vector_embed is None:
+            return []
+        return self.similar_movies_for(id, vector_embed, filters)
+
+    def hydrate_movies(self, ids):
+        """Return the display fields of movies by id, in the order of ``ids``."""
+        if not ids:
+            return []
+        response = self.es.mget(index=self.index_name, ids=ids, source_includes=MovieQueries.SIMILAR_MOVIE_FIELDS)
+        return [doc['_source'] for doc in response['docs'] if doc.get('found')]
+
+    def similar_movies_for(self, id, vector_embed, filters=None):
+        """Run the KNN query for a movie whose id and embedding are known and rank its candidates."""
+        reranker = get_reranker()
+        config = settings.SIMILAR_MOVIES_RANKING
+        limits = self.knn_limits(config["CANDIDATES"], config["NUM_CANDIDATES"], filters)
+        if not limits[0]:
+            return []
+        response = self.es.search(index=self.index_name, body=similar_movies_query(id, vector_embed, reranker, limits, filters))
+        return rank_similar_movies(id, response['hits']['hits'], reranker)
+
+    @api_error_handler
+    def movie_info(self, poster_path, timer=None, fields=None, filters=None):
+        """
+        Fetch the details of a movie together with its similar movies.
+        A single document fetch provides both the details and the embedding
+        used for the KNN query, so the page costs two dependent round-trips.
+        With precomputed similar movies (compute_neighbours) and a movie whose
+        document id is known, the page is a single mget.
+        Args:
+            poster_path (str): The poster path of the movie.
+            timer (StageTimer): Records the duration of each stage.
+            fields (list): Only fetch these fields of the movie (the similar movies keep theirs).
+            filters (dict): Only return similar movies matching these filters (see facets.search_filters).
+        Returns:
+            dict: The movie information with a 'similar_movies' list.
+        """
+        timer = timer or StageTimer("movie_info")
+        # the in-process vector index cannot filter: filtered lookups use the kNN query
+        vector_index = None if filters else self.vector_index()
+        if vector_index is not None and vector_index.neighbour_table() is not None:
+            # known movie with precomputed similar movies: a single mget
+            key = (self.index_name, poster_path)
+            id = POSTER_PATH_IDS.get(key)
+            similar_ids = vector_index.similar(id) if id is not None else None
+            if similar_ids is not None:
+                with timer.stage("mget"):
+                    response = self.es.mget(index=self.index_name, docs=MovieQueries.movie_with_similar_movies(id, similar_ids, fields))
+                movie_doc, *similar_docs = response['docs']
+                if movie_doc.get('found'):
+                    movie = dict(movie_doc['_source'])
+                    movie['similar_movies'] = [doc['_source'] for doc in similar_docs if doc.get('found')]
+                    return movie
+                POSTER_PATH_IDS.delete(key)
+        with timer.stage("document"):
+            # the embedding is only needed for the Elasticsearch KNN query
+            hit = self.lookup_movie(poster_path, source=movie_info_source(fields, with_embedding=vector_index is None))
+        if hit is None:
+            return {'similar_movies': []}
+        movie = dict(hit['_source'])
+        vector_embed = movie.pop('embedding', None)
+        with timer.stage("similar"):
+            movie['similar_movies'] = self.similar_movies_of(hit['_id'], poster_path, vector_embed, vector_index, filters)
+        return movie
+
+    @api_error_handler
+    def cached_movie_info(self, poster_path, timer=None, fields=None, filters=None):
+        """
+        movie_info served from the response cache.
+        Returns:
+            tuple: (movie information, etag)
+        """
+        parts = ("movie_info", poster_path) + (("fields=" + ",".join(fields),) if fields else ())
+        if filters:
+            parts += (repr(filter_key(filters)),)
+        return self.cached(
+            parts,
+            lambda: self.movie_info(poster_path, timer=timer, fields=fields, filters=filters),
+            cacheable=GeneralUtils.is_cacheable_movie_info,
+            # the background refresh must not record its stages in the timer of this request
+            refresh=lambda: self.movie_info(poster_path, timer=StageTimer("movie_info"), fields=fields, filters=filters),
+        )
 
     @api_error_handler
     def detailed_info(self, poster_path):
@@ -185,19 +792,9 @@ class ElasticsearchUtils:
         Returns:
             dict: A dictionary containing detailed movie information.
         """
-        print("Fetching detailed info for poster:", poster_path)
-        search_query = {
-            "_source": {
-                "excludes": ["embedding"]
-            },
-            "query": {
-                "match": {
-                    "poster_path": poster_path
-                }
-            }
-        }
-        response = self.es.search(index=self.index_name, body=search_query)
-        return response['hits']['hits'][0]['_source'] if response['hits']['hits'] else {}
+        logger.debug("detailed_info", extra={"poster_path": poster_path})
+        hit = self.lookup_movie(poster_path, source={"excludes": ["embedding"]})
+        return hit['_source'] if hit else {}
     
     @api_error_handler
     def list_movies_by_alphabet(self, alphabet, page=1, movies_per_page=10):
@@ -208,49 +805,335 @@ class ElasticsearchUtils:
             page (int): The page number for pagination.
             movies_per_page (int): Number of movies to display per page.
         Returns:
-            tuple: A tuple containing the list of movies and the total number of movies.
+            tuple: A tuple containing the list of movies and the total number of movies,
+                or an {"error": ...} dict.
         """
-        # Calculate the starting index for pagination
-        start_index = (page - 1) * movies_per_page
+        def compute():
+            # Construct the search query, the total comes from the cached count
+            search_query = MovieQueries.list_movies_by_alphabet(alphabet, page, movies_per_page, track_total_hits=False)
 
-        # Construct the search query
-        search_query = {
-            "_source": ["title", "poster_path", "release_date", "vote_average"],
-            "query": {
-                "prefix": {
-                    "title.keyword": alphabet.lower()
-                }
-            },
-            "from": start_index,
-            "size": movies_per_page,
-            "sort": [
-                {"title.keyword": {"order": "asc"}}
-            ]
-        }
+            # Execute the search query
+            response = self.es.search(index=self.index_name, body=search_query)
 
-        # Execute the search query
-        response = self.es.search(index=self.index_name, body=search_query)
+            # Extract movie data from the response
+            return {
+                'movies': [hit['_source'] for hit in response['hits']['hits']],
+                'total_movies': self.count_movies_by_alphabet(alphabet),
+            }
 
-        # Extract movie data from the response
-        movies = [hit['_source'] for hit in response['hits']['hits']]
-        total_movies = response['hits']['total']['value']
+        if settings.CATALOG_PAGINATION["TITLE_INITIAL"] and page <= settings.CATALOG_PAGINATION["CACHED_PAGES"]:
+            # the first pages of every letter only change with the index, serve them from the response cache
+            result, _ = self.cached(("list_movies", catalog_bucket(alphabet), str(page), str(movies_per_page)), compute)
+        else:
+            result = compute()
+        return result['movies'], result['total_movies']
+
+    def count_movies_by_alphabet(self, alphabet):
+        """
+        Number of movies starting with ``alphabet``, cached per index generation
+        so that listing a page does not have to count every match again.
+        With the precomputed title initials, the counts of all the letters are
+        fetched at once with a terms aggregation.
+        """
+        generation = self.index_generation()
+        if settings.CATALOG_PAGINATION["TITLE_INITIAL"]:
+            key = (self.index_name, generation, "*")
+            counts = CATALOG_COUNTS.get(key) if generation else None
+            if counts is None:
+                response = self.es.search(index=self.index_name, body=MovieQueries.catalog_counts())
+                counts = catalog_bucket_counts(response)
+                if generation:
+                    CATALOG_COUNTS.set(key, counts)
+            return counts.get(catalog_bucket(alphabet), 0)
 
-        return movies, total_movies
+        key = (self.index_name, generation, alphabet.lower())
+        total_movies = CATALOG_COUNTS.get(key) if generation else None
+        if total_movies is None:
+            response = self.es.count(index=self.index_name, query=MovieQueries.movies_by_alphabet(alphabet))
+            total_movies = response['count']
+            if generation:
+                CATALOG_COUNTS.set(key, total_movies)
+        return total_movies
+
+    @api_error_handler
+    def list_movies_by_cursor(self, alphabet, cursor=None, movies_per_page=10):
+        """
+        List movies starting with a specific alphabet letter with search_after on a point in time.
+        The first page is a plain search: the point in time is only opened when there is
+        a next page, so visitors who stop at the first page do not keep one alive.
+        Args:
+            alphabet (str): The starting letter of the movie titles.
+            cursor (dict): The decoded cursor of the previous page ('pit', 'after' and 'total'), None for the first page.
+            movies_per_page (int): Number of movies to display per page.
+        Returns:
+            dict: 'movies', 'total_movies' and 'next_cursor' (None on the last page).
+        """
+        keep_alive = settings.CATALOG_PAGINATION["PIT_KEEP_ALIVE"]
+        # counted for the first page, the next pages carry the total in their cursor
+        total_movies = cursor.get("total") if cursor else None
+        if total_movies is None:
+            total_movies = self.count_movies_by_alphabet(alphabet)
+        if cursor is None:
+            response = self.es.search(index=self.index_name, body=MovieQueries.list_movies_after(alphabet, movies_per_page))
+            pit_id = None
+        else:
+            pit_id, search_after = cursor["pit"], cursor["after"]
+            try:
+                response = self.es.search(body=MovieQueries.list_movies_after(alphabet, movies_per_page, pit_id, keep_alive, search_after))
+            except NotFoundError:
+                # the point in time expired, carry on from the same position on a new one
+                pit_id = self.es.open_point_in_time(index=self.index_name, keep_alive=keep_alive)['id']
+                response = self.es.search(body=MovieQueries.list_movies_after(alphabet, movies_per_page, pit_id, keep_alive, search_after))
+            pit_id = response.get('pit_id', pit_id)
+        hits = response['hits']['hits']
+
+        next_cursor = None
+        if len(hits) == movies_per_page:
+            after = hits[-1]['sort']
+            if pit_id is None:
+                pit_id = self.es.open_point_in_time(index=self.index_name, keep_alive=keep_alive)['id']
+                # the first page was not read on the point in time: no _shard_doc position,
+                # continue after every movie tied with its last one
+                after = after + [MAX_SHARD_DOC]
+            next_cursor = {"pit": pit_id, "after": after, "total": total_movies}
+        elif pit_id is not None:
+            # last page, release the point in time now instead of waiting for keep_alive
+            self.es.close_point_in_time(id=pit_id)
+        return {
+            'movies': [hit['_source'] for hit in hits],
+            'total_movies': total_movies,
+            'next_cursor': next_cursor,
+        }
     
-    def get_watchlist(self, watchlist):
+    @api_error_handler
+    def get_watchlist(self, watchlist, output_fields=["title", "description", "genres", "actors", "directors", "poster_path"]):
         """
         Fetch detailed information about movies in the user's watchlist.
+        All the entries are resolved with a single _msearch request.
         Args:
-            watchlist (list): The list of movie names in the user's watchlist.
+            watchlist (list): The poster paths (or, for older entries, the names) of the movies in the user's watchlist.
+            output_fields (list): The fields to return for each movie.
+        Returns:
+            list: One document per entry found, in watchlist order. Missing entries are skipped.
         """
+        entries = [movie.strip() for movie in watchlist if movie and movie.strip()]
+        if not entries:
+            return []
+        searches = []
+        for movie in entries:
+            searches.append({"index": self.index_name})
+            searches.append(MovieQueries.watchlist_entry(movie, output_fields))
+        response = self.es.msearch(searches=searches)
         watchlist_detailed_info = []
-        for movie in watchlist:
-            movie = movie.strip()
-            if not movie:
-                continue
-            res = ElasticsearchUtils.full_text_search(movie)
-            if res:
-                watchlist_detailed_info.append(res[0])  # Assuming the first result is the most relevant
+        for result in response['responses']:
+            hits = result.get('hits', {}).get('hits', [])
+            if hits:
+                watchlist_detailed_info.append(hits[0]['_source'])
         return watchlist_detailed_info
 
 
+class AsyncElasticsearchUtils:
+    """
+    Async mirror of ElasticsearchUtils on AsyncElasticsearch, for the views
+    served by an ASGI worker: a coroutine waiting on Elasticsearch does not
+    hold the worker, so one process can keep many searches in flight.
+    """
+    def __init__(self, index_name, host_address=None, client_alias="default"):
+        self.index_name = index_name
+        self.host_address = host_address
+        self.client_alias = client_alias
+
+    @property
+    def es(self):
+        """The AsyncElasticsearch client of the running event loop."""
+        return get_async_elasticsearch_client(self.client_alias, hosts=self.host_address)
+
+    async def index_generation(self):
+        """Async version of ElasticsearchUtils.index_generation."""
+        generation = INDEX_GENERATIONS.get(self.index_name)
+        if generation is None:
+            try:
+                indices = await self.es.indices.get(index=self.index_name, filter_path="*.settings.index.uuid")
+            except Exception:
+                return None
+            generation = remember_generation(self.index_name, indices)
+        return generation
+
+    async def vector_index(self):
+        return get_vector_index(await self.index_generation())
+
+    @async_api_error_handler
+    async def full_text_search(self, query, output_fields=["title", "description", "genres", "actors", "directors", "poster_path"], search_fields=["title", "description", "genres", "actors", "directors"]):
+        """Async version of ElasticsearchUtils.full_text_search."""
+        search_query = MovieQueries.full_text_search(query, output_fields, search_fields)
+        response = await self.es.search(index=self.index_name, body=search_query)
+        return [hit['_source'] for hit in response['hits']['hits']]
+
+    async def count_matching(self, filters):
+        """Async version of ElasticsearchUtils.count_matching."""
+        generation = await self.index_generation()
+        key = (self.index_name, generation, filter_key(filters))
+        matching = FILTER_COUNTS.get(key) if generation else None
+        if matching is None:
+            matching = (await self.es.count(index=self.index_name, query=MovieQueries.count_matching(filters)))['count']
+            if generation:
+                FILTER_COUNTS.set(key, matching)
+        return matching
+
+    async def knn_limits(self, k, num_candidates, filters):
+        if not filters:
+            return k, num_candidates
+        return knn_limits(k, num_candidates, await self.count_matching(filters), await self.count_matching({}))
+
+    @async_api_error_handler
+    async def semantic_search(self, query, output_fields=["title", "description", "genres", "actors", "directors", "poster_path"], k=5, num_candidates=100, filters=None):
+        """
+        Async version of ElasticsearchUtils.semantic_search.
+        The embedding is CPU bound, it runs in a thread so that the event loop keeps serving.
+        """
+        k, num_candidates = await self.knn_limits(k, num_candidates, filters)
+        if not k:
+            return []
+        query_vector = await asyncio.to_thread(
+            GeneralUtils.create_vector_embedding,
+            query, model_key=EmbeddingModelRegistry.model_key_for_index(self.index_name)
+        )
+        search_query = MovieQueries.semantic_search(query_vector, output_fields, k, num_candidates, filters)
+        response = await self.es.search(index=self.index_name, body=search_query)
+        return [hit['_source'] for hit in response['hits']['hits']]
+
+    @async_api_error_handler
+    async def hybrid_search(self, query, options, output_fields=["title", "description", "genres", "actors", "directors", "poster_path"], timer=None):
+        """
+        Async version of ElasticsearchUtils.hybrid_search. The embedding runs on
+        HYBRID_EMBEDDINGS, which does not cancel it when the budget runs out, so it
+        still fills the cache.
+        """
+        timer = timer or StageTimer("hybrid_search")
+        model_key = EmbeddingModelRegistry.model_key_for_index(self.index_name)
+        model_id = EmbeddingModelRegistry.model_id(model_key)
+        with timer.stage("embedding"):
+            query_vector = get_query_embedding_cache().get(query, model_id)
+            if query_vector is None:
+                try:
+                    embedding = asyncio.wrap_future(HYBRID_EMBEDDINGS.submit((model_id, query), query, model_key))
+                    # retrieve a late failure so that it is not logged as never retrieved
+                    embedding.add_done_callback(lambda task: task.cancelled() or task.exception())
+                    query_vector = await asyncio.wait_for(asyncio.shield(embedding), options["budget_ms"] / 1000)
+                except EmbeddingQueueFull:
+                    HYBRID_SEARCH_FALLBACKS.labels("overloaded").inc()
+                except asyncio.TimeoutError:
+                    HYBRID_SEARCH_FALLBACKS.labels("budget").inc()
+                except Exception:
+                    HYBRID_SEARCH_FALLBACKS.labels("error").inc()
+        searches = MovieQueries.hybrid_search(
+            self.index_name, query, query_vector, output_fields, SEARCH_FIELDS,
+            options["window"], settings.HYBRID_SEARCH["NUM_CANDIDATES"],
+        )
+        with timer.stage("search"):
+            response = await self.es.msearch(searches=searches)
+        return fuse_hybrid_results(response["responses"], options)
+
+    async def lookup_movie(self, poster_path, source=True):
+        """Async version of ElasticsearchUtils.lookup_movie."""
+        key = (self.index_name, poster_path)
+        doc_id = POSTER_PATH_IDS.get(key)
+        if doc_id is not None:
+            try:
+                doc = await self.es.get(index=self.index_name, id=doc_id, **MovieQueries.get_source_params(source))
+                return {'_id': doc['_id'], '_source': doc['_source']}
+            except NotFoundError:
+                POSTER_PATH_IDS.delete(key)
+        response = await self.es.search(index=self.index_name, body=MovieQueries.movie_by_poster_path(poster_path, source))
+        hits = response['hits']['hits']
+        if not hits:
+            return None
+        POSTER_PATH_IDS.set(key, hits[0]['_id'])
+        return hits[0]
+
+    async def similar_movies_of(self, id, poster_path, vector_embed=None, vector_index=None, filters=None):
+        if vector_index is not None and not filters:
+            candidates = vector_index.similar(id, settings.SIMILAR_MOVIES_RANKING["CANDIDATES"])
+            if candidates is not None:
+                return await self.hydrate_movies(candidates)
+            vector_embed = (await self.lookup_movie(poster_path, source=["embedding"]))['_source']['embedding']
+        if vector_embed is None:
+            return []
+        return await self.similar_movies_for(id, vector_embed, filters)
+
+    async def hydrate_movies(self, ids):
+        if not ids:
+            return []
+        response = await self.es.mget(index=self.index_name, ids=ids, source_includes=MovieQueries.SIMILAR_MOVIE_FIELDS)
+        return [doc['_source'] for doc in response['docs'] if doc.get('found')]
+
+    async def similar_movies_for(self, id, vector_embed, filters=None):
+        reranker = get_reranker()
+        config = settings.SIMILAR_MOVIES_RANKING
+        limits = await self.knn_limits(config["CANDIDATES"], config["NUM_CANDIDATES"], filters)
+        if not limits[0]:
+            return []
+        response = await self.es.search(index=self.index_name, body=similar_movies_query(id, vector_embed, reranker, limits, filters))
+        return rank_similar_movies(id, response['hits']['hits'], reranker)
+
+    @async_api_error_handler
+    async def movie_info(self, poster_path, timer=None, fields=None, filters=None):
+        """Async version of ElasticsearchUtils.movie_info."""
+        timer = timer or StageTimer("movie_info")
+        vector_index = None if filters else await self.vector_index()
+        if vector_index is not None and vector_index.neighbour_table() is not None:
+            key = (self.index_name, poster_path)
+            id = POSTER_PATH_IDS.get(key)
+            similar_ids = vector_index.similar(id) if id is not None else None
+            if similar_ids is not None:
+                with timer.stage("mget"):
+                    response = await self.es.mget(index=self.index_name, docs=MovieQueries.movie_with_similar_movies(id, similar_ids, fields))
+                movie_doc, *similar_docs = response['docs']
+                if movie_doc.get('found'):
+                    movie = dict(movie_doc['_source'])
+                    movie['similar_movies'] = [doc['_source'] for doc in similar_docs if doc.get('found')]
+                    return movie
+                POSTER_PATH_IDS.delete(key)
+        with timer.stage("document"):
+            hit = await self.lookup_movie(poster_path, source=movie_info_source(fields, with_embedding=vector_index is None))
+        if hit is None:
+            return {'similar_movies': []}
+        movie = dict(hit['_source'])
+        vector_embed = movie.pop('embedding', None)
+        with timer.stage("similar"):
+            movie['similar_movies'] = await self.similar_movies_of(hit['_id'], poster_path, vector_embed, vector_index, filters)
+        return movie
+
+    @async_api_error_handler
+    async def detailed_info(self, poster_path):
+        """Async version of ElasticsearchUtils.detailed_info."""
+        hit = await self.lookup_movie(poster_path, source={"excludes": ["embedding"]})
+        return hit['_source'] if hit else {}
+
+    @async_api_error_handler
+    async def list_movies_by_alphabet(self, alphabet, page=1, movies_per_page=10):
+        """Async version of ElasticsearchUtils.list_movies_by_alphabet, the total comes from the cached count."""
+        search_query = MovieQueries.list_movies_by_alphabet(alphabet, page, movies_per_page, track_total_hits=False)
+        response = await self.es.search(index=self.index_name, body=search_query)
+        movies = [hit['_source'] for hit in response['hits']['hits']]
+        return movies, await self.count_movies_by_alphabet(alphabet)
+
+    async def count_movies_by_alphabet(self, alphabet):
+        """Async version of ElasticsearchUtils.count_movies_by_alphabet, sharing its cache."""
+        generation = await self.index_generation()
+        if settings.CATALOG_PAGINATION["TITLE_INITIAL"]:
+            key = (self.index_name, generation, "*")
+            counts = CATALOG_COUNTS.get(key) if generation else None
+            if counts is None:
+                counts = catalog_bucket_counts(await self.es.search(index=self.index_name, body=MovieQueries.catalog_counts()))
+                if generation:
+                    CATALOG_COUNTS.set(key, counts)
+            return counts.get(catalog_bucket(alphabet), 0)
+
+        key = (self.index_name, generation, alphabet.lower())
+        total_movies = CATALOG_COUNTS.get(key) if generation else None
+        if total_movies is None:
+            total_movies = (await self.es.count(index=self.index_name, query=MovieQueries.movies_by_alphabet(alphabet)))['count']
+            if generation:
+                CATALOG_COUNTS.set(key, total_movies)
+        return total_movies
@@ -1,3 +1,7 @@
+import logging
+
+from django.conf import settings
+from django.core import signing
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.contrib.auth.models import User
@@ -11,57 +15,245 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.authtoken.models import Token
 
-from .utils import ElasticsearchUtils, GeneralUtils
+from .utils import ElasticsearchUtils, GeneralUtils, StageTimer
+from .embeddings import EmbeddingModelRegistry
+from .facets import search_filters
+from .fusion import hybrid_search_options
+from .suggest import SUGGESTION_TYPES
 
-from .serializers import MovieData2Serializer
+from .serializers import compact_movie_serializer, requested_fields
 # provide access to endpoint without authentication
 from rest_framework.permissions import AllowAny
 
-INDEX_NAME = "movie_data_9"
-ElasticsearchUtils = ElasticsearchUtils(index_name=INDEX_NAME, host_address="http://elasticsearch:9200")
+# the read alias of the movies index, see the reindex_movies command
+INDEX_NAME = settings.MOVIES_INDEX["ALIAS"]
+WATCHLIST_PAGE_SIZE = 100
+WATCHLIST_MAX_PAGE_SIZE = 1000
+CURSOR_SALT = "imdb_picker.list_movies"
+ElasticsearchUtils = ElasticsearchUtils(index_name=INDEX_NAME)
+logger = logging.getLogger(__name__)
+# one record per search request, sampled (see LOG_SAMPLING in settings.py)
+request_logger = logging.getLogger("imdb_picker.requests")
+
+
+def projection(params):
+    """
+    The ``fields=`` projection of a search request: the output field names to keep
+    (None for all) and the matching _source fields to fetch, as keyword arguments.
+    Raises:
+        ValueError: A field is not a field of the movie serializer.
+    """
+    fields = requested_fields(params)
+    if not fields:
+        return None, {}
+    return fields, {'output_fields': compact_movie_serializer.source_fields(fields)}
+
+
+def project_movie_info(movie, fields):
+    """The movie of movie_info with only the output ``fields`` (see projection), named as in the searches."""
+    if not fields or 'error' in movie:
+        return movie
+    return {**compact_movie_serializer.to_representation(movie, set(fields)), 'similar_movies': movie.get('similar_movies', [])}
+
+
+def semantic_search_params(params):
+    """
+    Filters, k and num_candidates of a semantic search request.
+    Raises:
+        ValueError: A parameter is malformed or out of range.
+    """
+    filters = search_filters(params)
+    k = int(params.get('k', 5))
+    num_candidates = int(params.get('num_candidates', 100))
+    if not 1 <= k <= settings.FILTERED_KNN['MAX_K'] or not k <= num_candidates <= settings.FILTERED_KNN['MAX_NUM_CANDIDATES']:
+        raise ValueError(f"k must be between 1 and {settings.FILTERED_KNN['MAX_K']}, "
+                         f"num_candidates between k and {settings.FILTERED_KNN['MAX_NUM_CANDIDATES']}.")
+    return filters, k, num_candidates
+
+
+def watchlist_page_params(params):
+    """
+    Page and page size of a watchlist request.
+    Raises:
+        ValueError: A parameter is malformed or out of range.
+    """
+    try:
+        page = int(params.get('page', 1))
+        page_size = int(params.get('page_size', WATCHLIST_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('page and page_size must be integers.')
+    if page < 1 or not 1 <= page_size <= WATCHLIST_MAX_PAGE_SIZE:
+        raise ValueError(f"page must be at least 1, page_size between 1 and {WATCHLIST_MAX_PAGE_SIZE}.")
+    return page, page_size
+
+
+def etag_response(request, data, etag, headers=None):
+    """
+    Build a 200 response carrying an ETag, or an empty 304 if the client already
+    has this version (If-None-Match).
+    """
+    headers = dict(headers or {})
+    if etag:
+        headers['ETag'] = etag
+        # clients may keep the payload but must revalidate it
+        headers['Cache-Control'] = 'no-cache'
+        # weak comparison: the compression middleware turns the ETag of a compressed response into W/"..."
+        if_none_match = [tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')]
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, status=status.HTTP_200_OK, headers=headers)
+
+
 class MovieViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
     @action(detail=False, methods=['get'], url_path='full_text_search')
     def movie_full_text_search(self, request):
         query = request.GET.get('q', '')
+        try:
+            fields, output_fields = projection(request.GET)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         results = []
         if query:
-            results = ElasticsearchUtils.full_text_search(query)
-        print("results:")
-        print(results)
-        serializer = MovieData2Serializer(results, many=True)
-        return Response({'results': serializer.data}, status=status.HTTP_200_OK)
+            results = ElasticsearchUtils.full_text_search(query, **output_fields)
+        request_logger.info("full_text_search", extra={
+            "query": query, "results": len(results) if isinstance(results, list) else 0,
+        })
+        return Response({'results': compact_movie_serializer.many(results, fields)}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['get'], url_path='semantic_search')
     def movie_semantic_search(self, request):
+        # optional filters as for /search/, applied inside the kNN search
         query = request.GET.get('q', '')
+        try:
+            filters, k, num_candidates = semantic_search_params(request.GET)
+            fields, output_fields = projection(request.GET)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         results = []
         if query:
-            results = ElasticsearchUtils.semantic_search(query)
+            results = ElasticsearchUtils.semantic_search(query, k=k, num_candidates=num_candidates, filters=filters, **output_fields)
+        if fields and isinstance(results, list):
+            # without fields= the _source documents are returned as they are
+            results = compact_movie_serializer.many(results, fields)
         return Response({'results': results}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'], url_path='hybrid_search')
+    def movie_hybrid_search(self, request):
+        query = request.GET.get('q', '')
+        if not query:
+            return Response({'results': [], 'mode': 'hybrid'}, status=status.HTTP_200_OK)
+        try:
+            options = hybrid_search_options(request.GET)
+            fields, output_fields = projection(request.GET)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        timer = StageTimer("hybrid_search")
+        result = ElasticsearchUtils.hybrid_search(query, options, timer=timer, **output_fields)
+        if 'error' in result:
+            return Response(result, status=status.HTTP_200_OK)
+        return Response(
+            {'results': compact_movie_serializer.many(result['results'], fields), 'mode': result['mode']}, status=status.HTTP_200_OK,
+            headers={'Server-Timing': timer.server_timing()},
+        )
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def filtered_search(self, request):
+        # filters: genres=Drama,Comedy year_from year_to min_rating max_rating min_runtime max_runtime
+        query = request.GET.get('q', '').strip()
+        try:
+            filters = search_filters(request.GET)
+            fields, output_fields = projection(request.GET)
+            page = int(request.GET.get('page', 1))
+            movies_per_page = int(request.GET.get('movies_per_page', settings.FACETED_SEARCH['PAGE_SIZE']))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if page < 1 or not 1 <= movies_per_page <= settings.FACETED_SEARCH['MAX_PAGE_SIZE']:
+            return Response(
+                {'error': f"page must be positive, movies_per_page between 1 and {settings.FACETED_SEARCH['MAX_PAGE_SIZE']}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        result = ElasticsearchUtils.filtered_search(query, filters, page=page, movies_per_page=movies_per_page, **output_fields)
+        if 'error' in result:
+            return Response(result, status=status.HTTP_200_OK)
+        return Response({
+            'results': compact_movie_serializer.many(result['movies'], fields),
+            'total_movies': result['total_movies'],
+            'total_pages': GeneralUtils.calculate_total_pages(result['total_movies'], movies_per_page),
+            'current_page': page,
+            'facets': result['facets'],
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='suggest')
+    def suggest(self, request):
+        # called on every keystroke: served from the in-process prefix index
+        query = request.GET.get('q', '')
+        types = [kind for kind in request.GET.get('types', '').split(',') if kind]
+        try:
+            size = int(request.GET.get('size', settings.SUGGEST['SIZE']))
+        except ValueError:
+            return Response({'error': 'size must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= size <= settings.SUGGEST['MAX_SIZE'] or any(kind not in SUGGESTION_TYPES for kind in types):
+            return Response(
+                {'error': f"size must be between 1 and {settings.SUGGEST['MAX_SIZE']}, types among {', '.join(SUGGESTION_TYPES)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        suggestions = ElasticsearchUtils.suggest(query, size, types) if query.strip() else []
+        if isinstance(suggestions, dict):
+            return Response(suggestions, status=status.HTTP_200_OK)
+        # the browser answers a prefix typed again (backspace, retyping) from its cache
+        headers = {'Cache-Control': f"max-age={settings.SUGGEST['BROWSER_MAX_AGE']}"}
+        return Response({'suggestions': suggestions}, status=status.HTTP_200_OK, headers=headers)
+
+    @action(detail=False, methods=['get'], url_path='embedding_status')
+    def embedding_status(self, request):
+        # report which embedding models are loaded in this worker
+        return Response({'models': EmbeddingModelRegistry.status()}, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], url_path='info')
     def movie_info(self, request):
        poster_path = request.GET.get('q', '')
        if not poster_path:
            return Response({'error': 'Query parameter "q" is required.'}, status=status.HTTP_400_BAD_REQUEST)
-       detailed_movie_data = ElasticsearchUtils.detailed_info(poster_path=poster_path)
-       similar_movies = ElasticsearchUtils.fetch_similar_movies(poster_path=poster_path)
-       print("similar_movies", similar_movies)
-       detailed_movie_data['similar_movies'] = similar_movies
+       # fields=a,b: only these fields of the movie, as for the searches (its similar_movies are always returned)
+       # filters as for /search/ only apply to the similar movies, inside their kNN search
+       try:
+           fields, output_fields = projection(request.GET)
+           filters = search_filters(request.GET)
+       except ValueError as e:
+           return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+       timer = StageTimer("movie_info")
+       result = ElasticsearchUtils.cached_movie_info(
+           poster_path=poster_path, timer=timer, fields=output_fields.get('output_fields'), filters=filters
+       )
+       if isinstance(result, dict):
+           # api_error_handler turned an error into a payload
+           return Response(result, status=status.HTTP_200_OK)
+       detailed_movie_data, etag = result
+       detailed_movie_data = project_movie_info(detailed_movie_data, fields)
+       request_logger.info("movie_info", extra={
+           "poster_path": poster_path, "similar_movies": len(detailed_movie_data.get('similar_movies') or []),
+       })
     
-       return Response(detailed_movie_data, status=status.HTTP_200_OK)
+       headers = {'Server-Timing': timer.server_timing()} if timer.stages else {}
+       return etag_response(request, detailed_movie_data, etag, headers=headers)
     
     @action(detail=False, methods=["get"], url_path="list_movies")
     def list_movies(self, request):
         page = int(request.GET.get('page', 1))
         alphabet = request.GET.get('alphabet', 'A')
         movies_per_page = int(request.GET.get('movies_per_page', 10))
-        movies, total_movies = ElasticsearchUtils.list_movies_by_alphabet(
+        if 'cursor' in request.GET:
+            return self.list_movies_by_cursor(request, alphabet, movies_per_page)
+        result = ElasticsearchUtils.list_movies_by_alphabet(
             alphabet=alphabet,
             page=page,
             movies_per_page=movies_per_page
         )
+        if isinstance(result, dict):
+            # api_error_handler turned an error into a payload
+            return Response(result, status=status.HTTP_200_OK)
+        movies, total_movies = result
         total_pages = GeneralUtils.calculate_total_pages(total_movies, movies_per_page)
         response_data = {
             'movies': movies,
@@ -71,19 +263,47 @@ class MovieViewSet(viewsets.ViewSet):
         }
         return Response(response_data, status=status.HTTP_200_OK)
 
+    def list_movies_by_cursor(self, request, alphabet, movies_per_page):
+        # cursor pagination: pass an empty "cursor" for the first page, then the returned "next_cursor"
+        cursor = None
+        if request.GET['cursor']:
+            try:
+                cursor = signing.loads(request.GET['cursor'], salt=CURSOR_SALT)
+            except signing.BadSignature:
+                return Response({'error': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+            # the cursor is tied to its letter and page size
+            alphabet, movies_per_page = cursor['alphabet'], cursor['size']
+        result = ElasticsearchUtils.list_movies_by_cursor(alphabet, cursor=cursor, movies_per_page=movies_per_page)
+        if 'error' in result:
+            return Response(result, status=status.HTTP_200_OK)
+        next_cursor = None
+        if result['next_cursor']:
+            next_cursor = signing.dumps(
+                {**result['next_cursor'], 'alphabet': alphabet, 'size': movies_per_page}, salt=CURSOR_SALT, compress=True
+            )
+        return Response({
+            'movies': result['movies'],
+            'total_movies': result['total_movies'],
+            'total_pages': GeneralUtils.calculate_total_pages(result['total_movies'], movies_per_page),
+            'next_cursor': next_cursor
+        }, status=status.HTTP_200_OK)
+
     
     @action(detail=False, methods=["post"], url_path="update_watchlist")
     def update_watchlist(self, request):
         user = request.user
-        movie_key = request.poster_path
+        # the poster path is the stable key used to hydrate the watchlist
+        movie_key = request.data.get('poster_path', '')
         ## Lets update Userprofile model
         if not user.is_authenticated:
             return Response({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+        if not movie_key:
+            return Response({'error': '"poster_path" is required.'}, status=status.HTTP_400_BAD_REQUEST)
         try:
             profile = UserProfile.objects.get(user=request.user)
-            profile.watchlist = profile.watchlist.append(movie_key)
-            print("Profile watchlist updated")
-            print(profile.watchlist)
+            if movie_key not in profile.watchlist:
+                profile.watchlist.append(movie_key)
+            logger.info("watchlist updated", extra={"user_id": user.id, "watchlist_size": len(profile.watchlist)})
             profile.save()
             return Response({"message": "Profile updated successfully"}, status=status.HTTP_200_OK)
         except UserProfile.DoesNotExist:
@@ -96,14 +316,23 @@ class MovieViewSet(viewsets.ViewSet):
             return Response({'error': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
         ## lets interact with the UserProfile model to get the watchlist
         try:
-            ## pass sql query to get the watchlist
-            watchlist = UserProfile.objects.raw_sql(
-                "SELECT watchlist FROM accounts_userprofile WHERE username = %s", [user]
-            )
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        watchlist_detailed_info = ElasticsearchUtils.get_watchlist(watchlist)
-        return Response({'watchlist': watchlist_detailed_info}, status=status.HTTP_200_OK)
+            watchlist = UserProfile.objects.values_list('watchlist', flat=True).get(user=user)
+        except UserProfile.DoesNotExist:
+            return Response({"error": "UserProfile not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    
+        # page through long watchlists, each page is hydrated with one bulk request
+        try:
+            page, page_size = watchlist_page_params(request.GET)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        start_index = (page - 1) * page_size
+        watchlist_detailed_info = ElasticsearchUtils.get_watchlist(watchlist[start_index:start_index + page_size])
+        if isinstance(watchlist_detailed_info, dict):
+            # api_error_handler turned an error into a payload
+            return Response(watchlist_detailed_info, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({
+            'watchlist': watchlist_detailed_info,
+            'total_movies': len(watchlist),
+            'total_pages': GeneralUtils.calculate_total_pages(len(watchlist), page_size),
+            'current_page': page
+        }, status=status.HTTP_200_OK)
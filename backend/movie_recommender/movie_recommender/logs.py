@@ -0,0 +1,153 @@
+import copy
+import logging
+import os
+import random
+import sys
+import threading
+import traceback
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+
+try:
+    import orjson
+except ImportError:  # falls back to the json module
+    orjson = None
+    import json
+
+# Logging of the application (see LOGGING in settings.py). Records are written
+# as one JSON object per line for the log pipeline. The request threads only
+# put them on a bounded queue: a listener thread formats and writes them, and
+# when the queue is full the records are dropped instead of blocking requests.
+# The per-request records of the hot paths are sampled (SamplingFilter).
+
+# attributes of every LogRecord, the others are the ``extra`` fields of the call
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def _dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class JSONFormatter(logging.Formatter):
+    """Format a record as a JSON object: time, level, logger, message, the ``extra`` fields and the exception."""
+    def format(self, record):
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                payload[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exception"] = record.exc_text
+        return _dumps(payload)
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    Write records to ``stream`` from a listener thread. The calling thread only
+    filters the record and puts it on a queue of ``queue_size`` records; the
+    records logged while the queue is full are dropped and counted in the
+    ``dropped_records`` field of the next record written.
+    Args:
+        stream: The stream to write to, sys.stdout by default.
+    """
+    def __init__(self, stream=None, queue_size=10000):
+        super().__init__(Queue(queue_size))
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        # the listener thread does not survive a fork (gunicorn preload_app)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._restart)
+
+    def _restart(self):
+        self.queue = Queue(self.queue.maxsize)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        # records are formatted by the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # no formatting here: only resolve what may change or not outlive the call
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info)).rstrip("\n")
+            record.exc_info = None
+        if self.dropped:
+            record.dropped_records, self.dropped = self.dropped, 0
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            # with the drops this record was carrying
+            self.dropped += 1 + getattr(record, "dropped_records", 0)
+
+    def close(self):
+        # write the queued records before exiting
+        if self.listener._thread is not None:
+            self.queue.put(self.listener._sentinel)
+            self.listener._thread.join()
+            self.listener._thread = None
+        self.target.close()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Sample the DEBUG and INFO records of the hot path loggers; warnings and
+    errors always pass.
+    Args:
+        loggers (dict): {logger name: {"rate": fraction of the records kept,
+            "per_second": at most this many records per second (None: no limit)}}.
+            A logger is sampled with the settings of its closest configured ancestor.
+    """
+    def __init__(self, loggers=None, name=""):
+        super().__init__(name)
+        self.loggers = dict(loggers or {})
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _config(self, name):
+        while name:
+            if name in self.loggers:
+                return name, self.loggers[name]
+            name = name.rpartition(".")[0]
+        return None, None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        name, config = self._config(record.name)
+        if config is None:
+            return True
+        if random.random() >= config.get("rate", 1.0):
+            return False
+        per_second = config.get("per_second")
+        if not per_second:
+            return True
+        # token bucket of the logger, holding at most one second of records
+        with self.lock:
+            tokens, updated = self.buckets.get(name, (per_second, record.created))
+            tokens = min(per_second, tokens + (record.created - updated) * per_second)
+            if tokens < 1:
+                self.buckets[name] = (tokens, record.created)
+                return False
+            self.buckets[name] = (tokens - 1, record.created)
+        return True
+
@@ -65,6 +65,13 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # orjson JSON by default, MessagePack with "Accept: application/msgpack" (imdb_picker/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'imdb_picker.renderers.ORJSONRenderer',
+        'imdb_picker.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'imdb_picker.renderers.AvailableRenderersNegotiation',
 }
 
 SIMPLE_JWT = {
@@ -89,6 +96,8 @@ MIDDLEWARE = [
     'django_prometheus.middleware.PrometheusBeforeMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
+    # compresses the responses of the middleware below and of the views, see RESPONSE_COMPRESSION
+    'imdb_picker.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -190,3 +199,258 @@ CSRF_TRUSTED_ORIGINS = [
     "http://postgreaccount:5432",
     "http://elasticsearch:9200",
 ]
+
+
+# Embedding models
+# Every model is loaded once per process by imdb_picker.embeddings.EmbeddingModelRegistry.
+# "revision" pins a Hugging Face revision (branch, tag or commit hash), None means "main".
+# "backend" is "torch" (sentence-transformers) or "onnx" (ONNX Runtime, reading the export written
+# by `manage.py export_onnx_model` from "onnx_path", int8 quantized when "quantized" is set, which
+# needs the model written by `export_onnx_model --quantize`).
+EMBEDDING_MODELS = {
+    'default': {
+        'name': os.environ.get('EMBEDDING_MODEL_NAME', 'all-MiniLM-L6-v2'),
+        'revision': os.environ.get('EMBEDDING_MODEL_REVISION') or None,
+        'backend': os.environ.get('EMBEDDING_BACKEND', 'torch'),
+        'onnx_path': os.environ.get('EMBEDDING_ONNX_PATH', os.path.join(BASE_DIR, 'onnx_models', 'all-MiniLM-L6-v2')),
+        'quantized': os.environ.get('EMBEDDING_ONNX_QUANTIZED', 'false').lower() == 'true',
+        'intra_op_threads': int(os.environ.get('EMBEDDING_ONNX_THREADS', 1)),
+    },
+}
+
+# Elasticsearch index name -> key in EMBEDDING_MODELS, for indices built with another model
+EMBEDDING_INDEX_MODELS = {}
+
+# Load the embedding models when Django starts (set by gunicorn.conf.py for the web server,
+# so that management commands such as migrate do not pay for it)
+EMBEDDING_WARMUP_ON_STARTUP = os.environ.get('EMBEDDING_WARMUP_ON_STARTUP', 'false').lower() == 'true'
+
+# Query embedding cache: an in-process LRU/TTL tier per worker, plus an optional shared
+# tier so that all gunicorn workers reuse each other's embeddings.
+# SHARED_URL is a redis:// URL, "local://" for the in-memory fake, or empty to disable it.
+QUERY_EMBEDDING_CACHE = {
+    'MAX_ENTRIES': int(os.environ.get('QUERY_EMBEDDING_CACHE_MAX_ENTRIES', 10000)),
+    'TTL': int(os.environ.get('QUERY_EMBEDDING_CACHE_TTL', 3600)),
+    'SHARED_URL': os.environ.get('QUERY_EMBEDDING_CACHE_URL', ''),
+    'SHARED_TTL': int(os.environ.get('QUERY_EMBEDDING_CACHE_SHARED_TTL', 86400)),
+}
+
+# Micro-batching of query embeddings: texts from concurrent requests are collected for up to
+# MAX_WAIT_MS (or until MAX_BATCH_SIZE) and encoded in one forward pass. Requests are rejected
+# once MAX_QUEUE_SIZE texts are waiting, and give up after TIMEOUT_MS.
+# Only useful when a worker serves several requests at once (GUNICORN_THREADS > 1 or ASGI).
+EMBEDDING_BATCHING = {
+    'ENABLED': os.environ.get('EMBEDDING_BATCHING_ENABLED', 'false').lower() == 'true',
+    'MAX_BATCH_SIZE': int(os.environ.get('EMBEDDING_BATCHING_MAX_BATCH_SIZE', 32)),
+    'MAX_WAIT_MS': float(os.environ.get('EMBEDDING_BATCHING_MAX_WAIT_MS', 5)),
+    'MAX_QUEUE_SIZE': int(os.environ.get('EMBEDDING_BATCHING_MAX_QUEUE_SIZE', 256)),
+    'TIMEOUT_MS': float(os.environ.get('EMBEDDING_BATCHING_TIMEOUT_MS', 2000)),
+}
+
+# Elasticsearch clusters, see imdb_picker.es_client. Each gunicorn worker builds its own
+# connection pool lazily after the fork. CONNECTIONS_PER_NODE is per worker, retries wait
+# RETRY_BACKOFF * 2**attempt seconds (capped at RETRY_BACKOFF_MAX) with full jitter.
+ELASTICSEARCH = {
+    'default': {
+        'HOSTS': os.environ.get('ELASTICSEARCH_HOSTS', 'http://elasticsearch:9200').split(','),
+        'CONNECTIONS_PER_NODE': int(os.environ.get('ELASTICSEARCH_CONNECTIONS_PER_NODE', 10)),
+        'HTTP_COMPRESS': os.environ.get('ELASTICSEARCH_HTTP_COMPRESS', 'true').lower() == 'true',
+        'REQUEST_TIMEOUT': float(os.environ.get('ELASTICSEARCH_REQUEST_TIMEOUT', 10)),
+        'MAX_RETRIES': int(os.environ.get('ELASTICSEARCH_MAX_RETRIES', 2)),
+        'RETRY_ON_TIMEOUT': os.environ.get('ELASTICSEARCH_RETRY_ON_TIMEOUT', 'true').lower() == 'true',
+        'RETRY_BACKOFF': float(os.environ.get('ELASTICSEARCH_RETRY_BACKOFF', 0.05)),
+        'RETRY_BACKOFF_MAX': float(os.environ.get('ELASTICSEARCH_RETRY_BACKOFF_MAX', 1.0)),
+        'SNIFF_ON_START': os.environ.get('ELASTICSEARCH_SNIFF_ON_START', 'false').lower() == 'true',
+        'SNIFF_ON_NODE_FAILURE': os.environ.get('ELASTICSEARCH_SNIFF_ON_NODE_FAILURE', 'false').lower() == 'true',
+    },
+}
+
+# poster_path -> Elasticsearch document id cache used for exact movie lookups
+POSTER_PATH_ID_CACHE = {
+    'MAX_ENTRIES': int(os.environ.get('POSTER_PATH_ID_CACHE_MAX_ENTRIES', 100000)),
+    'TTL': int(os.environ.get('POSTER_PATH_ID_CACHE_TTL', 86400)),
+}
+
+# Response cache of the movie info and similar movies payloads (per worker).
+# Entries are fresh for TTL seconds, then served stale for STALE_TTL more seconds while they
+# are refreshed in the background. Keys include the index generation (name and uuid of the
+# physical index behind the alias), looked up at most every GENERATION_TTL seconds.
+RESPONSE_CACHE = {
+    'MAX_BYTES': int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    'TTL': int(os.environ.get('RESPONSE_CACHE_TTL', 300)),
+    'STALE_TTL': int(os.environ.get('RESPONSE_CACHE_STALE_TTL', 3600)),
+    'GENERATION_TTL': int(os.environ.get('RESPONSE_CACHE_GENERATION_TTL', 30)),
+}
+
+# Alphabetical catalog: point in time keep alive between two cursor pages, and how long the
+# per letter movie counts are cached (they are also invalidated by a new index generation).
+# TITLE_INITIAL browses with the precomputed title_initial field instead of a prefix query on the
+# titles: only enable it once every document has the field (indices built by ingest_movies or
+# reindex_movies, or after backfill_title_initial), an index without it returns an empty catalog.
+# CACHED_PAGES first pages of every letter are response cached.
+CATALOG_PAGINATION = {
+    'PIT_KEEP_ALIVE': os.environ.get('CATALOG_PIT_KEEP_ALIVE', '2m'),
+    'COUNT_TTL': int(os.environ.get('CATALOG_COUNT_TTL', 3600)),
+    'TITLE_INITIAL': os.environ.get('CATALOG_TITLE_INITIAL', 'false').lower() == 'true',
+    'CACHED_PAGES': int(os.environ.get('CATALOG_CACHED_PAGES', 5)),
+}
+
+# Movies index lifecycle: the app reads through ALIAS, reindex_movies builds <PREFIX><N>
+# generations, switches the alias to the new one and keeps KEEP_GENERATIONS of them.
+# ADOPT_INDEX is the index deployments served before the alias: while the alias does not
+# exist, `manage.py adopt_movies_index` (run at container start) points the alias at it.
+# VECTOR configures the embedding field of new generations (see imdb_picker/index_template.py);
+# excluding the embedding from _source breaks similar movies by example and the reindex API.
+MOVIES_INDEX = {
+    'ALIAS': os.environ.get('MOVIES_INDEX_ALIAS', 'movies'),
+    'ADOPT_INDEX': os.environ.get('MOVIES_INDEX_ADOPT', 'movie_data_9'),
+    'PREFIX': os.environ.get('MOVIES_INDEX_PREFIX', 'movies_v'),
+    'REPLICAS': int(os.environ.get('MOVIES_INDEX_REPLICAS', 1)),
+    'KEEP_GENERATIONS': int(os.environ.get('MOVIES_INDEX_KEEP_GENERATIONS', 2)),
+    'VECTOR': {
+        'SIMILARITY': os.environ.get('MOVIES_VECTOR_SIMILARITY', 'dot_product'),
+        'INDEX_TYPE': os.environ.get('MOVIES_VECTOR_INDEX_TYPE', 'int8_hnsw'),
+        'M': int(os.environ.get('MOVIES_VECTOR_M', 16)),
+        'EF_CONSTRUCTION': int(os.environ.get('MOVIES_VECTOR_EF_CONSTRUCTION', 100)),
+    },
+    'EXCLUDE_EMBEDDING_FROM_SOURCE': os.environ.get('MOVIES_EXCLUDE_EMBEDDING_FROM_SOURCE', 'false').lower() == 'true',
+}
+
+# In-process vector index for similar movies (imdb_picker/ann.py): workers memory-map the snapshot
+# written by `manage.py build_vector_snapshot` for the current index generation and rank the
+# nearest movies locally; without a snapshot the Elasticsearch kNN query is used
+VECTOR_SNAPSHOT = {
+    'ENABLED': os.environ.get('VECTOR_SNAPSHOT_ENABLED', 'false').lower() == 'true',
+    'PATH': os.environ.get('VECTOR_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'vector_snapshots')),
+    'DTYPE': os.environ.get('VECTOR_SNAPSHOT_DTYPE', 'float16'),
+}
+
+# Ranking of similar movies (imdb_picker/ranking.py): the CANDIDATES nearest movies (kNN with
+# NUM_CANDIDATES) are scored by similarity x the factor of every feature, then the SIZE best are
+# returned, picked with MMR when DIVERSITY_LAMBDA < 1 (1 = relevance only, lower = more diverse).
+# The "random" feature is seeded by the movie, so the order is the same in every worker; "recency"
+# measures ages at REFERENCE_YEAR (the current year when the worker starts if unset), pin it so
+# that every worker and the precomputed neighbours (compute_neighbours) agree across a new year.
+SIMILAR_MOVIES_RANKING = {
+    'SIZE': 10,
+    'CANDIDATES': int(os.environ.get('SIMILAR_MOVIES_CANDIDATES', 100)),
+    'NUM_CANDIDATES': int(os.environ.get('SIMILAR_MOVIES_NUM_CANDIDATES', 1000)),
+    'FEATURES': [
+        {'name': 'rating', 'threshold': 7.0, 'boost': 1.5},
+        {'name': 'popularity', 'factor': 0.3},
+        {'name': 'recency', 'weight': float(os.environ.get('SIMILAR_MOVIES_RECENCY_WEIGHT', 0.0)), 'half_life_years': 10.0},
+        {'name': 'random', 'weight': float(os.environ.get('SIMILAR_MOVIES_RANDOM_WEIGHT', 0.0))},
+    ],
+    'DIVERSITY_LAMBDA': float(os.environ.get('SIMILAR_MOVIES_DIVERSITY_LAMBDA', 1.0)),
+    'REFERENCE_YEAR': int(os.environ.get('SIMILAR_MOVIES_REFERENCE_YEAR', 0)) or None,
+}
+
+# Hybrid search (/imdb/movies/hybrid_search/): the lexical and the kNN searches run in one
+# msearch and their top WINDOW hits are fused, by reciprocal rank fusion ("rrf", sum of
+# weight / (RANK_CONSTANT + rank)) or by min-max normalized "weighted" scores. When the query
+# embedding is not cached and takes more than EMBEDDING_BUDGET_MS, the search is lexical only.
+# The embeddings run on EMBEDDING_THREADS threads; identical queries in flight share one, and
+# beyond MAX_PENDING_EMBEDDINGS queued or running the new queries are served lexical only at once.
+# Every value except NUM_CANDIDATES and the MAX_ bounds can be overridden per request.
+HYBRID_SEARCH = {
+    'FUSION': os.environ.get('HYBRID_SEARCH_FUSION', 'rrf'),
+    'RANK_CONSTANT': int(os.environ.get('HYBRID_SEARCH_RANK_CONSTANT', 60)),
+    'LEXICAL_WEIGHT': float(os.environ.get('HYBRID_SEARCH_LEXICAL_WEIGHT', 1.0)),
+    'SEMANTIC_WEIGHT': float(os.environ.get('HYBRID_SEARCH_SEMANTIC_WEIGHT', 1.0)),
+    'SIZE': 10,
+    'WINDOW': int(os.environ.get('HYBRID_SEARCH_WINDOW', 50)),
+    'MAX_WINDOW': 200,
+    'NUM_CANDIDATES': int(os.environ.get('HYBRID_SEARCH_NUM_CANDIDATES', 200)),
+    'EMBEDDING_BUDGET_MS': float(os.environ.get('HYBRID_SEARCH_EMBEDDING_BUDGET_MS', 150)),
+    'MAX_EMBEDDING_BUDGET_MS': 2000,
+    'EMBEDDING_THREADS': int(os.environ.get('HYBRID_SEARCH_EMBEDDING_THREADS', 4)),
+    'MAX_PENDING_EMBEDDINGS': int(os.environ.get('HYBRID_SEARCH_MAX_PENDING_EMBEDDINGS', 32)),
+}
+
+# Autocomplete (/imdb/movies/suggest/): an in-process prefix index of the titles, actors and
+# directors (the first MAX_NAMES_PER_MOVIE of every movie), built by each worker from a scan of
+# the current generation. gunicorn workers build it at boot when WARMUP_ON_STARTUP is set.
+# The top MAX_SIZE suggestions of the last CACHE_ENTRIES prefixes are cached.
+SUGGEST = {
+    'SIZE': 8,
+    'MAX_SIZE': 20,
+    'MAX_NAMES_PER_MOVIE': int(os.environ.get('SUGGEST_MAX_NAMES_PER_MOVIE', 5)),
+    'CACHE_ENTRIES': int(os.environ.get('SUGGEST_CACHE_ENTRIES', 4096)),
+    'BROWSER_MAX_AGE': int(os.environ.get('SUGGEST_BROWSER_MAX_AGE', 300)),
+    'WARMUP_ON_STARTUP': os.environ.get('SUGGEST_WARMUP_ON_STARTUP', 'false').lower() == 'true',
+}
+
+# Filtered and faceted search (/imdb/movies/search/). The facet counts of searches without a
+# text query depend only on the filters: they are cached per index generation for FACET_TTL.
+# Genres are filtered on the genre_tags field (run backfill_genre_tags on indices created before it).
+FACETED_SEARCH = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,
+    'MAX_GENRES': 5,
+    'GENRE_FACET_SIZE': 30,
+    'FACET_CACHE_ENTRIES': int(os.environ.get('FACET_CACHE_ENTRIES', 2048)),
+    'FACET_TTL': int(os.environ.get('FACET_CACHE_TTL', 3600)),
+}
+
+# Filtered kNN (semantic_search and similar movies with the filters of the faceted search): the
+# filters are the kNN pre-filter, and num_candidates grows as they get more selective (see
+# facets.knn_limits), using the number of matching movies cached for COUNT_TTL seconds.
+FILTERED_KNN = {
+    'MAX_K': 100,
+    'MAX_NUM_CANDIDATES': int(os.environ.get('FILTERED_KNN_MAX_NUM_CANDIDATES', 2000)),
+    'COUNT_TTL': int(os.environ.get('FILTERED_KNN_COUNT_TTL', 3600)),
+}
+
+# Compression of API responses (imdb_picker/middleware.py): brotli when the client accepts it and
+# the package is installed, gzip otherwise, for responses of at least MIN_SIZE bytes. The levels
+# favour speed: most of the gain on JSON arrays comes at the lowest levels.
+RESPONSE_COMPRESSION = {
+    'ENABLED': os.environ.get('RESPONSE_COMPRESSION_ENABLED', 'true').lower() == 'true',
+    'MIN_SIZE': int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', 1024)),
+    'GZIP_LEVEL': int(os.environ.get('RESPONSE_COMPRESSION_GZIP_LEVEL', 5)),
+    'BROTLI_QUALITY': int(os.environ.get('RESPONSE_COMPRESSION_BROTLI_QUALITY', 4)),
+    'PATH_PREFIXES': ['/imdb/', '/api/'],
+    'CONTENT_TYPES': ['application/json', 'application/msgpack'],
+}
+
+# Logging (movie_recommender/logs.py): JSON lines on stdout, written by a listener thread from a
+# queue of LOG_QUEUE_SIZE records, so that requests never wait on log I/O (records are dropped
+# when it is full). Levels are set per logger. The per-request records of the search endpoints
+# ("imdb_picker.requests") are sampled: a fraction RATE of them is kept, at most PER_SECOND per
+# second and per worker. Warnings and errors are never sampled.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_SAMPLING = {
+    'imdb_picker.requests': {
+        'rate': float(os.environ.get('LOG_REQUESTS_SAMPLE_RATE', 0.01)),
+        'per_second': int(os.environ.get('LOG_REQUESTS_PER_SECOND', 10)),
+    },
+}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'movie_recommender.logs.JSONFormatter'},
+    },
+    'filters': {
+        'sampling': {'()': 'movie_recommender.logs.SamplingFilter', 'loggers': LOG_SAMPLING},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'movie_recommender.logs.QueueStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'queue_size': int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
+            'formatter': 'json',
+            'filters': ['sampling'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': os.environ.get('DJANGO_LOG_LEVEL', LOG_LEVEL), 'propagate': False},
+        # runserver access log
+        'django.server': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False},
+        'imdb_picker': {'handlers': ['queue'], 'level': os.environ.get('IMDB_PICKER_LOG_LEVEL', LOG_LEVEL), 'propagate': False},
+        'accounts': {'handlers': ['queue'], 'level': os.environ.get('ACCOUNTS_LOG_LEVEL', LOG_LEVEL), 'propagate': False},
+        # one INFO record per Elasticsearch request otherwise
+        'elastic_transport': {'level': os.environ.get('ELASTICSEARCH_LOG_LEVEL', 'WARNING')},
+    },
+}